@@ -1,27 +1,33 @@
-from fastapi import APIRouter, HTTPException
-from typing import Optional
+import json
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, Optional
 from models import ChatMessage, ChatResponse
 from processing.exceptions import ProcessingError
 from dependencies import completion_handler
+from api.disconnect import cancel_on_disconnect
 
 router = APIRouter()
 
 @router.post("/chat", response_model=ChatResponse)
 async def chat(
     message: ChatMessage,
+    request: Request,
     conversation_id: Optional[str] = None
 ):
     try:
-        response = await completion_handler.get_response(
+        response = await cancel_on_disconnect(request, completion_handler.get_response(
             question=message.content,
             conversation_id=conversation_id
-        )
+        ))
         
         return ChatResponse(
             response=response["answer"],
-            sources=[chunk.document_id for chunk in response["chunks"]]
+            sources=completion_handler.sources(response["chunks"])
         )
             
+    except HTTPException:
+        raise
     except ProcessingError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -29,3 +35,31 @@ async def chat(
             status_code=500,
             detail=f"Unexpected error during chat processing: {str(e)}"
         )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream(
+    message: ChatMessage,
+    conversation_id: Optional[str] = None
+):
+    """Stream the answer as server-sent events: sources, token..., done.
+    Failures after the stream started are reported as an error event."""
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in completion_handler.stream_response(
+                question=message.content,
+                conversation_id=conversation_id
+            ):
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,24 @@
+import asyncio
+from typing import Awaitable, TypeVar
+from fastapi import HTTPException, Request
+
+T = TypeVar("T")
+
+# nginx's status for a request the client abandoned
+CLIENT_CLOSED_REQUEST = 499
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T], poll_interval: float = 0.1) -> T:
+    """Await the handler's work, cancelling it once the client disconnects so
+    queued vector searches and completions are dropped instead of run for nobody"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                raise HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
@@ -1,27 +1,99 @@
-from fastapi import APIRouter, UploadFile, HTTPException
-from models import ProcessingStatus
+import base64
+import json
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+from uuid import UUID
+from fastapi import APIRouter, UploadFile, HTTPException, Query
+from models import BatchUploadResponse, Document, DocumentPage, FileUploadStatus, ProcessingStatus
+from processing.doc_status import DocumentStatus
 from processing.exceptions import ProcessingError
-from dependencies import storage_manager, document_processor
+from storage.archives import ArchiveLimits, archive_entries, is_archive
+from storage.file_system_storage import UploadTooLargeError
+from dependencies import storage_manager, ingestion_queue, settings
 
 router = APIRouter()
 
-@router.post("/upload", response_model=ProcessingStatus)
-async def upload_document(file: UploadFile):
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(created_at: datetime, doc_id: UUID) -> str:
+    """Opaque cursor holding the keyset position of a page's last document"""
+    return base64.urlsafe_b64encode(json.dumps([created_at.isoformat(), str(doc_id)]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple[datetime, UUID]:
     try:
-        content = await file.read()  # Get file content as bytes
-        
-        # Process the document
-        doc_id = await document_processor.process_document(
-            content=content,
-            filename=file.filename
-        )
-        
-        # Update status 
+        created_at, doc_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), UUID(doc_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+@router.get("", response_model=DocumentPage)
+async def list_documents(
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status: Optional[DocumentStatus] = None,
+    mime_type: Optional[str] = None,
+    include_chunk_counts: bool = False
+):
+    """Documents newest first. Pages are cursor based, so each costs the same however
+    deep it is, and chunk counts for a page come from one grouped query."""
+    after = decode_cursor(cursor) if cursor else None
+    # One extra row tells whether there is a next page
+    docs = await storage_manager.list_documents(
+        limit + 1,
+        after=after,
+        status=status.value if status else None,
+        mime_type=mime_type
+    )
+    page = docs[:limit]
+    counts = await storage_manager.count_chunks([doc.id for doc in page]) if include_chunk_counts else {}
+    return DocumentPage(
+        documents=[
+            Document(
+                id=doc.id,
+                filename=doc.filename,
+                mime_type=doc.mime_type,
+                size_bytes=doc.size_bytes,
+                upload_date=doc.created_at,
+                status=doc.status,
+                chunk_count=counts.get(doc.id, 0) if include_chunk_counts else None
+            )
+            for doc in page
+        ],
+        next_cursor=encode_cursor(page[-1].created_at, page[-1].id) if len(docs) > limit else None
+    )
+
+async def queue_upload(read: Callable[[int], Awaitable[bytes]], filename: str) -> ProcessingStatus:
+    """Spool one file, save it and hand it to the background workers"""
+    # Stream to disk so memory use is bounded by the buffer, not the file size
+    spooled = await storage_manager.spool_upload(read, settings.upload_buffer_size, settings.upload_max_bytes)
+    doc_id, queued = await ingestion_queue.submit(spooled=spooled, filename=filename)
+    if not queued:
+        doc = await storage_manager.get_document_metadata(doc_id)
         return ProcessingStatus(
-            status="completed",
-            message=f"Document {doc_id} processed successfully"
+            status=doc.status if doc else DocumentStatus.COMPLETED.value,
+            message=f"Document {doc_id} was already uploaded",
+            doc_id=str(doc_id)
         )
-        
+    return ProcessingStatus(
+        status=DocumentStatus.PENDING.value,
+        message=f"Document {doc_id} queued for processing",
+        doc_id=str(doc_id)
+    )
+
+async def queue_batch_file(read: Callable[[int], Awaitable[bytes]], filename: str) -> FileUploadStatus:
+    """queue_upload for one file of a batch, a failure is reported for that file only"""
+    try:
+        status = await queue_upload(read, filename)
+    except Exception as e:
+        return FileUploadStatus(filename=filename, status=DocumentStatus.FAILED.value, message=str(e))
+    return FileUploadStatus(filename=filename, **status.model_dump())
+
+@router.post("/upload", response_model=ProcessingStatus)
+async def upload_document(file: UploadFile):
+    try:
+        return await queue_upload(file.read, file.filename)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except ProcessingError as e:
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
@@ -30,13 +102,61 @@ async def upload_document(file: UploadFile):
             detail=f"Unexpected error during processing: {str(e)}"
         )
 
+@router.post("/upload/batch", response_model=BatchUploadResponse)
+async def upload_documents(files: list[UploadFile]):
+    """Upload many documents in one request: plain files, and zip or tar archives whose
+    entries are stored as separate documents. Archives are read entry by entry, never
+    whole. Every document is queued like a single upload, so the batch shares the ingestion
+    workers and their embedding batches. Returns once all files are queued, which waits for
+    the workers when more than INGEST_MAX_PENDING documents are outstanding."""
+    results: list[FileUploadStatus] = []
+    truncated = False
+    limits = ArchiveLimits(
+        max_entry_bytes=settings.upload_max_bytes,
+        max_total_bytes=settings.upload_archive_max_bytes,
+        max_entries=settings.upload_archive_max_entries
+    )
+    for file in files:
+        if not is_archive(file.filename):
+            if len(results) >= settings.upload_batch_max_files:
+                truncated = True
+                break
+            results.append(await queue_batch_file(file.read, file.filename))
+            continue
+        try:
+            async with archive_entries(file.file, file.filename, limits) as entries:
+                async for filename, read in entries:
+                    if len(results) >= settings.upload_batch_max_files:
+                        truncated = True
+                        break
+                    results.append(await queue_batch_file(read, filename))
+        except Exception as e:
+            # Entries before the damaged part were queued and are reported above
+            results.append(FileUploadStatus(
+                filename=file.filename,
+                status=DocumentStatus.FAILED.value,
+                message=f"Could not read archive: {str(e)}"
+            ))
+        if truncated:
+            break
+    return BatchUploadResponse(files=results, truncated=truncated)
+
 @router.get("/{doc_id}/status", response_model=ProcessingStatus)
 async def get_document_status(doc_id: str):
+    # Live progress is only known to the worker that ran the job
+    progress = ingestion_queue.get_progress(doc_id)
+    if progress:
+        return ProcessingStatus(
+            status=progress.current_stage,
+            message=progress.error,
+            doc_id=doc_id,
+            progress=progress.to_dict()
+        )
+
     try:
-        # Get document status from storage manager
-        doc = await storage_manager.get_document_metadata(doc_id)
-        status = "ready" if doc else "not_found"
-        return ProcessingStatus(status=status)
-    except Exception as e:
+        doc = await storage_manager.get_document_metadata(UUID(doc_id))
+    except ValueError:
         raise HTTPException(status_code=404, detail="Document not found")
-
+    if not doc:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return ProcessingStatus(status=doc.status, doc_id=doc_id)
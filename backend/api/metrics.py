@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from dependencies import completion_handler, embedding_cache, metadata_storage, query_processor, reranker, semantic_cache, vector_storage
+
+router = APIRouter()
+
+@router.get("/metrics")
+async def get_metrics():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "retrieval": query_processor.latency.stats(),
+        "query_embeddings": query_processor.embedding_stats(),
+        "rerank": reranker.stats() if reranker else None,
+        "vector_storage": vector_storage.stats(),
+        "database": metadata_storage.pool_stats(),
+        "semantic_cache": semantic_cache.stats() if semantic_cache else None,
+        "responses": completion_handler.stats()
+    }
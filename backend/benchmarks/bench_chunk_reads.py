@@ -0,0 +1,103 @@
+"""Chunk read costs with and without their content.
+
+Vector search: fetching the hybrid candidate list with documents, as every
+query used to, against ids and distances only, the text of the fused top-k then
+coming from the lexical index's copy (or, when missing there, from Chroma).
+Metadata: ORM instances for a document's chunks against an id-only select.
+
+    python -m benchmarks.bench_chunk_reads --chunks 20000 --candidates 20 --top-k 5
+"""
+import argparse
+import asyncio
+import random
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from sqlalchemy import select
+from sqlalchemy.orm import undefer
+
+from storage.metadata_store import MetadataStore
+from storage.storage_interface import ChunkMetadata
+from storage.vector_storage import VectorStorage
+
+def make_chunks(count: int, chunk_chars: int, documents: int) -> list[ChunkMetadata]:
+    doc_ids = [uuid4() for _ in range(documents)]
+    return [
+        ChunkMetadata(
+            id=uuid4(), document_id=doc_ids[i % documents], sequence=i,
+            content=f"{i} " + "x" * chunk_chars, embedding_id=None
+        )
+        for i in range(count)
+    ]
+
+def random_vectors(count: int, dimensions: int) -> list[list[float]]:
+    return [[random.random() for _ in range(dimensions)] for _ in range(count)]
+
+async def time_queries(label: str, queries: int, run):
+    start = time.perf_counter()
+    for _ in range(queries):
+        await run()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / queries * 1000:8.3f} ms/query")
+
+async def bench_vectors(vectors: VectorStorage, args):
+    queries = random_vectors(args.queries, args.dimensions)
+    query_iter = iter(queries * 3)
+
+    async def with_documents():
+        await vectors.search(next(query_iter), limit=args.candidates)
+
+    async def ids_only():
+        await vectors.search(next(query_iter), limit=args.candidates, include_documents=False)
+
+    async def ids_then_top_k():
+        results = await vectors.search(next(query_iter), limit=args.candidates, include_documents=False)
+        await vectors.get_contents(results["ids"][0][:args.top_k])
+
+    await time_queries("search with documents", args.queries, with_documents)
+    await time_queries("search ids only", args.queries, ids_only)
+    await time_queries("search ids + Chroma top-k", args.queries, ids_then_top_k)
+
+async def bench_metadata(store: MetadataStore, doc_id, args):
+    async def orm_chunks():
+        async with store.session_local() as session:
+            result = await session.scalars(
+                select(ChunkMetadata).where(ChunkMetadata.document_id == doc_id).options(undefer(ChunkMetadata.content))
+            )
+            return [chunk.id for chunk in result]
+
+    async def chunk_ids():
+        return await store.get_chunk_ids(doc_id)
+
+    await time_queries("document chunks as ORM", args.queries, orm_chunks)
+    await time_queries("document chunk ids", args.queries, chunk_ids)
+
+async def main(args):
+    random.seed(0)
+    chunks = make_chunks(args.chunks, args.chunk_chars, args.documents)
+    with tempfile.TemporaryDirectory() as directory:
+        vectors = VectorStorage(str(Path(directory) / "chroma"))
+        await vectors.add_chunks(chunks, random_vectors(len(chunks), args.dimensions))
+        store = MetadataStore(f"sqlite+aiosqlite:///{Path(directory) / 'bench.db'}")
+        await store.initialize()
+        await store.save_chunks(chunks)
+
+        print(f"{args.chunks} chunks of {args.chunk_chars} characters, {args.documents} documents")
+        await bench_vectors(vectors, args)
+        await bench_metadata(store, chunks[0].document_id, args)
+
+        await store.engine.dispose()
+        vectors.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--candidates", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,75 @@
+"""Cost of conversation expiry with a large number of live conversations.
+
+Fills ConversationManager with --conversations entries, --expired-pct of which
+are past their deadline, then times one cleanup pass: the full scan over
+last_accessed the manager used to run every interval, and the heap-based
+_cleanup_expired. Also reports get_history latency at that size.
+
+    python -m benchmarks.bench_conversation_expiry --conversations 1000000
+"""
+import argparse
+import statistics
+import time
+
+from processing.conversation import ConversationManager
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def fill(conversations: int, expired_pct: float) -> tuple[ConversationManager, Clock]:
+    clock = Clock()
+    manager = ConversationManager(expiry_minutes=60, max_bytes=1 << 40, clock=clock)
+    message = [{"role": "user", "content": "hello"}]
+    expired = int(conversations * expired_pct / 100)
+    for i in range(conversations):
+        # The first `expired` conversations are created an hour before the rest
+        clock.now = 0.0 if i < expired else 3600.0
+        manager.update_history(f"conversation-{i}", message)
+    clock.now = 3601.0
+    return manager, clock
+
+def full_scan(manager: ConversationManager, now: float) -> list[str]:
+    return [
+        conversation_id for conversation_id, last_accessed in manager.last_accessed.items()
+        if now - last_accessed > manager.expiry_seconds
+    ]
+
+def main(args):
+    start = time.perf_counter()
+    manager, clock = fill(args.conversations, args.expired_pct)
+    print(f"fill      {args.conversations} conversations in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    expired = full_scan(manager, clock.now)
+    print(f"full scan found {len(expired):>7} expired in {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+    start = time.perf_counter()
+    removed = manager._cleanup_expired()
+    print(f"heap      removed {removed:>7} expired in {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+    start = time.perf_counter()
+    removed = manager._cleanup_expired()
+    print(f"heap      idle pass removed {removed} in {(time.perf_counter() - start) * 1000:8.3f}ms")
+
+    start = time.perf_counter()
+    expired = full_scan(manager, clock.now)
+    print(f"full scan idle pass found {len(expired)} in {(time.perf_counter() - start) * 1000:8.1f}ms")
+
+    latencies = []
+    for i in range(args.lookups):
+        conversation_id = f"conversation-{args.conversations - 1 - i}"
+        start = time.perf_counter()
+        manager.get_history(conversation_id)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    print(f"get_history p50={statistics.median(latencies):.2f}us max={max(latencies):.2f}us")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--conversations", type=int, default=1_000_000)
+    parser.add_argument("--expired-pct", type=float, default=1.0)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""Event loop latency seen by /chat while documents are being extracted.
+
+Simulated chat requests (an awaited upstream call of --chat-ms) arrive every
+--interval-ms while --docs documents are extracted, first inline on the event
+loop as the processor used to, then through ExtractionPool.
+
+    python -m benchmarks.bench_extraction --docs 20
+    python -m benchmarks.bench_extraction --file handbook.pdf
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from functools import partial
+
+from processing.extraction import ExtractionPool, partition_text
+from processing.timing import percentile
+
+def synthetic_extract(contents: bytes, cpu_seconds: float = 0.25) -> str:
+    """CPU-bound stand-in for partition, used when no sample file is given"""
+    deadline = time.perf_counter() + cpu_seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(1000))
+    return contents.decode(errors="ignore")
+
+async def fake_chat(chat_ms: float) -> float:
+    start = time.perf_counter()
+    await asyncio.sleep(chat_ms / 1000)
+    return (time.perf_counter() - start) * 1000
+
+async def run(extract, docs: list[bytes], chat_ms: float, interval_ms: float) -> list[float]:
+    latencies = []
+    done = asyncio.Event()
+
+    async def chat_load():
+        pending = []
+        while not done.is_set():
+            pending.append(asyncio.create_task(fake_chat(chat_ms)))
+            await asyncio.sleep(interval_ms / 1000)
+        latencies.extend(await asyncio.gather(*pending))
+
+    load = asyncio.create_task(chat_load())
+    await asyncio.sleep(0.1)
+    await asyncio.gather(*(extract(doc) for doc in docs))
+    done.set()
+    await load
+    return latencies
+
+def report(name: str, latencies: list[float], elapsed: float):
+    ordered = sorted(latencies)
+    print(
+        f"{name:<8} chats={len(ordered):<5} p50={statistics.median(ordered):8.1f}ms "
+        f"p99={percentile(ordered, 99):8.1f}ms max={ordered[-1]:8.1f}ms ingest={elapsed:6.2f}s"
+    )
+
+async def main(args):
+    if args.file:
+        extract_fn = partition_text
+        sample = open(args.file, "rb").read()
+    else:
+        extract_fn = partial(synthetic_extract, cpu_seconds=args.cpu_seconds)
+        sample = b"synthetic document " * 1000
+    docs = [sample] * args.docs
+
+    async def inline(contents):
+        return extract_fn(contents)
+
+    start = time.perf_counter()
+    before = await run(inline, docs, args.chat_ms, args.interval_ms)
+    report("inline", before, time.perf_counter() - start)
+
+    pool = ExtractionPool(workers=args.workers, timeout=600, extract_fn=extract_fn)
+    await pool.extract(b"warmup")
+    start = time.perf_counter()
+    after = await run(pool.extract, docs, args.chat_ms, args.interval_ms)
+    report("pool", after, time.perf_counter() - start)
+    pool.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--file", help="sample document to run through unstructured")
+    parser.add_argument("--cpu-seconds", type=float, default=0.25)
+    parser.add_argument("--chat-ms", type=float, default=50)
+    parser.add_argument("--interval-ms", type=float, default=20)
+    asyncio.run(main(parser.parse_args()))
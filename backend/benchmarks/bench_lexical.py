@@ -0,0 +1,93 @@
+"""Recall and latency of the BM25 lexical index on identifier lookups.
+
+Builds a LexicalIndex over --chunks synthetic chunks of filler text, each
+mentioning one unique part code and ticket number, then queries for those
+identifiers in a short sentence and reports recall@k, search latency, and how
+long building, saving and loading the index take.
+
+    python -m benchmarks.bench_lexical --chunks 100000
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from uuid import uuid4
+
+from storage.lexical_index import LexicalIndex
+from storage.storage_interface import ChunkMetadata
+
+WORDS = (
+    "printer network outage password reset invoice laptop monitor license vpn server "
+    "backup email calendar access request policy upgrade install error restart billing "
+    "account shipment order refund warranty driver firmware update battery screen"
+).split()
+
+def make_chunks(count: int, words_per_chunk: int, rng: random.Random) -> list[ChunkMetadata]:
+    chunks = []
+    doc_id = uuid4()
+    for i in range(count):
+        words = rng.choices(WORDS, k=words_per_chunk)
+        words.insert(rng.randrange(len(words)), f"PX-{i:06d}")
+        words.insert(rng.randrange(len(words)), f"INC-{i + 100000}")
+        chunks.append(ChunkMetadata(
+            id=uuid4(), document_id=doc_id, sequence=i, content=" ".join(words)
+        ))
+    return chunks
+
+def report(name: str, latencies: list[float]):
+    latencies = sorted(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{name:<10} p50={statistics.median(latencies):7.3f}ms p99={p99:7.3f}ms")
+
+def main(args):
+    rng = random.Random(args.seed)
+    chunks = make_chunks(args.chunks, args.words, rng)
+
+    index = LexicalIndex()
+    start = time.perf_counter()
+    index.add_chunks(chunks)
+    print(f"build     {args.chunks} chunks in {time.perf_counter() - start:.2f}s, {len(index.postings)} terms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        index.path = Path(directory) / "lexical_index.json"
+        start = time.perf_counter()
+        index.save()
+        size = index.path.stat().st_size / 1e6
+        print(f"save      {time.perf_counter() - start:.2f}s, {size:.1f}MB")
+
+        loaded = LexicalIndex(index.path)
+        start = time.perf_counter()
+        loaded.load()
+        print(f"load      {time.perf_counter() - start:.2f}s")
+
+    targets = rng.sample(range(args.chunks), min(args.queries, args.chunks))
+    for name, template in (("part", "where is part PX-{:06d} used"), ("ticket", "status of ticket inc-{}")):
+        hits = 0
+        latencies = []
+        for i in targets:
+            query = template.format(i if name == "part" else i + 100000)
+            start = time.perf_counter()
+            results = index.search(query, limit=args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += any(chunk_id == str(chunks[i].id) for chunk_id, _ in results)
+        print(f"{name:<10} recall@{args.k}={hits / len(targets):.3f}")
+        report(name, latencies)
+
+    latencies = []
+    for _ in range(args.queries):
+        query = " ".join(rng.choices(WORDS, k=6))
+        start = time.perf_counter()
+        index.search(query, limit=args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    report("prose", latencies)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
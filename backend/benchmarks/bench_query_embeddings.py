@@ -0,0 +1,117 @@
+"""Embedding API calls made for chat queries under concurrent load.
+
+Drives --queries query embeddings through QueryProcessor, --concurrency at a
+time, against a local stand-in for the embeddings endpoint that answers after
+--api-ms. Questions are drawn from --distinct questions with a Zipf-like skew,
+the way popular questions repeat. Compares one API call per query with the
+micro-batching embedder and the normalized-query LRU. Identical queries in
+flight at the same time share one call in every run.
+
+    python -m benchmarks.bench_query_embeddings --queries 5000 --concurrency 64
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from unittest.mock import Mock
+
+import httpx
+from openai import AsyncOpenAI
+
+from processing.config import ProcessingConfig
+from processing.embedding_batcher import EmbeddingBatcher
+from processing.query_processor import QueryProcessor
+from processing.response_cache import LRUCache
+from processing.timing import percentile
+
+class FakeEmbeddingsServer:
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.requests = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        self.requests += 1
+        await asyncio.sleep(self.delay)
+        return httpx.Response(200, json={
+            "object": "list",
+            "model": "text-embedding-ada-002",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": [float(len(text))] * 8}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+
+def make_queries(count: int, distinct: int, rng: random.Random) -> list[str]:
+    weights = [1 / (rank + 1) for rank in range(distinct)]
+    return [f"How do I fix problem number {i}?" for i in rng.choices(range(distinct), weights, k=count)]
+
+async def run(name: str, processor: QueryProcessor, server: FakeEmbeddingsServer, queries: list[str], concurrency: int):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(query: str):
+        async with slots:
+            start = time.perf_counter()
+            await processor.embed_query(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(query) for query in queries))
+    elapsed = time.perf_counter() - start
+    ordered = sorted(latencies)
+    print(
+        f"{name:<22} {server.requests:>6} API calls  {len(queries) / elapsed:8.0f} queries/s  "
+        f"p50={statistics.median(ordered):6.1f}ms p99={percentile(ordered, 99):6.1f}ms"
+    )
+
+def make_client(server: FakeEmbeddingsServer) -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-openai/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+    )
+
+async def main(args):
+    queries = make_queries(args.queries, args.distinct, random.Random(args.seed))
+    config = ProcessingConfig()
+
+    server = FakeEmbeddingsServer(args.api_ms / 1000)
+    processor = QueryProcessor(Mock(), make_client(server), config)
+    await run("unbatched", processor, server, queries, args.concurrency)
+
+    server = FakeEmbeddingsServer(args.api_ms / 1000)
+    embedder = EmbeddingBatcher(
+        make_client(server), config.embedding_model,
+        max_batch_size=config.query_embedding_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    processor = QueryProcessor(Mock(), make_client(server), config, embedder=embedder)
+    await run("micro-batched", processor, server, queries, args.concurrency)
+    await embedder.close()
+
+    server = FakeEmbeddingsServer(args.api_ms / 1000)
+    embedder = EmbeddingBatcher(
+        make_client(server), config.embedding_model,
+        max_batch_size=config.query_embedding_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+    processor = QueryProcessor(Mock(), make_client(server), config, embedder=embedder, query_embeddings=LRUCache(args.lru))
+    await run("micro-batched + LRU", processor, server, queries, args.concurrency)
+    await embedder.close()
+    print(f"LRU hit rate {processor.query_embeddings.stats()['hit_rate']:.2f}, coalesced {processor.embedding_stats()['coalesced']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=5000)
+    parser.add_argument("--distinct", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--api-ms", type=float, default=80.0)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--lru", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+"""CPU latency of the rerank stage.
+
+Reranks --candidates synthetic chunks of --words words down to --top-n for
+--queries queries, issued --concurrency at a time so concurrent queries share
+scorer batches, and reports per-query rerank latency. Uses the lexical overlap
+scorer unless --model names a local cross-encoder (needs sentence-transformers).
+
+    python -m benchmarks.bench_rerank --concurrency 1 8 32
+    python -m benchmarks.bench_rerank --model cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from processing.reranker import CrossEncoderScorer, OverlapScorer, Reranker
+from processing.timing import percentile
+
+WORDS = (
+    "printer network outage password reset invoice laptop monitor license vpn server "
+    "backup email calendar access request policy upgrade install error restart billing "
+    "account shipment order refund warranty driver firmware update battery screen"
+).split()
+
+def make_chunks(count: int, words: int, rng: random.Random) -> list[dict]:
+    return [
+        {"content": " ".join(rng.choices(WORDS, k=words)), "embedding_id": str(i), "score": 0.0}
+        for i in range(count)
+    ]
+
+async def run(reranker: Reranker, queries: list[tuple[str, list[dict]]], concurrency: int, top_n: int) -> list[float]:
+    latencies = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(query: str, chunks: list[dict]):
+        async with slots:
+            start = time.perf_counter()
+            await reranker.rerank(query, chunks, top_n)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one(query, chunks) for query, chunks in queries))
+    return latencies
+
+def report(concurrency: int, latencies: list[float], elapsed: float, reranker: Reranker):
+    ordered = sorted(latencies)
+    print(
+        f"concurrency {concurrency:>3}: p50={statistics.median(ordered):7.2f}ms "
+        f"p99={percentile(ordered, 99):7.2f}ms {len(ordered) / elapsed:8.0f} queries/s "
+        f"{reranker.pairs_scored / max(1, reranker.batches):6.0f} pairs/batch"
+    )
+
+async def main(args):
+    rng = random.Random(args.seed)
+    scorer = CrossEncoderScorer(args.model) if args.model else OverlapScorer()
+    queries = [
+        (" ".join(rng.choices(WORDS, k=6)), make_chunks(args.candidates, args.words, rng))
+        for _ in range(args.queries)
+    ]
+    print(f"{type(scorer).__name__}, {args.candidates} candidates of {args.words} words -> top {args.top_n}")
+    for concurrency in args.concurrency:
+        reranker = Reranker(scorer, max_batch_pairs=args.max_batch_pairs, max_wait_ms=args.max_wait_ms)
+        start = time.perf_counter()
+        latencies = await run(reranker, queries, concurrency, args.top_n)
+        report(concurrency, latencies, time.perf_counter() - start, reranker)
+        await reranker.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--candidates", type=int, default=50)
+    parser.add_argument("--words", type=int, default=120)
+    parser.add_argument("--top-n", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-batch-pairs", type=int, default=256)
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
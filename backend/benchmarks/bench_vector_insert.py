@@ -0,0 +1,63 @@
+"""Chunk insert throughput of VectorStorage against a throwaway Chroma directory.
+
+Compares one add call per chunk with the batched bulk upsert in
+VectorStorage.add_chunks. The per-chunk baseline runs on a --sample slice
+since it is far too slow for a full corpus.
+
+    python -m benchmarks.bench_vector_insert --chunks 100000 --dim 1536
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+from uuid import uuid4
+
+import numpy as np
+
+from storage.storage_interface import ChunkMetadata
+from storage.vector_storage import VectorStorage
+
+def make_corpus(count: int, dim: int, docs: int) -> tuple[list[ChunkMetadata], np.ndarray]:
+    doc_ids = [uuid4() for _ in range(docs)]
+    chunks = [
+        ChunkMetadata(id=uuid4(), document_id=doc_ids[i % docs], sequence=i // docs, content=f"chunk {i}")
+        for i in range(count)
+    ]
+    embeddings = np.random.default_rng(0).random((count, dim), dtype=np.float32)
+    return chunks, embeddings
+
+def per_chunk(storage: VectorStorage, chunks: list[ChunkMetadata], embeddings: np.ndarray):
+    for chunk, embedding in zip(chunks, embeddings):
+        storage.collection.add(
+            ids=[str(chunk.id)],
+            embeddings=[embedding.tolist()],
+            metadatas=[{"document_id": str(chunk.document_id), "sequence": chunk.sequence}],
+            documents=[chunk.content]
+        )
+
+def report(name: str, count: int, elapsed: float):
+    print(f"{name:<10} chunks={count:<7} time={elapsed:8.2f}s rate={count / elapsed:10.0f} chunks/s")
+
+async def main(args):
+    chunks, embeddings = make_corpus(args.chunks, args.dim, args.docs)
+
+    with tempfile.TemporaryDirectory() as persist_dir:
+        storage = VectorStorage(persist_dir=persist_dir)
+        sample = min(args.sample, args.chunks)
+        start = time.perf_counter()
+        per_chunk(storage, chunks[:sample], embeddings[:sample])
+        report("per-chunk", sample, time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as persist_dir:
+        storage = VectorStorage(persist_dir=persist_dir)
+        start = time.perf_counter()
+        await storage.add_chunks(chunks, embeddings)
+        report("bulk", args.chunks, time.perf_counter() - start)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--docs", type=int, default=100)
+    parser.add_argument("--sample", type=int, default=2000, help="chunks inserted one at a time")
+    asyncio.run(main(parser.parse_args()))
@@ -1,11 +1,36 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Literal, Optional
 
 class Settings(BaseSettings):
     openai_api_key: str
     chroma_db_path: str = "./data/vector_store"
     upload_folder: str = "./data/documents"
+    lexical_index_path: str = "./data/lexical_index.json"
     postgres_url: str
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_statement_timeout_ms: int = 30_000
+    db_prepared_statement_cache_size: int = 256
+    db_migrate_on_startup: bool = True
+    corpus_version_refresh_seconds: float = 1.0
+    ingest_workers: int = 2
+    ingest_max_pending: int = 100
+    ingest_process_workers: int = 2
+    ingest_claim_lease_seconds: float = 60
+    upload_buffer_size: int = 1024 * 1024
+    upload_batch_max_files: int = 10_000
+    upload_max_bytes: int = 100 * 1024 * 1024
+    upload_archive_max_bytes: int = 1024 * 1024 * 1024
+    upload_archive_max_entries: int = 10_000
+    vector_workers: int = 4
+    conversation_backend: Literal["memory", "sql", "redis"] = "memory"
+    conversation_expiry_minutes: int = 60
+    conversation_max_bytes: int = 256 * 1024 * 1024
+    redis_url: Optional[str] = None
     
     class Config:
         env_file = ".env"
@@ -1,14 +1,34 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from openai import AsyncOpenAI
 from storage.storage_manager import StorageManager
 from storage.file_system_storage import FileSystemStorage
 from storage.vector_storage import VectorStorage
 from storage.metadata_store import MetadataStore
+from storage.embedding_cache import EmbeddingCache
+from storage.lexical_index import LexicalIndex
+from storage.conversation_store import (
+    ConversationStore,
+    InMemoryConversationStore,
+    RedisConversationStore,
+    SqlConversationStore
+)
 from config import get_settings
 from processing.config import ProcessingConfig
 from processing.prompt_manager import PromptManager
+from processing.tokens import load_encoding
 from processing.query_processor import QueryProcessor
 from processing.completion_handler import CompletionHandler
 from processing.processor import DocumentProcessor
+from processing.extraction import ExtractionPool
+from processing.embedding_batcher import EmbeddingBatcher
+from processing.job_queue import IngestionQueue
+from processing.semantic_cache import SemanticCache
+from processing.reranker import Reranker, OverlapScorer, CrossEncoderScorer
+from processing.response_cache import LRUCache, ResponseCache
+from processing.conversation import ConversationManager
+from processing.history_summarizer import HistorySummarizer
 
 settings = get_settings()
 
@@ -17,38 +37,162 @@ openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
 
 # Initialize storage components
 file_storage = FileSystemStorage(settings.upload_folder)
-vector_storage = VectorStorage(settings.chroma_db_path)
-metadata_storage = MetadataStore(settings.postgres_url)
+vector_storage = VectorStorage(settings.chroma_db_path, max_workers=settings.vector_workers)
+metadata_storage = MetadataStore(
+    settings.postgres_url,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    statement_timeout_ms=settings.db_statement_timeout_ms,
+    prepared_statement_cache_size=settings.db_prepared_statement_cache_size
+)
+lexical_index = LexicalIndex(settings.lexical_index_path)
 
 # Initialize storage manager
 storage_manager = StorageManager(
     file_storage=file_storage,
     vector_storage=vector_storage,
-    metadata_storage=metadata_storage
+    metadata_storage=metadata_storage,
+    lexical_index=lexical_index,
+    corpus_version_refresh=settings.corpus_version_refresh_seconds,
+    claim_lease=settings.ingest_claim_lease_seconds
 )
 
 # Initialize processing components
 processing_config = ProcessingConfig()
-prompt_manager = PromptManager()
+embedding_cache = EmbeddingCache(
+    metadata_store=metadata_storage,
+    max_entries=processing_config.embedding_cache_max_entries
+)
+prompt_manager = PromptManager(token_budget=processing_config.prompt_token_budget)
+
+# CPU-bound ingest stages run in worker processes, off the event loop. Spawned rather than
+# forked, a fork would copy the loop's threads and open connections; sized by setting since
+# every uvicorn worker has its own pool and os.cpu_count() per worker oversubscribes the host
+cpu_executor = ProcessPoolExecutor(
+    max_workers=settings.ingest_process_workers,
+    mp_context=multiprocessing.get_context("spawn")
+)
+extraction_pool = ExtractionPool(
+    workers=processing_config.extraction_workers,
+    timeout=processing_config.extraction_timeout,
+    memory_limit_mb=processing_config.extraction_memory_limit_mb,
+    max_tasks_per_child=processing_config.extraction_max_tasks_per_child
+)
+
+# Embedding requests from all documents share batches, retries are handled by the batcher
+embedding_batcher = EmbeddingBatcher(
+    openai_client=openai_client.with_options(max_retries=0),
+    model=processing_config.embedding_model,
+    max_batch_tokens=processing_config.embedding_batch_tokens,
+    max_batch_size=processing_config.embedding_batch_size,
+    max_concurrency=processing_config.embedding_concurrency,
+    max_retries=processing_config.max_retries
+)
 
 # Initialize document processor
 document_processor = DocumentProcessor(
     storage=storage_manager,
     openai_client=openai_client,
-    config=processing_config
+    config=processing_config,
+    executor=cpu_executor,
+    extraction_pool=extraction_pool,
+    embedder=embedding_batcher,
+    embedding_cache=embedding_cache
 )
 
+ingestion_queue = IngestionQueue(
+    processor=document_processor,
+    workers=settings.ingest_workers,
+    max_pending=settings.ingest_max_pending,
+    requeue_interval=settings.ingest_claim_lease_seconds
+)
+
+reranker = Reranker(
+    scorer=CrossEncoderScorer(processing_config.rerank_model)
+    if processing_config.rerank_model else OverlapScorer(),
+    max_batch_pairs=processing_config.rerank_max_batch_pairs,
+    max_wait_ms=processing_config.rerank_max_wait_ms
+) if processing_config.rerank_enabled else None
+# Chat queries get their own batcher so they never queue behind document chunks
+query_embedder = EmbeddingBatcher(
+    openai_client=openai_client.with_options(max_retries=0),
+    model=processing_config.embedding_model,
+    max_batch_size=processing_config.query_embedding_batch_size,
+    max_concurrency=processing_config.embedding_concurrency,
+    max_retries=processing_config.max_retries,
+    max_wait_ms=processing_config.query_embedding_max_wait_ms
+)
 query_processor = QueryProcessor(
     storage=storage_manager,
     openai_client=openai_client,
-    config=processing_config
+    config=processing_config,
+    embedding_cache=embedding_cache,
+    lexical_index=lexical_index,
+    reranker=reranker,
+    embedder=query_embedder,
+    query_embeddings=LRUCache(
+        max_entries=processing_config.query_embedding_cache_max_entries
+    ) if processing_config.query_embedding_cache_max_entries else None
 )
+semantic_cache = SemanticCache(
+    threshold=processing_config.semantic_cache_threshold,
+    ttl_seconds=processing_config.semantic_cache_ttl_seconds,
+    max_entries=processing_config.semantic_cache_max_entries
+) if processing_config.semantic_cache_enabled else None
+def create_conversation_store() -> ConversationStore:
+    if settings.conversation_backend == "sql":
+        return SqlConversationStore(metadata_storage, expiry_minutes=settings.conversation_expiry_minutes)
+    if settings.conversation_backend == "redis":
+        return RedisConversationStore(settings.redis_url, expiry_minutes=settings.conversation_expiry_minutes)
+    return InMemoryConversationStore(ConversationManager(
+        expiry_minutes=settings.conversation_expiry_minutes,
+        max_bytes=settings.conversation_max_bytes
+    ))
+
+conversation_store = create_conversation_store()
+history_summarizer = HistorySummarizer(
+    openai_client=openai_client,
+    conversation_store=conversation_store,
+    trigger_tokens=processing_config.history_summary_trigger_tokens,
+    keep_recent=processing_config.history_summary_keep_messages
+) if processing_config.history_summary_enabled else None
 completion_handler = CompletionHandler(
     query_processor=query_processor,
     prompt_manager=prompt_manager,
-    openai_client=openai_client
+    openai_client=openai_client,
+    semantic_cache=semantic_cache,
+    response_cache=ResponseCache(
+        max_entries=processing_config.response_cache_max_entries
+    ) if processing_config.response_cache_max_entries else None,
+    conversation_store=conversation_store,
+    summarizer=history_summarizer
 )
 
 async def init_dependencies():
     """Initialize async components"""
-    await metadata_storage.initialize()
\ No newline at end of file
+    if settings.db_migrate_on_startup:
+        await metadata_storage.migrate()
+    # The saved index can lag the metadata store (a crash, other workers), reconcile the two
+    await lexical_index.initialize()
+    await storage_manager.reconcile_lexical_index()
+    # Rather than on the first chat request, where a download would block the event loop
+    await asyncio.to_thread(load_encoding, prompt_manager.model)
+    await ingestion_queue.start()
+    await conversation_store.start()
+
+async def shutdown_dependencies():
+    """Stop background workers and release pooled resources"""
+    await ingestion_queue.stop()
+    await conversation_store.close()
+    await lexical_index.close()
+    await embedding_batcher.close()
+    await query_embedder.close()
+    if reranker:
+        await reranker.close()
+    cpu_executor.shutdown(wait=False, cancel_futures=True)
+    extraction_pool.shutdown()
+    vector_storage.shutdown()
+    await metadata_storage.engine.dispose()
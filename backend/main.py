@@ -1,9 +1,9 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from api import chat, documents
+from api import chat, documents, metrics
 import uvicorn
-from dependencies import init_dependencies
+from dependencies import init_dependencies, shutdown_dependencies, metadata_storage
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -12,6 +12,7 @@ async def lifespan(app: FastAPI):
     await init_dependencies()
     yield
     # Shutdown
+    await shutdown_dependencies()
 
 app = FastAPI(
     title="RAG Chatbot",
@@ -27,6 +28,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def count_database_queries(request: Request, call_next):
+    """Attribute database statements to the request that issued them, for /metrics"""
+    with metadata_storage.metrics.track_request():
+        return await call_next(request)
+
 # Add routers with explicit prefixes
 app.include_router(
     chat.router,
@@ -38,6 +45,11 @@ app.include_router(
     prefix="/documents",
     tags=["documents"]
 )
+app.include_router(
+    metrics.router,
+    prefix="",
+    tags=["metrics"]
+)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=3001)
@@ -0,0 +1,57 @@
+import asyncio
+from logging.config import fileConfig
+
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from alembic import context
+
+from storage.storage_interface import Base
+
+config = context.config
+target_metadata = Base.metadata
+
+def database_url() -> str:
+    url = config.get_main_option("sqlalchemy.url")
+    if url:
+        return url
+    from config import get_settings
+    return get_settings().postgres_url
+
+def run_migrations_offline():
+    """Emit the migration SQL instead of running it: alembic upgrade head --sql"""
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"}
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def do_run_migrations(connection: Connection):
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+async def run_async_migrations():
+    engine = create_async_engine(database_url(), poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+    await engine.dispose()
+
+def run_migrations_online():
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        # Called by MetadataStore.migrate with a connection from the app's engine
+        do_run_migrations(connection)
+        return
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    asyncio.run(run_async_migrations())
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,42 @@
+"""Initial schema, as Base.metadata.create_all created it before migrations existed
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        "documents",
+        sa.Column("id", postgresql.UUID(), primary_key=True),
+        sa.Column("filename", sa.String(), nullable=False),
+        sa.Column("mime_type", sa.String(), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False)
+    )
+    op.create_table(
+        "chunks",
+        sa.Column("id", postgresql.UUID(), primary_key=True),
+        sa.Column("document_id", postgresql.UUID(), sa.ForeignKey("documents.id"), nullable=False),
+        sa.Column("content", sa.String(), nullable=False),
+        sa.Column("sequence", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("embedding_id", sa.String(), nullable=True)
+    )
+
+
+def downgrade():
+    op.drop_table("chunks")
+    op.drop_table("documents")
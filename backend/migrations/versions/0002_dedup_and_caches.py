@@ -0,0 +1,58 @@
+"""Document content hash, embedding cache and conversations
+
+Before migrations existed create_all added new tables to an existing database but never
+new columns, so a stamped database may already have some of these; only what is missing
+is created.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    if "content_hash" not in {column["name"] for column in inspector.get_columns("documents")}:
+        # Batch mode rebuilds the table on SQLite, which cannot add a constraint in place
+        with op.batch_alter_table("documents") as batch:
+            batch.add_column(sa.Column("content_hash", sa.String(64), nullable=True))
+            # The name Postgres gives the constraint create_all makes for unique=True
+            batch.create_unique_constraint("documents_content_hash_key", ["content_hash"])
+
+    if "embedding_cache" not in tables:
+        op.create_table(
+            "embedding_cache",
+            sa.Column("content_hash", sa.String(64), primary_key=True),
+            sa.Column("model", sa.String(), primary_key=True),
+            sa.Column("embedding", sa.LargeBinary(), nullable=False),
+            sa.Column("last_used_at", sa.DateTime(), nullable=False)
+        )
+        op.create_index("ix_embedding_cache_last_used_at", "embedding_cache", ["last_used_at"])
+
+    if "conversations" not in tables:
+        op.create_table(
+            "conversations",
+            sa.Column("id", sa.String(), primary_key=True),
+            sa.Column("messages", sa.JSON(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False)
+        )
+        op.create_index("ix_conversations_expires_at", "conversations", ["expires_at"])
+
+
+def downgrade():
+    op.drop_table("conversations")
+    op.drop_table("embedding_cache")
+    with op.batch_alter_table("documents") as batch:
+        batch.drop_constraint("documents_content_hash_key", type_="unique")
+        batch.drop_column("content_hash")
@@ -0,0 +1,30 @@
+"""Indexes for per-document chunk reads and deletes and for listing documents by status
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # A database from create_all may have the chunks index already
+    inspector = sa.inspect(op.get_bind())
+    if "ix_chunks_document_id_sequence" not in {index["name"] for index in inspector.get_indexes("chunks")}:
+        op.create_index("ix_chunks_document_id_sequence", "chunks", ["document_id", "sequence"])
+    # documents.content_hash is already covered by the index behind its unique constraint.
+    # Replaced in 0004, which drops it again.
+    op.create_index("ix_documents_status_created_at", "documents", ["status", "created_at"])
+
+
+def downgrade():
+    op.drop_index("ix_documents_status_created_at", table_name="documents")
+    op.drop_index("ix_chunks_document_id_sequence", table_name="chunks")
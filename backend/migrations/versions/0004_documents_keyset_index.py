@@ -0,0 +1,37 @@
+"""Indexes for keyset pagination of the document listing on (created_at, id), over all
+documents and filtered by status or mime_type. The status index replaces the one on
+(status, created_at) from 0003, which still sorted every page on id.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # A database from create_all may have these already
+    existing = {index["name"] for index in sa.inspect(op.get_bind()).get_indexes("documents")}
+    for name, columns in [
+        ("ix_documents_created_at_id", ["created_at", "id"]),
+        ("ix_documents_status_created_at_id", ["status", "created_at", "id"]),
+        ("ix_documents_mime_type_created_at_id", ["mime_type", "created_at", "id"]),
+    ]:
+        if name not in existing:
+            op.create_index(name, "documents", columns)
+    op.drop_index("ix_documents_status_created_at", table_name="documents")
+
+
+def downgrade():
+    op.create_index("ix_documents_status_created_at", "documents", ["status", "created_at"])
+    op.drop_index("ix_documents_mime_type_created_at_id", table_name="documents")
+    op.drop_index("ix_documents_status_created_at_id", table_name="documents")
+    op.drop_index("ix_documents_created_at_id", table_name="documents")
@@ -0,0 +1,31 @@
+"""Corpus version counter shared by all workers, keys the answer caches
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # A database from create_all may have the table already
+    if "corpus_state" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    corpus_state = op.create_table(
+        "corpus_state",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("version", sa.Integer(), nullable=False)
+    )
+    op.bulk_insert(corpus_state, [{"id": 1, "version": 0}])
+
+
+def downgrade():
+    op.drop_table("corpus_state")
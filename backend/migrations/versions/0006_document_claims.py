@@ -0,0 +1,31 @@
+"""Claim and lease columns on documents, so only one worker processes a document at a time
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # A database from create_all may have the columns already
+    columns = {column["name"] for column in sa.inspect(op.get_bind()).get_columns("documents")}
+    if "claim_id" not in columns:
+        op.add_column("documents", sa.Column("claim_id", postgresql.UUID(), nullable=True))
+    if "claim_expires_at" not in columns:
+        op.add_column("documents", sa.Column("claim_expires_at", sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table("documents") as batch:
+        batch.drop_column("claim_expires_at")
+        batch.drop_column("claim_id")
@@ -17,7 +17,24 @@ class Document(BaseModel):
     size_bytes: int
     upload_date: datetime
     status: str
+    chunk_count: Optional[int] = None
+
+class DocumentPage(BaseModel):
+    documents: list[Document]
+    # Pass back as cursor for the next page, None on the last one
+    next_cursor: Optional[str] = None
 
 class ProcessingStatus(BaseModel):
     status: str
     message: Optional[str] = None
+    doc_id: Optional[str] = None
+    progress: Optional[dict] = None
+
+class FileUploadStatus(ProcessingStatus):
+    # The upload's file name, or the entry's for files from an archive
+    filename: str
+
+class BatchUploadResponse(BaseModel):
+    files: list[FileUploadStatus]
+    # Set when the batch held more files than the limit, the rest were not stored
+    truncated: bool = False
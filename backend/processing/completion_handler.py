@@ -1,10 +1,23 @@
-from typing import Optional
+import time
+import anyio
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
 from openai import AsyncOpenAI
 
 from .query_processor import QueryProcessor
 from .prompt_manager import PromptManager
 from .exceptions import ProcessingError
-from .conversation import ConversationManager
+from storage.conversation_store import ConversationStore, InMemoryConversationStore
+from .semantic_cache import CachedAnswer, SemanticCache
+from .history_summarizer import HistorySummarizer
+from .response_cache import ResponseCache, SingleFlight, history_hash, normalize_question
+
+@dataclass
+class CacheProbe:
+    query_embedding: list[float]
+    corpus_version: int
+    started: float
+    hit: Optional[CachedAnswer]
 
 class CompletionHandler:
     def __init__(
@@ -13,57 +26,220 @@ class CompletionHandler:
         prompt_manager: PromptManager,
         openai_client: AsyncOpenAI,
         model: str = "gpt-3.5-turbo",
-        max_history: int = 20
+        max_history: int = 20,
+        semantic_cache: Optional[SemanticCache] = None,
+        response_cache: Optional[ResponseCache] = None,
+        conversation_store: Optional[ConversationStore] = None,
+        summarizer: Optional[HistorySummarizer] = None
     ):
         self.query_processor = query_processor
         self.prompt_manager = prompt_manager
         self.openai = openai_client
         self.model = model
-        self.conversation_manager = ConversationManager(max_history=max_history)
+        self.conversations = conversation_store or InMemoryConversationStore(max_history=max_history)
+        self.summarizer = summarizer
+        self.semantic_cache = semantic_cache
+        self.response_cache = response_cache
+        self.single_flight = SingleFlight()
 
     async def get_response(
         self,
         question: str,
-        context_limit: int = 3,
+        context_limit: Optional[int] = None,
         conversation_id: Optional[str] = None
     ) -> dict[str, any]:
         """Process a question and get an AI response using relevant context"""
         try:
-            
-            conversation_history = None
-            if conversation_id:
-                conversation_history = self.conversation_manager.get_history(conversation_id)
+            conversation_history = await self._get_history(conversation_id)
+            key = (
+                normalize_question(question),
+                await self.query_processor.get_corpus_version(),
+                history_hash(conversation_history),
+                context_limit
+            )
+
+            result = self.response_cache.get(key) if self.response_cache else None
+            if result is not None:
+                result = {**result, "cached": True}
+            else:
+                # Identical requests in flight share one retrieval and completion
+                result = await self.single_flight.do(
+                    key, lambda: self._answer(key, question, context_limit, conversation_history)
+                )
+
+            conversation_history = await self._append_turn(
+                question, result["answer"], conversation_id, conversation_history
+            )
+            return {
+                "answer": result["answer"],
+                "context": result["context"],
+                "chunks": result["chunks"],
+                "conversation_history": conversation_history or [],
+                "cached": result["cached"]
+            }
+
+        except Exception as e:
+            raise ProcessingError(f"Failed to get completion: {str(e)}") from e
+
+    async def _answer(
+        self,
+        key: tuple,
+        question: str,
+        context_limit: Optional[int],
+        conversation_history: Optional[list[dict]]
+    ) -> dict:
+        """Retrieve context and ask the model, independent of the conversation the answer goes to"""
+        probe = await self._probe_cache(question, conversation_history)
+        if probe and probe.hit:
+            return {
+                "answer": probe.hit.answer,
+                "context": probe.hit.context,
+                "chunks": probe.hit.chunks,
+                "cached": True
+            }
+
+        query_result = await self.query_processor.process_query(
+            query=question,
+            limit=context_limit,
+            query_embedding=probe.query_embedding if probe else None
+        )
+
+        messages = self.prompt_manager.create_chat_messages(
+            question=question,
+            context=query_result["context"],
+            history=conversation_history
+        )
+
+        completion = await self.openai.chat.completions.create(
+            model=self.model,
+            messages=messages
+        )
+        answer = completion.choices[0].message.content
+        self._store_in_cache(probe, query_result, answer)
+
+        result = {
+            "answer": answer,
+            "context": query_result["context"],
+            "chunks": query_result["chunks"],
+            "cached": False
+        }
+        if self.response_cache and not query_result.get("degraded"):
+            self.response_cache.put(key, result)
+        return result
+
+    async def stream_response(
+        self,
+        question: str,
+        context_limit: Optional[int] = None,
+        conversation_id: Optional[str] = None
+    ) -> AsyncIterator[dict]:
+        """Answer a question as a stream of events: the sources first, then the answer tokens
+        as the model produces them, then done. The turn is added to the conversation history
+        when the stream ends, with the partial answer if the client went away mid-answer."""
+        try:
+            conversation_history = await self._get_history(conversation_id)
+            probe = await self._probe_cache(question, conversation_history)
+            if probe and probe.hit:
+                yield {"event": "sources", "data": {"sources": self.sources(probe.hit.chunks)}}
+                yield {"event": "token", "data": {"content": probe.hit.answer}}
+                await self._append_turn(question, probe.hit.answer, conversation_id, conversation_history)
+                yield {"event": "done", "data": {"cached": True}}
+                return
 
             query_result = await self.query_processor.process_query(
                 query=question,
-                limit=context_limit
+                limit=context_limit,
+                query_embedding=probe.query_embedding if probe else None
             )
-
             messages = self.prompt_manager.create_chat_messages(
                 question=question,
                 context=query_result["context"],
                 history=conversation_history
             )
-
-            completion = await self.openai.chat.completions.create(
+            stream = await self.openai.chat.completions.create(
                 model=self.model,
-                messages=messages
+                messages=messages,
+                stream=True
             )
+        except Exception as e:
+            raise ProcessingError(f"Failed to get completion: {str(e)}") from e
 
-            
-            conversation_history = self.update_history(question, conversation_id, conversation_history, completion)
+        parts: list[str] = []
+        try:
+            yield {"event": "sources", "data": {"sources": self.sources(query_result["chunks"])}}
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content if chunk.choices else None
+                if content:
+                    parts.append(content)
+                    yield {"event": "token", "data": {"content": content}}
+        except Exception as e:
+            raise ProcessingError(f"Failed to stream completion: {str(e)}") from e
+        finally:
+            # A client disconnect cancels the response's task group, and that cancellation
+            # would hit every await here too: shield it so the upstream stream is closed
+            # and the partial answer saved regardless
+            with anyio.CancelScope(shield=True):
+                await stream.close()
+                if parts:
+                    await self._append_turn(question, "".join(parts), conversation_id, conversation_history)
 
-            return {
-                "answer": completion.choices[0].message.content,
-                "context": query_result["context"],
-                "chunks": query_result["chunks"],
-                "conversation_history": conversation_history or []
-            }
+        self._store_in_cache(probe, query_result, "".join(parts))
+        yield {"event": "done", "data": {"cached": False}}
 
-        except Exception as e:
-            raise ProcessingError(f"Failed to get completion: {str(e)}") from e
+    @staticmethod
+    def sources(chunks: list[dict]) -> list[str]:
+        """Distinct document ids of the chunks, in retrieval order"""
+        return list(dict.fromkeys(chunk["document_id"] for chunk in chunks))
+
+    async def _get_history(self, conversation_id: Optional[str]) -> Optional[list[dict]]:
+        if conversation_id:
+            return await self.conversations.get_history(conversation_id)
+        return None
+
+    async def _probe_cache(self, question: str, conversation_history: Optional[list[dict]]) -> Optional[CacheProbe]:
+        """Look the question up in the semantic cache. Answers only depend on the question
+        when there is no history to follow up on, so follow-ups skip the cache."""
+        if self.semantic_cache is None or conversation_history:
+            return None
+        started = time.perf_counter()
+        corpus_version = await self.query_processor.get_corpus_version()
+        try:
+            query_embedding = await self.query_processor.embed_query(question)
+        except Exception:
+            # Retrieval can still answer without embeddings, just skip the cache
+            return None
+        return CacheProbe(
+            query_embedding=query_embedding,
+            corpus_version=corpus_version,
+            started=started,
+            hit=self.semantic_cache.lookup(query_embedding, corpus_version)
+        )
+
+    def _store_in_cache(self, probe: Optional[CacheProbe], query_result: dict, answer: str):
+        if probe is None or query_result.get("degraded"):
+            return
+        self.semantic_cache.store(
+            probe.query_embedding,
+            answer=answer,
+            context=query_result["context"],
+            chunks=query_result["chunks"],
+            corpus_version=probe.corpus_version,
+            latency_ms=(time.perf_counter() - probe.started) * 1000
+        )
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.single_flight.in_flight,
+            "coalesced": self.single_flight.coalesced,
+            "exact_cache": self.response_cache.stats() if self.response_cache else None
+        }
+
+    async def update_history(self, question, conversation_id, conversation_history, completion):
+        return await self._append_turn(
+            question, completion.choices[0].message.content, conversation_id, conversation_history
+        )
 
-    def update_history(self, question, conversation_id, conversation_history, completion):
+    async def _append_turn(self, question, answer, conversation_id, conversation_history):
         if conversation_id:
             if conversation_history is None:
                 conversation_history = []
@@ -73,7 +249,9 @@ class CompletionHandler:
                 })
             conversation_history.append({
                     "role": "assistant",
-                    "content": completion.choices[0].message.content
+                    "content": answer
                 })
-            self.conversation_manager.update_history(conversation_id, conversation_history)
+            await self.conversations.update_history(conversation_id, conversation_history)
+            if self.summarizer:
+                self.summarizer.schedule(conversation_id, conversation_history)
         return conversation_history
@@ -1,3 +1,4 @@
+from typing import Literal, Optional
 from pydantic import BaseModel, Field
 
 class ProcessingConfig(BaseModel):
@@ -6,3 +7,35 @@ class ProcessingConfig(BaseModel):
     embedding_model: str = Field(default="text-embedding-ada-002")
     min_chunk_size: int = Field(default=100, gt=0)
     max_retries: int = Field(default=3, gt=0)
+    embedding_batch_tokens: int = Field(default=100_000, gt=0)
+    embedding_batch_size: int = Field(default=512, gt=0, le=2048)
+    embedding_concurrency: int = Field(default=4, gt=0)
+    embedding_cache_max_entries: int = Field(default=500_000, gt=0)
+    query_embedding_cache_max_entries: int = Field(default=10_000, ge=0)  # 0 disables the in-process LRU
+    query_embedding_batch_size: int = Field(default=64, gt=0, le=2048)
+    query_embedding_max_wait_ms: float = Field(default=5.0, ge=0)  # how long a query waits for others to batch with
+    extraction_workers: int = Field(default=2, gt=0)
+    extraction_timeout: float = Field(default=120.0, gt=0)
+    extraction_memory_limit_mb: int = Field(default=4096, ge=0)  # 0 disables the cap
+    extraction_max_tasks_per_child: int = Field(default=50, gt=0)
+    retrieval_top_k: int = Field(default=3, gt=0)
+    retrieval_min_similarity: float = Field(default=0.0, ge=-1.0, le=1.0)  # cosine similarity
+    retrieval_latency_budget_ms: float = Field(default=1500.0, gt=0)
+    # hybrid and lexical need a lexical index, without one retrieval is vector only
+    retrieval_mode: Literal["vector", "hybrid", "lexical"] = Field(default="hybrid")
+    retrieval_candidates: int = Field(default=20, gt=0)  # fetched per retriever before fusion
+    rrf_k: int = Field(default=60, gt=0)
+    rerank_enabled: bool = Field(default=False)
+    rerank_model: Optional[str] = Field(default=None)  # local cross-encoder, lexical overlap when unset
+    rerank_candidates: int = Field(default=50, gt=0)  # retrieved for the reranker to choose from
+    rerank_max_batch_pairs: int = Field(default=256, gt=0)
+    rerank_max_wait_ms: float = Field(default=2.0, ge=0)
+    semantic_cache_enabled: bool = Field(default=False)
+    semantic_cache_threshold: float = Field(default=0.95, gt=0, le=1.0)
+    semantic_cache_ttl_seconds: float = Field(default=3600.0, gt=0)
+    semantic_cache_max_entries: int = Field(default=1000, gt=0)
+    response_cache_max_entries: int = Field(default=1000, ge=0)  # 0 disables the exact-match cache
+    prompt_token_budget: int = Field(default=3000, gt=0)
+    history_summary_enabled: bool = Field(default=False)
+    history_summary_trigger_tokens: int = Field(default=1500, gt=0)
+    history_summary_keep_messages: int = Field(default=4, ge=0)
@@ -1,60 +1,166 @@
-from typing import Optional
-from datetime import datetime, timedelta, timezone
+import asyncio
+import heapq
 import threading
 import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Name of the leading system message holding the rolling summary of older turns
+SUMMARY_NAME = "conversation_summary"
+
+def summary_message(summary: str) -> dict[str, str]:
+    return {"role": "system", "name": SUMMARY_NAME, "content": summary}
+
+def split_summary(history: list[dict[str, str]]) -> tuple[Optional[dict[str, str]], list[dict[str, str]]]:
+    """Separate the rolling summary, if any, from the conversation turns"""
+    if history and history[0].get("name") == SUMMARY_NAME:
+        return history[0], history[1:]
+    return None, history
+
+def trim_history(messages: list[dict[str, str]], max_history: int) -> list[dict[str, str]]:
+    """Keep the most recent max_history turns, and the summary of the ones before them"""
+    summary, turns = split_summary(messages)
+    if len(turns) <= max_history:
+        return messages
+    turns = turns[-max_history:]
+    return [summary] + turns if summary else turns
 
 class ConversationManager:
+    """Process-local conversation history.
+
+    Expiry uses a min-heap of deadlines with lazy deletion: an access only updates
+    last_accessed, and a stale heap entry is re-pushed with the real deadline when it
+    surfaces, so cleanup costs O(k log n) for k expired conversations instead of a scan.
+    Total history is capped at max_bytes, evicting least recently used conversations.
+    All state is guarded by one lock, the cleanup loop runs on the asyncio loop."""
+
     def __init__(
         self,
         max_history: int = 20,
-        expiry_minutes: int = 60,
-        cleanup_interval: int = 60
+        expiry_minutes: float = 60,
+        cleanup_interval: float = 60,
+        max_bytes: int = 256 * 1024 * 1024,
+        clock: Callable[[], float] = time.monotonic
     ):
         self.max_history = max_history
-        self.expiry_minutes = expiry_minutes
-        self.conversations: dict[str, dict] = {}
-        self.last_accessed: dict[str, datetime] = {}
-        
-        # Start cleanup thread
-        self.cleanup_thread = threading.Thread(
-            target=self._cleanup_loop,
-            args=(cleanup_interval,),
-            daemon=True
-        )
-        self.cleanup_thread.start()
+        self.expiry_seconds = expiry_minutes * 60
+        self.cleanup_interval = cleanup_interval
+        self.max_bytes = max_bytes
+        self.clock = clock
+        # Ordered least recently used first
+        self.conversations: OrderedDict[str, list[dict[str, str]]] = OrderedDict()
+        self.last_accessed: dict[str, float] = {}
+        self.sizes: dict[str, int] = {}
+        self.total_bytes = 0
+        self.expired = 0
+        self.evicted = 0
+        self._deadlines: list[tuple[float, str]] = []
+        self._lock = threading.Lock()
+        self._cleanup_task: Optional[asyncio.Task] = None
 
     def get_history(self, conversation_id: str) -> Optional[list[dict[str, str]]]:
         """Get conversation history if it exists and update last accessed time"""
-        if conversation_id in self.conversations:
-            self.last_accessed[conversation_id] = datetime.now()
+        with self._lock:
+            if conversation_id not in self.conversations:
+                return None
+            now = self.clock()
+            if now - self.last_accessed[conversation_id] >= self.expiry_seconds:
+                # Expired but not cleaned up yet
+                self._remove(conversation_id)
+                self.expired += 1
+                return None
+            self._touch(conversation_id, now)
             return self.conversations[conversation_id]
-        return None
 
     def update_history(self, conversation_id: str, messages: list[dict[str, str]]):
         """Update conversation history, maintaining size limit"""
         # Keep only the most recent messages within the limit
-        if len(messages) > self.max_history:
-            messages = messages[-self.max_history:]
-        
-        self.conversations[conversation_id] = messages
-        self.last_accessed[conversation_id] = datetime.now()
+        messages = trim_history(messages, self.max_history)
+        size = self._size(messages)
+
+        with self._lock:
+            now = self.clock()
+            if conversation_id not in self.conversations:
+                heapq.heappush(self._deadlines, (now + self.expiry_seconds, conversation_id))
+            self.total_bytes += size - self.sizes.get(conversation_id, 0)
+            self.sizes[conversation_id] = size
+            self.conversations[conversation_id] = messages
+            self._touch(conversation_id, now)
+            self._evict_over_budget(keep=conversation_id)
+
+    async def start(self):
+        """Run periodic cleanup on the running loop"""
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
 
-    def _cleanup_loop(self, interval: int):
+    async def stop(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            await asyncio.gather(self._cleanup_task, return_exceptions=True)
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self):
         """Periodically clean up expired conversations"""
         while True:
+            await asyncio.sleep(self.cleanup_interval)
             self._cleanup_expired()
-            time.sleep(interval)
-
-    def _cleanup_expired(self):
-        """Remove conversations that have expired"""
-        now = datetime.now()
-        expiry = timedelta(minutes=self.expiry_minutes)
-        
-        expired = [
-            conv_id for conv_id, last_access in self.last_accessed.items()
-            if now - last_access > expiry
-        ]
-        
-        for conv_id in expired:
-            self.conversations.pop(conv_id, None)
-            self.last_accessed.pop(conv_id, None)
+
+    def _cleanup_expired(self, now: Optional[float] = None) -> int:
+        """Remove conversations that have expired, returning how many were removed"""
+        removed = 0
+        with self._lock:
+            now = self.clock() if now is None else now
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, conversation_id = heapq.heappop(self._deadlines)
+                last_accessed = self.last_accessed.get(conversation_id)
+                if last_accessed is None:
+                    # Evicted, or expired lazily in get_history
+                    continue
+                deadline = last_accessed + self.expiry_seconds
+                if deadline > now:
+                    # Accessed since this entry was pushed
+                    heapq.heappush(self._deadlines, (deadline, conversation_id))
+                    continue
+                self._remove(conversation_id)
+                removed += 1
+            self.expired += removed
+            self._compact()
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            "conversations": len(self.conversations),
+            "total_bytes": self.total_bytes,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
+
+    def _touch(self, conversation_id: str, now: float):
+        self.last_accessed[conversation_id] = now
+        self.conversations.move_to_end(conversation_id)
+
+    def _remove(self, conversation_id: str):
+        del self.conversations[conversation_id]
+        del self.last_accessed[conversation_id]
+        self.total_bytes -= self.sizes.pop(conversation_id)
+
+    def _evict_over_budget(self, keep: str):
+        while self.total_bytes > self.max_bytes and len(self.conversations) > 1:
+            oldest = next(iter(self.conversations))
+            if oldest == keep:
+                break
+            self._remove(oldest)
+            self.evicted += 1
+
+    def _compact(self):
+        """Drop heap entries of removed conversations once they dominate the heap"""
+        if len(self._deadlines) > 2 * len(self.conversations) + 1024:
+            self._deadlines = [
+                (last_accessed + self.expiry_seconds, conversation_id)
+                for conversation_id, last_accessed in self.last_accessed.items()
+            ]
+            heapq.heapify(self._deadlines)
+
+    @staticmethod
+    def _size(messages: list[dict[str, str]]) -> int:
+        return sum(len(key) + len(value) for message in messages for key, value in message.items())
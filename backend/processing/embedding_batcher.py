@@ -0,0 +1,196 @@
+import asyncio
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+from openai import AsyncOpenAI, RateLimitError, APIConnectionError, APITimeoutError, InternalServerError
+
+from processing.exceptions import EmbeddingError
+from processing.tokens import estimate_tokens
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+@dataclass
+class _PendingText:
+    text: str
+    tokens: int
+    future: asyncio.Future
+
+class EmbeddingBatcher:
+    """Packs texts from concurrent callers into token-budgeted embedding requests.
+
+    With max_wait_ms set, the dispatcher waits that long after the first text arrives
+    before sending, so single-text callers such as chat queries share a request."""
+
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        model: str,
+        max_batch_tokens: int = 100_000,
+        max_batch_size: int = 512,
+        max_concurrency: int = 4,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        max_backoff: float = 20.0,
+        max_wait_ms: float = 0.0
+    ):
+        self.openai = openai_client
+        self.model = model
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.max_wait = max_wait_ms / 1000
+        self.batches_sent = 0
+        self.retries = 0
+        self._pending: deque[_PendingText] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._in_flight: set[asyncio.Task] = set()
+
+    async def embed(
+        self,
+        texts: list[str],
+        on_embedded: Optional[Callable[[int], None]] = None
+    ) -> list[list[float]]:
+        """Embed texts, in order, sharing batches with every other caller.
+        on_embedded is called with the running count of finished texts as batches return."""
+        if not texts:
+            return []
+        self._ensure_dispatcher()
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in texts]
+        if on_embedded:
+            done = 0
+            def _notify(future: asyncio.Future):
+                nonlocal done
+                if not future.cancelled() and future.exception() is None:
+                    done += 1
+                    on_embedded(done)
+            for future in futures:
+                future.add_done_callback(_notify)
+
+        self._pending.extend(
+            _PendingText(text=text, tokens=estimate_tokens(text), future=future)
+            for text, future in zip(texts, futures)
+        )
+        self._wakeup.set()
+
+        try:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    async def close(self):
+        """Stop dispatching, texts still pending or in flight fail with CancelledError"""
+        tasks = list(self._in_flight)
+        if self._dispatcher is not None:
+            tasks.append(self._dispatcher)
+            self._dispatcher = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for item in self._pending:
+            item.future.cancel()
+        self._pending.clear()
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="embedding-dispatcher")
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            if self.max_wait and len(self._pending) < self.max_batch_size:
+                await asyncio.sleep(self.max_wait)
+            while self._pending:
+                # Texts keep accumulating while every slot is busy, so batches grow under load
+                await self._slots.acquire()
+                batch = self._take_batch()
+                if not batch:
+                    self._slots.release()
+                    continue
+                task = asyncio.create_task(self._send(batch))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+            self._wakeup.clear()
+
+    def _take_batch(self) -> list[_PendingText]:
+        """Pop texts in arrival order until the token or size budget is reached"""
+        batch = []
+        tokens = 0
+        while self._pending and len(batch) < self.max_batch_size:
+            item = self._pending[0]
+            if item.future.done():
+                # The caller gave up on this text
+                self._pending.popleft()
+                continue
+            if batch and tokens + item.tokens > self.max_batch_tokens:
+                break
+            batch.append(self._pending.popleft())
+            tokens += item.tokens
+        return batch
+
+    async def _send(self, batch: list[_PendingText]):
+        try:
+            embeddings = await self._create_with_retry([item.text for item in batch])
+            for item, embedding in zip(batch, embeddings):
+                if not item.future.done():
+                    item.future.set_result(embedding)
+        except Exception as e:
+            error = e if isinstance(e, EmbeddingError) else EmbeddingError(f"Embedding generation failed: {str(e)}")
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(error)
+        except asyncio.CancelledError:
+            for item in batch:
+                item.future.cancel()
+            raise
+        finally:
+            self._slots.release()
+
+    async def _create_with_retry(self, texts: list[str]) -> list[list[float]]:
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.openai.embeddings.create(
+                    model=self.model,
+                    input=texts
+                )
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingError(
+                        f"Embedding generation failed after {attempt + 1} attempts: {str(e)}"
+                    ) from e
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt, e))
+
+        self.batches_sent += 1
+        embeddings = [item.embedding for item in response.data]
+        if len(embeddings) != len(texts):
+            raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Exponential backoff with jitter, never shorter than the server's Retry-After"""
+        delay = min(self.max_backoff, self.backoff_base * 2 ** attempt)
+        delay *= 0.5 + random.random() / 2
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+        return delay
@@ -0,0 +1,156 @@
+import asyncio
+import multiprocessing
+import resource
+import signal
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Optional, Union
+from unstructured.partition.auto import partition
+
+from processing.exceptions import ExtractionError
+
+# extra time the event loop waits past the in-worker deadline before it kills the pool
+KILL_GRACE_SECONDS = 5
+
+DocumentSource = Union[bytes, Path]
+
+# Restart cause of a pool whose worker died on its own, the job that killed it is unknown
+CRASHED = object()
+
+class _PoolRestarted(Exception):
+    """A job was lost to a pool restart, cause is what the pool was restarted for"""
+
+    def __init__(self, cause: object):
+        self.cause = cause
+
+def partition_text(source: DocumentSource) -> str:
+    """Extract text from raw document bytes or, without loading it first, a stored file"""
+    if isinstance(source, bytes):
+        elements = partition(file=BytesIO(source))
+    else:
+        elements = partition(filename=str(source))
+    return "\n\n".join([str(el) for el in elements])
+
+def _limit_memory(memory_limit_mb: int):
+    """Worker initializer capping the address space so a runaway parse fails with MemoryError"""
+    if memory_limit_mb > 0:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def _run_with_deadline(func: Callable, timeout: float, *args):
+    """Run func inside the worker, raising TimeoutError once the deadline passes"""
+    def _on_alarm(signum, frame):
+        raise TimeoutError(f"Extraction exceeded {timeout}s")
+
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+class ExtractionPool:
+    """Dedicated process pool running text extraction off the event loop"""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        timeout: float = 120.0,
+        memory_limit_mb: int = 4096,
+        max_tasks_per_child: int = 50,
+        extract_fn: Callable[[DocumentSource], str] = partition_text
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_tasks_per_child = max_tasks_per_child
+        self.extract_fn = extract_fn
+        self.restarts = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+        # Why each replaced pool was restarted: the job it was killed for, or CRASHED
+        self._restart_causes: weakref.WeakKeyDictionary[ProcessPoolExecutor, object] = weakref.WeakKeyDictionary()
+        self._crash_retries = asyncio.Lock()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # max_tasks_per_child recycles workers (unstructured leaks on long runs) and needs spawn
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_limit_memory,
+            initargs=(self.memory_limit_mb,),
+            max_tasks_per_child=self.max_tasks_per_child
+        )
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    async def extract(self, source: DocumentSource) -> str:
+        """Extract text in a worker process, bounded by the per-document timeout.
+        Pass a path for large files so only the path is sent to the worker.
+
+        Restarting the pool fails every job in it. Jobs caught in a restart caused by
+        another job are resubmitted to the new pool. After a crash nobody knows which job
+        caused it, so each job caught in one is retried once, alone, and the one that
+        crashes again fails."""
+        job = object()
+        crashed = False
+        while True:
+            try:
+                if not crashed:
+                    return await self._run(source, job)
+                async with self._crash_retries:
+                    return await self._run(source, job)
+            except _PoolRestarted as restarted:
+                if restarted.cause is CRASHED:
+                    if crashed:
+                        raise ExtractionError("Extraction worker crashed") from None
+                    crashed = True
+
+    async def _run(self, source: DocumentSource, job: object) -> str:
+        executor = self.executor
+        future = asyncio.wrap_future(
+            executor.submit(_run_with_deadline, self.extract_fn, self.timeout, source)
+        )
+        done, _ = await asyncio.wait({future}, timeout=self.timeout + KILL_GRACE_SECONDS)
+        if not done:
+            # The worker ignored its deadline (stuck in native code), the only way out is to kill it
+            self.restart(executor, cause=job)
+            raise ExtractionError(f"Text extraction timed out after {self.timeout}s")
+
+        # Cancelled when the pool was shut down before the job started
+        if future.cancelled() or isinstance(future.exception(), BrokenProcessPool):
+            # A worker died, most likely killed by the OS for its memory use, or the pool was killed
+            raise _PoolRestarted(self.restart(executor))
+        try:
+            return future.result()
+        except TimeoutError as e:
+            raise ExtractionError(f"Text extraction timed out after {self.timeout}s") from e
+        except MemoryError as e:
+            raise ExtractionError(f"Text extraction exceeded {self.memory_limit_mb}MB memory limit") from e
+
+    def restart(self, executor: ProcessPoolExecutor, cause: object = CRASHED) -> object:
+        """Kill the given pool's workers, the next extraction starts a fresh pool. Returns
+        what the pool was restarted for, as given by the first job to restart it."""
+        if executor is not self._executor:
+            # Another failed job already replaced this pool
+            return self._restart_causes.get(executor, CRASHED)
+        self._restart_causes[executor] = cause
+        self._executor = None
+        self.restarts += 1
+        # ProcessPoolExecutor has no public API to kill busy workers
+        for process in list((executor._processes or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+        return cause
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
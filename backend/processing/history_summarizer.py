@@ -0,0 +1,86 @@
+import asyncio
+from typing import Optional
+from openai import AsyncOpenAI
+
+from storage.conversation_store import ConversationStore
+from .conversation import split_summary, summary_message
+from .tokens import DEFAULT_MODEL, count_message_tokens
+
+SUMMARY_INSTRUCTIONS = """Summarize the conversation below for the assistant that continues it.
+Keep names, facts, decisions and open questions, drop pleasantries. Use at most a few sentences.
+If a previous summary is given, fold it into the new one."""
+
+class HistorySummarizer:
+    """Replaces a conversation's older turns with a rolling summary once its history grows
+    past trigger_tokens. Runs in the background, after the answer has been returned."""
+
+    def __init__(
+        self,
+        openai_client: AsyncOpenAI,
+        conversation_store: ConversationStore,
+        model: str = DEFAULT_MODEL,
+        trigger_tokens: int = 1500,
+        keep_recent: int = 4
+    ):
+        self.openai = openai_client
+        self.conversations = conversation_store
+        self.model = model
+        self.trigger_tokens = trigger_tokens
+        self.keep_recent = keep_recent
+        self.summaries = 0
+        self.failures = 0
+        self._in_flight: set[str] = set()
+        self._background: set[asyncio.Task] = set()
+
+    def schedule(self, conversation_id: str, history: list[dict[str, str]]):
+        """Start summarizing the conversation if its history is over the trigger"""
+        if conversation_id in self._in_flight or not self._needs_summary(history):
+            return
+        self._in_flight.add(conversation_id)
+        task = asyncio.create_task(self._summarize(conversation_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _needs_summary(self, history: list[dict[str, str]]) -> bool:
+        _, turns = split_summary(history)
+        if len(turns) <= self.keep_recent:
+            return False
+        return sum(count_message_tokens(message, self.model, history=True) for message in history) > self.trigger_tokens
+
+    async def _summarize(self, conversation_id: str):
+        try:
+            history = await self.conversations.get_history(conversation_id)
+            if not history or not self._needs_summary(history):
+                return
+            summary, turns = split_summary(history)
+            older = turns[:len(turns) - self.keep_recent]
+            new_summary = await self._create_summary(summary, older)
+
+            # Only swap in the summary if the summarized turns are still there unchanged
+            current = await self.conversations.get_history(conversation_id)
+            current_summary, current_turns = split_summary(current or [])
+            if current_summary != summary or current_turns[:len(older)] != older:
+                return
+            await self.conversations.update_history(
+                conversation_id,
+                [summary_message(new_summary)] + current_turns[len(older):]
+            )
+            self.summaries += 1
+        except Exception:
+            # The full history stays in place, the prompt budget still bounds it
+            self.failures += 1
+        finally:
+            self._in_flight.discard(conversation_id)
+
+    async def _create_summary(self, summary: Optional[dict[str, str]], turns: list[dict[str, str]]) -> str:
+        transcript = "\n".join(f"{message['role']}: {message['content']}" for message in turns)
+        if summary:
+            transcript = f"Previous summary: {summary['content']}\n\n{transcript}"
+        completion = await self.openai.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                {"role": "user", "content": transcript}
+            ]
+        )
+        return completion.choices[0].message.content
@@ -0,0 +1,147 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+from uuid import UUID
+
+from processing.doc_status import DocumentStatus
+from processing.exceptions import ProcessingError
+from processing.processor import DocumentProcessor
+from processing.progress import ProcessingProgress
+from storage.file_system_storage import SpooledFile
+
+@dataclass
+class IngestionJob:
+    doc_id: UUID
+    path: Path
+    progress: ProcessingProgress
+
+class IngestionQueue:
+    """In-process job queue feeding uploaded documents to a bounded pool of pipeline workers.
+
+    Every app worker runs one and any of them may queue a document, the processor's claim
+    on it decides which one processes it."""
+
+    def __init__(
+        self,
+        processor: DocumentProcessor,
+        workers: int = 2,
+        max_pending: int = 100,
+        max_tracked: int = 1000,
+        requeue_interval: float = 60
+    ):
+        self.processor = processor
+        self.storage = processor.storage
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_tracked = max_tracked
+        self.requeue_interval = requeue_interval
+        self.queue: Optional[asyncio.Queue] = None
+        self.progress: OrderedDict[str, ProcessingProgress] = OrderedDict()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        """Create the queue, spawn the workers on the running loop and keep queueing the
+        documents whose processing was never finished, by a previous run or by a worker
+        that stopped"""
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"ingestion-worker-{i}")
+            for i in range(self.workers)
+        ]
+        # In the background, the queue is bounded and there may be more than fit
+        self._tasks.append(asyncio.create_task(self._requeue_loop(), name="ingestion-requeue"))
+
+    async def stop(self):
+        """Cancel the workers. Jobs still queued stay pending in the metadata store and
+        interrupted ones keep a claim that lapses, any worker queues them again once
+        they are stale."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, spooled: SpooledFile, filename: str) -> tuple[UUID, bool]:
+        """Save a spooled upload and queue it for processing, returning its id and whether
+        it was queued. Identical content that was uploaded before is only queued again when
+        its processing never finished (lost in a restart, or the submit was cancelled while
+        waiting for room in the queue) and no live worker is on it."""
+        if self.queue is None:
+            self.storage.discard_spooled(spooled)
+            raise ProcessingError("Ingestion queue has not been started")
+
+        doc_id, created = await self.storage.save_or_get_spooled_document(spooled, filename)
+        if not created and not await self._unfinished(doc_id):
+            return doc_id, False
+        await self._enqueue(doc_id)
+        return doc_id, True
+
+    def get_progress(self, doc_id: str) -> Optional[ProcessingProgress]:
+        """Return live progress for a document processed by this worker, if tracked"""
+        return self.progress.get(doc_id)
+
+    @property
+    def pending(self) -> int:
+        return self.queue.qsize() if self.queue else 0
+
+    async def _unfinished(self, doc_id: UUID) -> bool:
+        """Whether a stored document still needs processing and is neither queued here nor
+        taken by a live worker"""
+        if self._queued_here(doc_id):
+            return False
+        doc = await self.storage.get_document_metadata(doc_id)
+        return doc is not None and self.storage.is_stale(doc)
+
+    def _queued_here(self, doc_id: UUID) -> bool:
+        progress = self.progress.get(str(doc_id))
+        return progress is not None and progress.end_time is None
+
+    async def _enqueue(self, doc_id: UUID):
+        progress = ProcessingProgress(doc_id=str(doc_id))
+        progress.update(0, DocumentStatus.PENDING.value)
+        self._track(progress)
+
+        # Jobs carry the stored file's path, never its contents
+        job = IngestionJob(doc_id=doc_id, path=self.storage.document_path(doc_id), progress=progress)
+        await self.queue.put(job)
+
+    async def _requeue_loop(self):
+        while True:
+            try:
+                await self._requeue_unfinished()
+            except Exception:
+                # The metadata store is unreachable, the next round retries
+                pass
+            await asyncio.sleep(self.requeue_interval)
+
+    async def _requeue_unfinished(self):
+        """Queue the documents no live worker is on. Another worker may have them queued as
+        well, whichever claims a document first processes it."""
+        for doc_id in await self.storage.get_stale_document_ids():
+            if not self._queued_here(doc_id):
+                await self._enqueue(doc_id)
+
+    def _track(self, progress: ProcessingProgress):
+        """Remember progress for the most recent jobs only, so memory stays bounded"""
+        self.progress[progress.doc_id] = progress
+        self.progress.move_to_end(progress.doc_id)
+        while len(self.progress) > self.max_tracked:
+            self.progress.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if not await self.processor.process_saved_document(job.doc_id, job.path, job.progress):
+                    # Finished or claimed by another worker, its status is the stored one
+                    self.progress.pop(str(job.doc_id), None)
+            except ProcessingError:
+                # The failure is recorded on the progress and in the metadata store
+                pass
+            except Exception as e:
+                job.progress.fail(str(e))
+            finally:
+                self.queue.task_done()
@@ -1,99 +1,232 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Optional
 from uuid import UUID, uuid4
 from openai import AsyncOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from unstructured.partition.auto import partition
-from io import BytesIO
 
 from processing.config import ProcessingConfig
 from processing.doc_status import DocumentStatus
 from processing.exceptions import ProcessingError, ExtractionError, EmbeddingError
+from processing.extraction import ExtractionPool, DocumentSource, partition_text
+from processing.embedding_batcher import EmbeddingBatcher
+from processing.progress import ProcessingProgress
 from storage.storage_manager import StorageManager
 from storage.storage_interface import ChunkMetadata
+from storage.embedding_cache import EmbeddingCache
 
 # this constant decides how many whitespace characters we control for in small file entries
 # too big and we will be running strip on unnecessarily large files
 # too small and a few whitespaces will result in the file being ignored for context
 WHITESPACE_COEFF = 2
 
+SEPARATORS = ["\n\n", "\n", ". ", " ", ""]
+
+def _split_text(text: str, chunk_size: int, chunk_overlap: int) -> list[str]:
+    """Split text into raw chunks, module level so it can run in a worker process"""
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=SEPARATORS
+    )
+    return splitter.split_text(text)
+
 class DocumentProcessor:
     def __init__(
         self,
         storage: StorageManager,
         openai_client: AsyncOpenAI,
-        config: ProcessingConfig
+        config: ProcessingConfig,
+        executor: Optional[Executor] = None,
+        extraction_pool: Optional[ExtractionPool] = None,
+        embedder: Optional[EmbeddingBatcher] = None,
+        embedding_cache: Optional[EmbeddingCache] = None
     ):
         self.storage = storage
         self.openai = openai_client
         self.config = config
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=config.chunk_size,
-            chunk_overlap=config.chunk_overlap,
-            separators=["\n\n", "\n", ". ", " ", ""]
+        # CPU-bound stages run here when set, inline otherwise; extraction prefers its own pool
+        self.executor = executor
+        self.extraction_pool = extraction_pool
+        self.embedder = embedder or EmbeddingBatcher(
+            openai_client=openai_client,
+            model=config.embedding_model,
+            max_batch_tokens=config.embedding_batch_tokens,
+            max_batch_size=config.embedding_batch_size,
+            max_concurrency=config.embedding_concurrency,
+            max_retries=config.max_retries
         )
+        self.embedding_cache = embedding_cache
 
     async def process_document(self, content: bytes, filename: str) -> UUID:
-        """Process a document through the entire pipeline"""
-        doc_id = None
+        """Process a document through the entire pipeline, identical uploads are only processed once"""
         try:
-            doc_id = await self.storage.save_document(content, filename)
+            doc_id, created = await self.storage.save_or_get_document(content, filename)
+        except Exception as e:
+            raise ProcessingError(f"Document processing failed: {str(e)}") from e
+
+        if created:
+            await self.process_saved_document(doc_id, content)
+        return doc_id
 
-            text = await self._extract_text(content, doc_id)
+    async def process_saved_document(
+        self,
+        doc_id: UUID,
+        source: DocumentSource,
+        progress: Optional[ProcessingProgress] = None
+    ) -> bool:
+        """Run extraction, chunking, embedding and storage for an already saved document,
+        source is either its bytes or the path it is stored at. The document is claimed
+        first, so no two workers process it at once: returns False without doing anything
+        when it is finished or another worker holds it."""
+        claim = await self.storage.claim_document(doc_id)
+        if claim is None:
+            return False
+        progress = progress or ProcessingProgress(doc_id=str(doc_id))
+        heartbeat = asyncio.create_task(self._keep_claim(doc_id, claim))
+        try:
+            text = await self._extract_text(source, doc_id, progress)
             
-            chunks = await self._create_chunks(text, doc_id)
+            chunks = await self._create_chunks(text, doc_id, progress)
             if not chunks:
                 raise ProcessingError("No valid chunks created")
+            progress.start(total_chunks=len(chunks))
             
             chunk_metadatas = [ChunkMetadata(id=uuid4(), document_id=doc_id, content=chunks[i], sequence=i) for i in range(len(chunks))]
 
-            # TODO: embeddings = await self._generate_embeddings(chunks, doc_id)
-            await self.storage.save_processed_chunks(doc_id, chunk_metadatas, [[0.0]]) # TODO: embeddings
+            embeddings = await self._generate_embeddings(chunks, doc_id, progress)
+            progress.update(len(chunks), DocumentStatus.STORING.value)
+            # Also marks the document completed, in the same transaction as its chunks
+            await self.storage.save_processed_chunks(doc_id, chunk_metadatas, embeddings, claim)
             
-            await self.storage.metadata.update_document_status(doc_id, DocumentStatus.COMPLETED.value)
-            return doc_id
+            progress.update(len(chunks), DocumentStatus.COMPLETED.value)
+            progress.complete()
 
         except Exception as e:
-            await self.storage.metadata.update_document_status(doc_id or "", DocumentStatus.FAILED.value)
-            if doc_id:
+            progress.update(progress.processed_chunks, DocumentStatus.FAILED.value)
+            progress.fail(str(e))
+            # After a lost claim the document belongs to the worker that took it over
+            if await self.storage.fail_document(doc_id, claim):
                 await self._cleanup_on_error(doc_id)
             raise ProcessingError(f"Document processing failed: {str(e)}") from e
+        finally:
+            heartbeat.cancel()
+        return True
+
+    async def _keep_claim(self, doc_id: UUID, claim: UUID):
+        """Renew the claim while the document is processed, a third of the lease apart"""
+        while True:
+            await asyncio.sleep(self.storage.claim_lease / 3)
+            try:
+                if not await self.storage.renew_claim(doc_id, claim):
+                    # Taken over, storing the chunks will fail with ClaimLostError
+                    return
+            except Exception:
+                # The next renewal retries before the lease runs out
+                pass
 
-    async def _extract_text(self, contents: bytes, doc_id: UUID) -> str:
+    async def _set_stage(
+        self,
+        doc_id: UUID,
+        status: DocumentStatus,
+        progress: Optional[ProcessingProgress]
+    ):
+        """Record the pipeline stage on the in-memory progress. The claim has already
+        marked the document extracting for other workers, the final status is written
+        with the chunks."""
+        if progress:
+            progress.update(progress.processed_chunks, status.value)
+
+    async def _run_cpu(self, func, *args):
+        """Run a CPU-bound function on the shared executor, or inline when there is none"""
+        if self.executor is None:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def _extract_text(
+        self,
+        source: DocumentSource,
+        doc_id: UUID,
+        progress: Optional[ProcessingProgress] = None
+    ) -> str:
         """Extract text from document content"""
-        await self.storage.metadata.update_document_status(doc_id, DocumentStatus.EXTRACTING.value)
+        await self._set_stage(doc_id, DocumentStatus.EXTRACTING, progress)
         try:
-            elements = partition(file=BytesIO(contents))
-            return "\n\n".join([str(el) for el in elements])
+            if self.extraction_pool:
+                return await self.extraction_pool.extract(source)
+            return await self._run_cpu(partition_text, source)
+        except ExtractionError:
+            raise
         except Exception as e:
             raise ExtractionError(f"Text extraction failed: {str(e)}") from e
 
 
-    async def _create_chunks(self, text: str, doc_id: UUID) -> list[ChunkMetadata]:
+    async def _create_chunks(
+        self,
+        text: str,
+        doc_id: UUID,
+        progress: Optional[ProcessingProgress] = None
+    ) -> list[str]:
         """Split text into chunks"""
-        await self.storage.metadata.update_document_status(doc_id, DocumentStatus.CHUNKING.value)
+        await self._set_stage(doc_id, DocumentStatus.CHUNKING, progress)
         
         if len(text) <= WHITESPACE_COEFF * self.config.min_chunk_size and len(text.strip()) <= self.config.min_chunk_size:
             # If entire text is shorter than min_chunk_size, return it as a single chunk
             return [text.strip()]
-        chunks = self.text_splitter.split_text(text)
+        chunks = await self._run_cpu(_split_text, text, self.config.chunk_size, self.config.chunk_overlap)
         return [chunk for chunk in chunks 
                 if len(chunk.strip()) >= self.config.min_chunk_size]
     
-    async def _generate_embeddings(self, texts: list[str], doc_id: UUID) -> list[list[float]]:
-        """Generate embeddings for chunks"""
-        await self.storage.metadata.update_document_status(doc_id, DocumentStatus.EMBEDDING.value)
+    async def _generate_embeddings(
+        self,
+        texts: list[str],
+        doc_id: UUID,
+        progress: Optional[ProcessingProgress] = None
+    ) -> list[list[float]]:
+        """Generate embeddings for chunks, batched with any other document being embedded"""
+        await self._set_stage(doc_id, DocumentStatus.EMBEDDING, progress)
+        on_embedded = None
+        if progress:
+            def on_embedded(done: int):
+                progress.update(done, DocumentStatus.EMBEDDING.value)
         try:
-            response = await self.openai.embeddings.create(
-                model=self.config.embedding_model,
-                input=texts
-            )
-            return [item.embedding for item in response.data]
+            if self.embedding_cache is None:
+                return await self.embedder.embed(texts, on_embedded=on_embedded)
+            return await self._embed_with_cache(texts, on_embedded)
+        except EmbeddingError:
+            raise
         except Exception as e:
             raise EmbeddingError(f"Embedding generation failed: {str(e)}") from e
 
+    async def _embed_with_cache(self, texts: list[str], on_embedded=None) -> list[list[float]]:
+        """Embed only the texts missing from the cache, then cache what was generated"""
+        model = self.config.embedding_model
+        embeddings = await self.embedding_cache.get_many(texts, model)
+        cached = sum(1 for embedding in embeddings if embedding is not None)
+        missing = list(dict.fromkeys(
+            text for text, embedding in zip(texts, embeddings) if embedding is None
+        ))
+
+        on_missing_embedded = None
+        if on_embedded:
+            on_embedded(cached)
+            def on_missing_embedded(done: int):
+                on_embedded(cached + done)
+
+        generated = await self.embedder.embed(missing, on_embedded=on_missing_embedded)
+        await self.embedding_cache.put_many(missing, generated, model)
+
+        by_text = dict(zip(missing, generated))
+        return [
+            embedding if embedding is not None else by_text[text]
+            for text, embedding in zip(texts, embeddings)
+        ]
+
     async def _cleanup_on_error(self, doc_id: UUID) -> None:
         """Clean up any stored data if processing fails"""
         try:
+            # Removes the document's chunk rows, vectors and file as well
             await self.storage.delete_document(doc_id)
-            await self.storage.delete_chunks(doc_id)
         except Exception:
             pass
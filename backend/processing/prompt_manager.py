@@ -1,5 +1,18 @@
+import re
 from typing import Optional
 
+from .conversation import split_summary
+from .tokens import (
+    CHARS_PER_TOKEN,
+    DEFAULT_MODEL,
+    REPLY_PRIMING_TOKENS,
+    count_message_tokens,
+    count_tokens
+)
+
+# Context blocks are formatted "[1] ...", "[2] ..." by QueryProcessor._format_context
+CONTEXT_BLOCK = re.compile(r"\n\n(?=\[\d+\] )")
+
 class PromptManager:
     DEFAULT_TEMPLATE = """Use the following context to answer the question.
 If the answer cannot be found in the context, respond with "I don't have enough information to answer that."
@@ -12,8 +25,18 @@ Question: {question}
 
 Answer:"""
 
-    def __init__(self, template: Optional[str] = None):
+    SYSTEM_PROMPT = "You are a helpful AI assistant. Answer questions based only on the provided context. Maintain conversation continuity."
+
+    def __init__(
+        self,
+        template: Optional[str] = None,
+        token_budget: Optional[int] = None,
+        model: str = DEFAULT_MODEL
+    ):
         self.template = template or self.DEFAULT_TEMPLATE
+        # Prompt tokens allowed per request, None sends everything
+        self.token_budget = token_budget
+        self.model = model
 
     def create_prompt(self, question: str, context: str) -> str:
         """Create a prompt by combining the question and context"""
@@ -28,22 +51,69 @@ Answer:"""
         context: str,
         history: Optional[list[dict[str, str]]] = None
     ) -> list[dict[str, str]]:
-        """Create chat messages with conversation history"""
+        """Create chat messages with conversation history.
+        With a token budget the question always fits, then as much of the context as fits,
+        then the rolling summary, then the most recent turns."""
         messages = [
             {
                 "role": "system",
-                "content": "You are a helpful AI assistant. Answer questions based only on the provided context. Maintain conversation continuity."
+                "content": self.SYSTEM_PROMPT
             }
         ]
 
-        
-        if history:
-            messages.extend(history)
+        if self.token_budget is None:
+            if history:
+                messages.extend(history)
+            messages.append({
+                "role": "user",
+                "content": self.create_prompt(question, context)
+            })
+            return messages
 
-        # Add current question with context
-        messages.append({
+        fixed = REPLY_PRIMING_TOKENS + self._tokens(messages[0])
+        question_message = {
             "role": "user",
-            "content": self.create_prompt(question, context)
-        })
+            "content": self.create_prompt(question, "")
+        }
+        context = self._fit_context(context, self.token_budget - fixed - self._tokens(question_message))
+        # Add current question with context
+        question_message["content"] = self.create_prompt(question, context)
+        remaining = self.token_budget - fixed - self._tokens(question_message)
+
+        summary, turns = split_summary(history or [])
+        if summary and self._tokens(summary, history=True) <= remaining:
+            messages.append(summary)
+            remaining -= self._tokens(summary, history=True)
+
+        # Newest turns first, stopping at the first that does not fit so history stays contiguous
+        recent = []
+        for message in reversed(turns):
+            tokens = self._tokens(message, history=True)
+            if tokens > remaining:
+                break
+            recent.append(message)
+            remaining -= tokens
+        messages.extend(reversed(recent))
 
+        messages.append(question_message)
         return messages
+
+    def _tokens(self, message: dict[str, str], history: bool = False) -> int:
+        return count_message_tokens(message, self.model, history=history)
+
+    def _fit_context(self, context: str, budget: int) -> str:
+        """Keep the leading, most relevant, context blocks that fit in budget tokens"""
+        if count_tokens(context, self.model) <= budget:
+            return context
+        kept = []
+        for block in CONTEXT_BLOCK.split(context):
+            # Blocks are joined back with two newlines, about one token
+            tokens = count_tokens(block, self.model) + 1
+            if tokens > budget:
+                if not kept:
+                    # Not even the best block fits whole, send its beginning
+                    kept.append(block[:max(0, budget) * CHARS_PER_TOKEN])
+                break
+            kept.append(block)
+            budget -= tokens
+        return "\n\n".join(kept)
@@ -1,77 +1,255 @@
+import asyncio
+from typing import Optional
 from openai import AsyncOpenAI
 
 from processing.config import ProcessingConfig
 from processing.exceptions import ProcessingError, EmbeddingError
 from storage.storage_manager import StorageManager
-from storage.storage_interface import ChunkMetadata
-from uuid import UUID
+from processing.embedding_batcher import EmbeddingBatcher
+from processing.reranker import Reranker
+from processing.response_cache import LRUCache, SingleFlight, normalize_question
+from processing.timing import LatencyBudget, LatencyStats
+from storage.embedding_cache import EmbeddingCache
+from storage.lexical_index import LexicalIndex
 
 class ChunkResult(dict):
     content: str
     document_id: str
     sequence: int
     embedding_id: str
+    score: float
 
 class QueryResult(dict):
     query: str
     chunks: list[ChunkResult]
     context: str
+    timings: dict[str, float]
+    degraded: bool
+
+def reciprocal_rank_fusion(rankings: list[list[ChunkResult]], limit: int, k: int = 60) -> list[ChunkResult]:
+    """Merge ranked lists by summing 1 / (k + rank), the fused score replaces each chunk's score"""
+    fused: dict[str, float] = {}
+    chunks: dict[str, ChunkResult] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            chunk_id = chunk["embedding_id"]
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1 / (k + rank)
+            chunks.setdefault(chunk_id, chunk)
+    best = sorted(fused, key=fused.get, reverse=True)[:limit]
+    return [ChunkResult({**chunks[chunk_id], "score": fused[chunk_id]}) for chunk_id in best]
 
 class QueryProcessor:
     def __init__(
         self,
         storage: StorageManager,
         openai_client: AsyncOpenAI,
-        config: ProcessingConfig
+        config: ProcessingConfig,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+        reranker: Optional[Reranker] = None,
+        embedder: Optional[EmbeddingBatcher] = None,
+        query_embeddings: Optional[LRUCache] = None
     ):
         self.storage = storage
         self.openai = openai_client
         self.config = config
+        self.embedding_cache = embedding_cache
+        self.lexical_index = lexical_index
+        self.reranker = reranker
+        # Query embeddings from concurrent requests share API calls when set
+        self.embedder = embedder
+        self.query_embeddings = query_embeddings
+        self._embedding_flight = SingleFlight()
+        self.latency = LatencyStats()
+        self._background: set[asyncio.Task] = set()
 
-    async def process_query(self, query: str, limit: int = 3) -> QueryResult:
-        """Process a query and retrieve relevant context"""
-        try:
-            # TODO: Fix query embedding generation
-            # Generate query embedding
-            query_embedding = None # await self._generate_embedding(query)
-            
-
-            # Retrieve relevant chunks
-            # chunks = await get_relevant_chunks(
-            #     embedding=query_embedding,
-            #     limit=limit
-            # )
-
-            
-            # if not chunks:
-            #     return {
-            #         "query": query,
-            #         "chunks": [],
-            #         "context": "",
-            #     }
-
-            # Format context from chunks
-            # context = self._format_context(chunks)
-            
-            return {
-                "query": query,
-                "chunks": None, #chunks,
-                "context": "", #context,
-            }
+    async def get_corpus_version(self) -> int:
+        return await self.storage.get_corpus_version()
 
-        except Exception as e:
-            raise ProcessingError(f"Query processing failed: {str(e)}") from e
+    async def embed_query(self, query: str) -> list[float]:
+        return await self._generate_embedding(query)
+
+    async def process_query(
+        self,
+        query: str,
+        limit: Optional[int] = None,
+        query_embedding: Optional[list[float]] = None
+    ) -> QueryResult:
+        """Retrieve the chunks most relevant to the query within the latency budget.
+
+        In hybrid mode BM25 and vector results are fused with reciprocal rank fusion. The
+        query is embedded unless the caller already did. When embedding or vector search
+        runs out of budget or fails, the query degrades to the lexical results alone, or
+        to no context without a lexical index, instead of failing. With a reranker,
+        rerank_candidates chunks are retrieved and reranked down to limit."""
+        limit = limit or self.config.retrieval_top_k
+        mode = self.config.retrieval_mode if self.lexical_index is not None else "vector"
+        # Retrieve a wider pool when a reranker picks the final chunks
+        pool = max(limit, self.config.rerank_candidates) if self.reranker else limit
+        candidates = max(self.config.retrieval_candidates, pool)
+        budget = LatencyBudget(self.config.retrieval_latency_budget_ms)
+        lexical: list[ChunkResult] = []
+        chunks: list[ChunkResult] = []
+        degraded = False
+
+        if mode != "vector":
+            with budget.stage("lexical"):
+                lexical = await self.get_lexical_chunks(query, limit=candidates)
+        if mode == "lexical":
+            chunks = lexical[:pool]
+        else:
+            try:
+                if query_embedding is None:
+                    with budget.stage("embed"):
+                        query_embedding = await asyncio.wait_for(
+                            self._generate_embedding(query), budget.remaining
+                        )
+                with budget.stage("search"):
+                    if mode == "hybrid":
+                        # Most vector candidates are dropped by fusion, only the kept ones need text
+                        vector = await asyncio.wait_for(
+                            self.get_relevant_chunks(query_embedding, limit=candidates, with_content=False),
+                            budget.remaining
+                        )
+                        chunks = await asyncio.wait_for(
+                            self._load_contents(reciprocal_rank_fusion([vector, lexical], pool, self.config.rrf_k)),
+                            budget.remaining
+                        )
+                    else:
+                        chunks = await asyncio.wait_for(
+                            self.get_relevant_chunks(query_embedding, limit=pool),
+                            budget.remaining
+                        )
+            except asyncio.TimeoutError:
+                degraded = True
+                chunks = lexical[:pool]
+            except Exception as e:
+                if mode != "hybrid":
+                    raise ProcessingError(f"Query processing failed: {str(e)}") from e
+                # Embedding API down, lexical results still answer identifier lookups
+                degraded = True
+                chunks = lexical[:pool]
+
+        if self.reranker and len(chunks) > 1:
+            with budget.stage("rerank"):
+                try:
+                    chunks = await asyncio.wait_for(
+                        self.reranker.rerank(query, chunks, limit), budget.remaining
+                    )
+                except Exception:
+                    # Retrieval order is still a usable ranking
+                    degraded = True
+        chunks = chunks[:limit]
+
+        with budget.stage("format"):
+            context = self._format_context(chunks)
+        budget.timings["total"] = round(budget.elapsed_ms, 3)
+        self.latency.record(budget.timings, degraded)
+
+        return {
+            "query": query,
+            "chunks": chunks,
+            "context": context,
+            "timings": budget.timings,
+            "degraded": degraded,
+        }
+
+    async def get_lexical_chunks(self, query: str, limit: int = 5) -> list[ChunkResult]:
+        """BM25 search over the local inverted index, no embedding needed. The search runs
+        on a worker thread, it walks posting lists as long as the corpus."""
+        # Polls the shared corpus version, which catches the index up with other workers
+        await self.storage.get_corpus_version()
+        results = []
+        for chunk_id, score in await asyncio.to_thread(self.lexical_index.search, query, limit):
+            chunk = self.lexical_index.chunks.get(chunk_id)
+            if chunk is None:
+                # Deleted since the search
+                continue
+            results.append(ChunkResult(
+                content=chunk.content,
+                document_id=chunk.document_id,
+                sequence=chunk.sequence,
+                embedding_id=chunk_id,
+                score=score
+            ))
+        return results
+
+    async def _load_contents(self, chunks: list[ChunkResult]) -> list[ChunkResult]:
+        """Fill in the content of chunks retrieved without it, from the lexical index's copy
+        when it has one, otherwise from the vector store. Chunks deleted in the meantime are dropped."""
+        missing = [chunk["embedding_id"] for chunk in chunks if chunk["content"] is None]
+        if not missing:
+            return chunks
+        contents = {}
+        if self.lexical_index is not None:
+            for chunk_id in missing:
+                indexed = self.lexical_index.chunks.get(chunk_id)
+                if indexed is not None:
+                    contents[chunk_id] = indexed.content
+        remaining = [chunk_id for chunk_id in missing if chunk_id not in contents]
+        if remaining:
+            contents.update(await self.storage.vectors.get_contents(remaining))
+        loaded = []
+        for chunk in chunks:
+            if chunk["content"] is None:
+                if chunk["embedding_id"] not in contents:
+                    continue
+                chunk["content"] = contents[chunk["embedding_id"]]
+            loaded.append(chunk)
+        return loaded
 
     async def _generate_embedding(self, text: str) -> list[float]:
-        """Generate embedding for a single text"""
+        """Generate embedding for a single query.
+
+        Queries are keyed by their normalized text: repeats are served from the
+        in-process LRU, and concurrent identical queries share a single lookup."""
+        key = normalize_question(text)
+        if self.query_embeddings is not None:
+            cached = self.query_embeddings.get(key)
+            if cached is not None:
+                return cached
+        return await self._embedding_flight.do(key, lambda: self._fetch_embedding(key, text))
+
+    async def _fetch_embedding(self, key: str, text: str) -> list[float]:
         try:
-            response = await self.openai.embeddings.create(
-                model=self.config.embedding_model,
-                input=[text]
-            )
-            return response.data[0].embedding
+            embedding = None
+            if self.embedding_cache:
+                embedding = await self.embedding_cache.get(text, self.config.embedding_model)
+
+            if embedding is None:
+                if self.embedder:
+                    embedding = (await self.embedder.embed([text]))[0]
+                else:
+                    response = await self.openai.embeddings.create(
+                        model=self.config.embedding_model,
+                        input=[text]
+                    )
+                    embedding = response.data[0].embedding
+                if self.embedding_cache:
+                    self._cache_in_background(text, embedding)
         except Exception as e:
             raise EmbeddingError(f"Failed to generate query embedding: {str(e)}") from e
+        if self.query_embeddings is not None:
+            self.query_embeddings.put(key, embedding)
+        return embedding
+
+    def embedding_stats(self) -> dict:
+        return {
+            "cache": self.query_embeddings.stats() if self.query_embeddings is not None else None,
+            "coalesced": self._embedding_flight.coalesced,
+            "requests": self.embedder.batches_sent if self.embedder else None
+        }
+
+    def _cache_in_background(self, text: str, embedding: list[float]):
+        """Write to the cache off the query path, a failed write only costs a future miss"""
+        async def _put():
+            try:
+                await self.embedding_cache.put(text, embedding, self.config.embedding_model)
+            except Exception:
+                pass
+        task = asyncio.create_task(_put())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
 
     def _format_context(self, chunks: list[ChunkResult]) -> str:
         """Format retrieved chunks into a single context string"""
@@ -80,24 +258,42 @@ class QueryProcessor:
             formatted_chunks.append(f"[{i}] {chunk['content']}")
         return "\n\n".join(formatted_chunks)
 
-    async def get_relevant_chunks(self, query_embedding: list[float], limit: int = 5) -> list[ChunkMetadata]:
-        """Get chunks relevant to the query using vector similarity search"""
+    async def get_relevant_chunks(
+        self,
+        query_embedding: list[float],
+        limit: int = 5,
+        min_similarity: Optional[float] = None,
+        with_content: bool = True
+    ) -> list[ChunkResult]:
+        """Get chunks relevant to the query using vector similarity search,
+        dropping matches below the similarity threshold. Without content each chunk's
+        content is None, see _load_contents."""
+        if min_similarity is None:
+            min_similarity = self.config.retrieval_min_similarity
         try:
-            search_results = await self.storage.vectors.search(query_embedding, limit=limit)
-            
-            # Process the search results into ChunkMetadata objects
+            if with_content:
+                search_results = await self.storage.vectors.search(query_embedding, limit=limit)
+            else:
+                search_results = await self.storage.vectors.search(
+                    query_embedding, limit=limit, include_documents=False
+                )
+
             chunks = []
             for i in range(len(search_results['ids'][0])):
-                chunk = ChunkMetadata(
-                    id=UUID(search_results['ids'][0][i]),
-                    document_id=UUID(search_results['metadatas'][0][i]['document_id']),
-                    sequence=search_results['metadatas'][0][i]['sequence'],
-                    content=search_results['documents'][0][i],
-                    embedding_id=search_results['ids'][0][i]
-                )
-                chunks.append(chunk)
-            
+                # The collection uses cosine distance
+                score = 1 - search_results['distances'][0][i]
+                if score < min_similarity:
+                    continue
+                metadata = search_results['metadatas'][0][i]
+                chunks.append(ChunkResult(
+                    content=search_results['documents'][0][i] if with_content else None,
+                    document_id=metadata['document_id'],
+                    sequence=metadata['sequence'],
+                    embedding_id=search_results['ids'][0][i],
+                    score=score
+                ))
+
             return chunks
 
         except Exception as e:
-            raise ProcessingError(f"Error retrieving relevant chunks: {str(e)}")
\ No newline at end of file
+            raise ProcessingError(f"Error retrieving relevant chunks: {str(e)}") from e
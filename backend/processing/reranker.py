@@ -0,0 +1,165 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Protocol
+
+from storage.lexical_index import tokenize
+
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it of on or our "
+    "so that the this to was we what when where which who why with you your".split()
+)
+
+@lru_cache(maxsize=4096)
+def passage_terms(passage: str) -> tuple[frozenset, str]:
+    """Terms and lowercased text of a passage, cached since popular chunks are reranked often"""
+    text = passage.lower()
+    return frozenset(tokenize(text)), text
+
+class Scorer(Protocol):
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        """Relevance of each (query, passage) pair, higher is better"""
+
+class OverlapScorer:
+    """Cheap lexical scorer: share of the query's terms, and of its adjacent term pairs
+    as phrases, that appear in the passage. Needs no model."""
+
+    def __init__(self, bigram_weight: float = 0.5):
+        self.bigram_weight = bigram_weight
+
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        terms_by_query: dict[str, tuple[set, list]] = {}
+        scores = []
+        for query, passage in pairs:
+            if query not in terms_by_query:
+                terms = [term for term in tokenize(query) if term not in STOPWORDS]
+                terms_by_query[query] = (set(terms), [f"{a} {b}" for a, b in zip(terms, terms[1:])])
+            terms, phrases = terms_by_query[query]
+            if not terms:
+                scores.append(0.0)
+                continue
+            passage_unigrams, text = passage_terms(passage)
+            score = len(terms & passage_unigrams) / len(terms)
+            if phrases:
+                score += self.bigram_weight * sum(phrase in text for phrase in phrases) / len(phrases)
+            scores.append(score)
+        return scores
+
+class CrossEncoderScorer:
+    """Local cross-encoder from sentence-transformers, run on the CPU"""
+
+    def __init__(self, model_name: str, batch_size: int = 32):
+        # Only needed when a rerank model is configured
+        from sentence_transformers import CrossEncoder
+        self.model = CrossEncoder(model_name, device="cpu")
+        self.batch_size = batch_size
+
+    def score(self, pairs: list[tuple[str, str]]) -> list[float]:
+        return self.model.predict(pairs, batch_size=self.batch_size).tolist()
+
+@dataclass
+class _PendingRerank:
+    query: str
+    passages: list[str]
+    future: asyncio.Future
+
+class Reranker:
+    """Reorders retrieved chunks with a CPU scorer.
+
+    Requests arriving within max_wait_ms of each other are scored together in one call
+    on a worker thread, up to max_batch_pairs pairs, so a model amortizes its per-call
+    overhead across concurrent queries. One batch is scored at a time, requests queue
+    behind it and form the next batch."""
+
+    def __init__(self, scorer: Optional[Scorer] = None, max_batch_pairs: int = 256, max_wait_ms: float = 2.0):
+        self.scorer = scorer or OverlapScorer()
+        self.max_batch_pairs = max_batch_pairs
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.pairs_scored = 0
+        self._pending: deque[_PendingRerank] = deque()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    async def rerank(self, query: str, chunks: list[dict], top_n: int) -> list[dict]:
+        """Return the top_n chunks by rerank score, which replaces each chunk's score"""
+        if len(chunks) <= 1:
+            return chunks[:top_n]
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_PendingRerank(query, [chunk["content"] for chunk in chunks], future))
+        self._wakeup.set()
+        try:
+            scores = await future
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        # Stable sort keeps retrieval order between equal scores
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)[:top_n]
+        return [{**chunks[i], "score": scores[i]} for i in order]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "pairs_scored": self.pairs_scored,
+            "pending": len(self._pending)
+        }
+
+    async def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            await asyncio.gather(self._dispatcher, return_exceptions=True)
+            self._dispatcher = None
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = asyncio.create_task(self._dispatch(), name="rerank-dispatcher")
+
+    async def _dispatch(self):
+        while True:
+            await self._wakeup.wait()
+            if self._pair_count() < self.max_batch_pairs:
+                # Give concurrent queries a moment to join the batch
+                await asyncio.sleep(self.max_wait)
+            self._wakeup.clear()
+            while self._pending:
+                await self._score(self._take_batch())
+
+    def _pair_count(self) -> int:
+        return sum(len(item.passages) for item in self._pending)
+
+    def _take_batch(self) -> list[_PendingRerank]:
+        batch = []
+        pairs = 0
+        while self._pending:
+            item = self._pending[0]
+            if item.future.done():
+                # The caller gave up on this query
+                self._pending.popleft()
+                continue
+            if batch and pairs + len(item.passages) > self.max_batch_pairs:
+                break
+            batch.append(self._pending.popleft())
+            pairs += len(item.passages)
+        return batch
+
+    async def _score(self, batch: list[_PendingRerank]):
+        if not batch:
+            return
+        pairs = [(item.query, passage) for item in batch for passage in item.passages]
+        try:
+            scores = await asyncio.to_thread(self.scorer.score, pairs)
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+        self.batches += 1
+        self.pairs_scored += len(pairs)
+        offset = 0
+        for item in batch:
+            if not item.future.done():
+                item.future.set_result(scores[offset:offset + len(item.passages)])
+            offset += len(item.passages)
@@ -0,0 +1,85 @@
+import asyncio
+import json
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+def normalize_question(question: str) -> str:
+    return " ".join(question.casefold().split())
+
+def history_hash(history: Optional[list[dict]]) -> str:
+    return sha256(json.dumps(history or [], sort_keys=True).encode("utf-8")).hexdigest()
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key onto one in-flight task. The task is
+    cancelled once every caller waiting on it has gone away."""
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # A caller that goes away must not cancel the call for the others waiting on it
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    # Nobody wants the result any more, later callers start a fresh call
+                    self._forget(key, task)
+                    task.cancel()
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+class LRUCache:
+    """Bounded in-process LRU with hit and miss counts"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, value: Any):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+class ResponseCache(LRUCache):
+    """Bounded LRU of recent answers keyed by exact request"""
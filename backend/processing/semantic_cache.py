@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import count
+from typing import Optional
+
+import numpy as np
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    context: str
+    chunks: list[dict]
+    corpus_version: int
+    created_at: float
+    latency_ms: float
+
+class SemanticCache:
+    """In-memory answer cache keyed by query embedding, a hit is any earlier query whose
+    cosine similarity clears the threshold. Entries belong to one corpus version, so an
+    upload or delete drops every answer computed against the old corpus."""
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl_seconds: float = 3600.0,
+        max_entries: int = 1000,
+        clock=time.monotonic
+    ):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+        self.corpus_version = 0
+        self.entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._vectors: dict[int, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: list[int] = []
+        self._keys = count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_latency_ms = 0.0
+
+    def lookup(self, embedding: list[float], corpus_version: int) -> Optional[CachedAnswer]:
+        """Return the most similar cached answer above the threshold, if any"""
+        self._sync_version(corpus_version)
+        self._expire()
+        key = self._nearest(embedding)
+        if key is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        entry = self.entries[key]
+        self.hits += 1
+        self.saved_latency_ms += entry.latency_ms
+        return entry
+
+    def store(
+        self,
+        embedding: list[float],
+        answer: str,
+        context: str,
+        chunks: list[dict],
+        corpus_version: int,
+        latency_ms: float
+    ):
+        """Cache an answer computed against the given corpus version"""
+        self._sync_version(corpus_version)
+        if corpus_version != self.corpus_version:
+            # Computed before an upload or delete finished, already stale
+            return
+        key = next(self._keys)
+        self.entries[key] = CachedAnswer(
+            answer=answer,
+            context=context,
+            chunks=chunks,
+            corpus_version=corpus_version,
+            created_at=self.clock(),
+            latency_ms=latency_ms
+        )
+        self._vectors[key] = self._normalize(embedding)
+        self._matrix = None
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "saved_latency_ms": round(self.saved_latency_ms, 3)
+        }
+
+    def _sync_version(self, corpus_version: int):
+        if corpus_version > self.corpus_version:
+            self.corpus_version = corpus_version
+            self.entries.clear()
+            self._vectors.clear()
+            self._matrix = None
+
+    def _expire(self):
+        cutoff = self.clock() - self.ttl_seconds
+        expired = [key for key, entry in self.entries.items() if entry.created_at <= cutoff]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key: int):
+        del self.entries[key]
+        del self._vectors[key]
+        self._matrix = None
+
+    def _nearest(self, embedding: list[float]) -> Optional[int]:
+        if not self.entries:
+            return None
+        if self._matrix is None:
+            # Rebuilt only after a store or removal, lookups reuse it
+            self._matrix_keys = list(self._vectors)
+            self._matrix = np.stack([self._vectors[key] for key in self._matrix_keys])
+        similarities = self._matrix @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.threshold:
+            return None
+        return self._matrix_keys[best]
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
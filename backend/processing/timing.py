@@ -0,0 +1,71 @@
+import math
+import time
+from collections import deque
+from contextlib import contextmanager
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list"""
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+class LatencyBudget:
+    """Per-stage wall time of a single request, measured against an overall budget"""
+
+    def __init__(self, budget_ms: float):
+        self.budget_ms = budget_ms
+        self.started = time.perf_counter()
+        self.timings: dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round((time.perf_counter() - start) * 1000, 3)
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left in the budget, never negative"""
+        return max(0.0, (self.budget_ms - self.elapsed_ms) / 1000)
+
+    @property
+    def exceeded(self) -> bool:
+        return self.elapsed_ms >= self.budget_ms
+
+class LatencyStats:
+    """Rolling per-stage latency over the most recent requests"""
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self.requests = 0
+        self.degraded = 0
+        self.samples: dict[str, deque] = {}
+
+    def record(self, timings: dict[str, float], degraded: bool = False):
+        self.requests += 1
+        if degraded:
+            self.degraded += 1
+        for stage, ms in timings.items():
+            self.samples.setdefault(stage, deque(maxlen=self.window)).append(ms)
+
+    def stats(self) -> dict:
+        stages = {}
+        for stage, samples in self.samples.items():
+            ordered = sorted(samples)
+            stages[stage] = {
+                "count": len(ordered),
+                "mean_ms": round(sum(ordered) / len(ordered), 3),
+                "p50_ms": percentile(ordered, 50),
+                "p99_ms": percentile(ordered, 99),
+                "max_ms": ordered[-1]
+            }
+        return {
+            "requests": self.requests,
+            "degraded": self.degraded,
+            "stages": stages
+        }
@@ -0,0 +1,66 @@
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # counts fall back to the estimate
+    tiktoken = None
+
+# OpenAI's rule of thumb for English text, good enough for packing request budgets
+CHARS_PER_TOKEN = 4
+
+# Chat format overhead, per message and for priming the assistant's reply
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+# History messages are recounted on every turn, their counts are cached. Contexts and
+# prompts are different each time and can be large, they are never cached.
+HISTORY_CACHE_SIZE = 4096
+HISTORY_CACHE_MAX_CHARS = 16_384
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-leaning estimate of the number of tokens in text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # The encoding files could not be loaded, e.g. offline
+        return None
+
+def load_encoding(model: str = DEFAULT_MODEL) -> bool:
+    """Load the model's tokenizer ahead of the first count. A cold tiktoken cache downloads
+    the encoding, so call it off the event loop at startup. False when counts will be estimates."""
+    return _encoding(model) is not None
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    """Token count from the model's tokenizer, or the estimate when tiktoken is unavailable"""
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+@lru_cache(maxsize=HISTORY_CACHE_SIZE)
+def _count_history_tokens(text: str, model: str) -> int:
+    return count_tokens(text, model)
+
+def count_message_tokens(message: dict[str, str], model: str = DEFAULT_MODEL, history: bool = False) -> int:
+    """Tokens a chat message takes up. Pass history=True for conversation history, whose
+    counts are cached as every turn recounts them."""
+    count = count_tokens
+    if history and len(message["content"]) <= HISTORY_CACHE_MAX_CHARS:
+        count = _count_history_tokens
+    tokens = MESSAGE_OVERHEAD_TOKENS + count(message["content"], model)
+    name: Optional[str] = message.get("name")
+    if name:
+        tokens += count_tokens(name, model)
+    return tokens
@@ -0,0 +1,98 @@
+import asyncio
+import tarfile
+import zipfile
+from contextlib import aclosing
+from functools import partial
+from pathlib import PurePosixPath
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Iterator, NamedTuple, Optional
+
+from .file_system_storage import UploadTooLargeError
+
+# Matched on the upload's file name, office formats such as .docx are zip files too
+ZIP_SUFFIXES = (".zip",)
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+Reader = Callable[[int], Awaitable[bytes]]
+
+class ArchiveLimits(NamedTuple):
+    """Caps on one archive: bytes per entry, bytes it expands to and number of entries"""
+    max_entry_bytes: Optional[int] = None
+    max_total_bytes: Optional[int] = None
+    max_entries: Optional[int] = None
+
+class ArchiveLimitError(ValueError):
+    """The archive expands to more bytes or entries than allowed"""
+    pass
+
+def is_archive(filename: Optional[str]) -> bool:
+    return bool(filename) and filename.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES)
+
+def entry_filename(name: str) -> Optional[str]:
+    """Name to store an archive entry under, None for entries that are not documents
+    (hidden files and macOS resource forks)"""
+    path = PurePosixPath(name.replace("\\", "/"))
+    if any(part.startswith(".") or part == "__MACOSX" for part in path.parts):
+        return None
+    return path.name or None
+
+def _zip_members(fileobj: BinaryIO) -> Iterator[tuple[str, int, Callable[[], BinaryIO]]]:
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            # Opened lazily, a skipped entry is never decompressed
+            yield info.filename, info.file_size, partial(archive.open, info)
+
+def _tar_members(fileobj: BinaryIO) -> Iterator[tuple[str, int, Callable[[], BinaryIO]]]:
+    # Stream mode reads the archive front to back and never seeks, compression is detected
+    with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                yield member.name, member.size, partial(archive.extractfile, member)
+
+async def _refuse(message: str, size: int) -> bytes:
+    raise UploadTooLargeError(message)
+
+async def _entries(fileobj: BinaryIO, filename: str, limits: ArchiveLimits) -> AsyncIterator[tuple[str, Reader]]:
+    is_zip = filename.lower().endswith(ZIP_SUFFIXES)
+    members = _zip_members(fileobj) if is_zip else _tar_members(fileobj)
+    count = 0
+    total_bytes = 0
+    try:
+        while (member := await asyncio.to_thread(next, members, None)) is not None:
+            name, size, open_entry = member
+            count += 1
+            if limits.max_entries is not None and count > limits.max_entries:
+                raise ArchiveLimitError(f"Archive has more than {limits.max_entries} files")
+            stored_name = entry_filename(name)
+            too_large = limits.max_entry_bytes is not None and size > limits.max_entry_bytes
+            # Sizes are the uncompressed ones from the entry headers, which the readers hold
+            # entries to. A zip jumps over skipped entries, a tar stream decompresses them too.
+            if not is_zip or (stored_name is not None and not too_large):
+                total_bytes += size
+                if limits.max_total_bytes is not None and total_bytes > limits.max_total_bytes:
+                    raise ArchiveLimitError(f"Archive expands to more than {limits.max_total_bytes} bytes")
+            if stored_name is None:
+                continue
+            if too_large:
+                # Reported by the caller like any other file that failed to store
+                yield stored_name, partial(_refuse, f"File is larger than {limits.max_entry_bytes} bytes")
+                continue
+            entry = await asyncio.to_thread(open_entry)
+            try:
+                yield stored_name, partial(asyncio.to_thread, entry.read)
+            finally:
+                entry.close()
+    finally:
+        await asyncio.to_thread(members.close)
+
+def archive_entries(fileobj: BinaryIO, filename: str, limits: ArchiveLimits = ArchiveLimits()) -> aclosing:
+    """Iterate (file name, read) over the files in a zip or tar archive, as an async
+    context manager so an abandoned iteration still closes the archive.
+
+    Entries are decompressed from fileobj as they are read, on worker threads since
+    reads block, so neither the archive nor an entry is ever held in memory. A read
+    function is only valid until the next entry is requested. Entries over
+    limits.max_entry_bytes are still listed, their read raises UploadTooLargeError;
+    an archive over the other limits stops with ArchiveLimitError."""
+    return aclosing(_entries(fileobj, filename, limits))
@@ -0,0 +1,123 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Optional
+
+from processing.conversation import ConversationManager, trim_history
+from .metadata_store import MetadataStore
+
+class ConversationStore(ABC):
+    """Conversation history backend. Every method is async so shared backends can sit behind it."""
+
+    def __init__(self, max_history: int = 20, expiry_minutes: float = 60):
+        self.max_history = max_history
+        self.expiry_minutes = expiry_minutes
+
+    @abstractmethod
+    async def get_history(self, conversation_id: str) -> Optional[list[dict[str, str]]]:
+        """Get conversation history if it exists and refresh its expiry"""
+
+    @abstractmethod
+    async def update_history(self, conversation_id: str, messages: list[dict[str, str]]):
+        """Replace conversation history, keeping only the most recent max_history messages"""
+
+    async def start(self):
+        """Start background work the backend needs, if any"""
+
+    async def close(self):
+        """Stop background work and release connections"""
+
+    def _trim(self, messages: list[dict[str, str]]) -> list[dict[str, str]]:
+        return trim_history(messages, self.max_history)
+
+class InMemoryConversationStore(ConversationStore):
+    """Process-local history, lost on restart and not shared between workers"""
+
+    def __init__(self, manager: Optional[ConversationManager] = None, max_history: int = 20, expiry_minutes: float = 60):
+        super().__init__(max_history, expiry_minutes)
+        self.manager = manager or ConversationManager(max_history=max_history, expiry_minutes=expiry_minutes)
+
+    async def get_history(self, conversation_id: str) -> Optional[list[dict[str, str]]]:
+        return self.manager.get_history(conversation_id)
+
+    async def update_history(self, conversation_id: str, messages: list[dict[str, str]]):
+        self.manager.update_history(conversation_id, messages)
+
+    async def start(self):
+        await self.manager.start()
+
+    async def close(self):
+        await self.manager.stop()
+
+class SqlConversationStore(ConversationStore):
+    """History in the metadata database, shared by every worker. Reads ignore expired rows,
+    a periodic task deletes them through the expires_at index."""
+
+    def __init__(
+        self,
+        metadata_store: MetadataStore,
+        max_history: int = 20,
+        expiry_minutes: float = 60,
+        cleanup_interval: float = 60
+    ):
+        super().__init__(max_history, expiry_minutes)
+        self.metadata = metadata_store
+        self.cleanup_interval = cleanup_interval
+        self._cleanup_task: Optional[asyncio.Task] = None
+
+    def _expires_at(self) -> datetime:
+        return datetime.now() + timedelta(minutes=self.expiry_minutes)
+
+    async def get_history(self, conversation_id: str) -> Optional[list[dict[str, str]]]:
+        return await self.metadata.get_conversation(conversation_id, self._expires_at())
+
+    async def update_history(self, conversation_id: str, messages: list[dict[str, str]]):
+        await self.metadata.save_conversation(conversation_id, self._trim(messages), self._expires_at())
+
+    async def delete_expired(self) -> int:
+        return await self.metadata.delete_expired_conversations()
+
+    async def start(self):
+        if self._cleanup_task is None:
+            self._cleanup_task = asyncio.create_task(self._cleanup_loop())
+
+    async def close(self):
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            await asyncio.gather(self._cleanup_task, return_exceptions=True)
+            self._cleanup_task = None
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                await self.delete_expired()
+            except Exception:
+                # Expired rows are already invisible to reads, the next run retries
+                pass
+
+class RedisConversationStore(ConversationStore):
+    """History in Redis (or any server speaking its protocol), expiry handled by key TTLs"""
+
+    KEY_PREFIX = "conversation:"
+
+    def __init__(self, url: Optional[str] = None, client=None, max_history: int = 20, expiry_minutes: float = 60):
+        super().__init__(max_history, expiry_minutes)
+        if client is None:
+            # Only needed when this backend is selected
+            from redis import asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.ttl = max(1, int(expiry_minutes * 60))
+
+    async def get_history(self, conversation_id: str) -> Optional[list[dict[str, str]]]:
+        # GETEX reads and refreshes the TTL in one round trip
+        data = await self.client.getex(self.KEY_PREFIX + conversation_id, ex=self.ttl)
+        return json.loads(data) if data is not None else None
+
+    async def update_history(self, conversation_id: str, messages: list[dict[str, str]]):
+        await self.client.set(self.KEY_PREFIX + conversation_id, json.dumps(self._trim(messages)), ex=self.ttl)
+
+    async def close(self):
+        await self.client.aclose()
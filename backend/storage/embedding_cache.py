@@ -0,0 +1,67 @@
+from array import array
+from hashlib import sha256
+from typing import Optional
+from .metadata_store import MetadataStore
+
+def content_hash(text: str) -> str:
+    return sha256(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (sha256 of the text, embedding model), with LRU eviction"""
+
+    def __init__(self, metadata_store: MetadataStore, max_entries: int = 500_000, evict_every: int = 1000):
+        self.metadata = metadata_store
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._inserted_since_eviction = 0
+
+    async def get_many(self, texts: list[str], model: str) -> list[Optional[list[float]]]:
+        """Return the cached embedding for each text, None where it is not cached"""
+        if not texts:
+            return []
+        hashes = [content_hash(text) for text in texts]
+        found = await self.metadata.get_cached_embeddings(model, list(set(hashes)))
+        results = [self._decode(found[h]) if h in found else None for h in hashes]
+        hits = sum(1 for result in results if result is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    async def get(self, text: str, model: str) -> Optional[list[float]]:
+        return (await self.get_many([text], model))[0]
+
+    async def put_many(self, texts: list[str], embeddings: list[list[float]], model: str):
+        entries = {content_hash(text): self._encode(embedding) for text, embedding in zip(texts, embeddings)}
+        if not entries:
+            return
+        await self.metadata.save_cached_embeddings(model, entries)
+        self._inserted_since_eviction += len(entries)
+        if self._inserted_since_eviction >= self.evict_every:
+            self._inserted_since_eviction = 0
+            self.evictions += await self.metadata.evict_cached_embeddings(self.max_entries)
+
+    async def put(self, text: str, embedding: list[float], model: str):
+        await self.put_many([text], [embedding], model)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions
+        }
+
+    @staticmethod
+    def _encode(embedding: list[float]) -> bytes:
+        # float32 halves the storage and matches the precision the vector store keeps
+        return array("f", embedding).tobytes()
+
+    @staticmethod
+    def _decode(data: bytes) -> list[float]:
+        values = array("f")
+        values.frombytes(data)
+        return values.tolist()
@@ -2,10 +2,29 @@ from aiofiles import open
 # TODO: revise use of shutil in case it is used to save or update files,
 # as it does not work consistently between MacOS and other systems
 import shutil
-from uuid import UUID
+import os
+from dataclasses import dataclass
+from hashlib import sha256
+from typing import Awaitable, Callable, Optional
+from uuid import UUID, uuid4
 from pathlib import Path
 from .storage_interface import StorageInterface, DocumentMetadata
 
+# enough leading bytes for libmagic to identify the formats we accept
+MIME_SNIFF_BYTES = 8192
+
+class UploadTooLargeError(ValueError):
+    """An upload or archive entry is over the size limit"""
+    pass
+
+@dataclass
+class SpooledFile:
+    """An upload streamed to a temp file, with what was learnt while streaming it"""
+    path: Path
+    size_bytes: int
+    content_hash: str
+    head: bytes
+
 class FileSystemStorage(StorageInterface):
     def __init__(self, base_path: str):
         self.base_path = Path(base_path)
@@ -30,6 +49,52 @@ class FileSystemStorage(StorageInterface):
             
         return metadata.id
     
+    async def spool(
+        self,
+        read: Callable[[int], Awaitable[bytes]],
+        buffer_size: int,
+        max_bytes: Optional[int] = None
+    ) -> SpooledFile:
+        """Stream a file to the temp folder buffer_size bytes at a time, hashing it on the way.
+        Stops with UploadTooLargeError as soon as more than max_bytes have been read."""
+        path = self.temp_path / str(uuid4())
+        hasher = sha256()
+        size_bytes = 0
+        head = b""
+        try:
+            async with open(path, "wb") as f:
+                while chunk := await read(buffer_size):
+                    hasher.update(chunk)
+                    size_bytes += len(chunk)
+                    if max_bytes is not None and size_bytes > max_bytes:
+                        raise UploadTooLargeError(f"File is larger than {max_bytes} bytes")
+                    if len(head) < MIME_SNIFF_BYTES:
+                        head += chunk[:MIME_SNIFF_BYTES - len(head)]
+                    await f.write(chunk)
+        except Exception as e:
+            path.unlink(missing_ok=True)
+            raise e
+        return SpooledFile(path=path, size_bytes=size_bytes, content_hash=hasher.hexdigest(), head=head)
+
+    async def save_spooled_document(self, spooled: SpooledFile, metadata: DocumentMetadata) -> UUID:
+        """Move a spooled upload into place, the temp folder shares the filesystem so no copy is made"""
+        doc_path = self.docs_path / str(metadata.id)
+        doc_path.mkdir(exist_ok=True)
+
+        os.replace(spooled.path, doc_path / "original")
+
+        async with open(doc_path / "metadata.json", "w") as f:
+            await f.write(metadata.model_dump_json())
+
+        return metadata.id
+
+    def discard_spooled(self, spooled: SpooledFile):
+        spooled.path.unlink(missing_ok=True)
+
+    def document_path(self, doc_id: UUID) -> Path:
+        """Path of the stored original file"""
+        return self.docs_path / str(doc_id) / "original"
+
     async def delete_document(self, doc_id: UUID) -> bool:
         doc_path = self.docs_path / str(doc_id)
         try:
@@ -0,0 +1,239 @@
+import asyncio
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from operator import itemgetter
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from uuid import UUID
+
+from .storage_interface import ChunkMetadata, ChunkRecord
+
+# Identifiers such as "INC-20431" or "v2.3.1" stay whole, their parts are indexed as well
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+PART_SEPARATOR = re.compile(r"[-./]")
+
+def tokenize(text: str) -> list[str]:
+    if "-" not in text and "." not in text and "/" not in text:
+        return TOKEN_PATTERN.findall(text.lower())
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if PART_SEPARATOR.search(token):
+            tokens.extend(part for part in PART_SEPARATOR.split(token) if part)
+    return tokens
+
+# Slots: one of these is kept per chunk in the corpus
+@dataclass(slots=True)
+class IndexedChunk:
+    document_id: str
+    sequence: int
+    content: str
+    length: int
+
+class LexicalIndex:
+    """In-memory BM25 inverted index over chunk contents, updated incrementally as documents
+    are stored and deleted, and persisted to a JSON file in the background.
+
+    Every worker process holds its own copy. Changes made by other workers reach it through
+    reconcile, which StorageManager runs whenever the shared corpus version moves, so the
+    snapshot each of them saves to the same file is a recent copy of the same corpus.
+
+    Searches and updates take a lock so they can run on worker threads, off the event loop."""
+
+    FORMAT_VERSION = 1
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+        flush_interval: float = 30,
+        min_idf: float = 0.01
+    ):
+        self.path = Path(path) if path else None
+        self.k1 = k1
+        self.b = b
+        self.flush_interval = flush_interval
+        self.min_idf = min_idf
+        self.postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self.chunks: dict[str, IndexedChunk] = {}
+        # Token counts by chunk id, kept apart from chunks for the search loop
+        self.lengths: dict[str, int] = {}
+        self.document_chunks: dict[str, list[str]] = defaultdict(list)
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    def add_chunks(self, chunks: list[ChunkMetadata]):
+        with self._lock:
+            for chunk in chunks:
+                chunk_id = str(chunk.id)
+                if chunk_id in self.chunks:
+                    self._remove_chunk(chunk_id)
+                self._add(chunk_id, str(chunk.document_id), chunk.sequence, chunk.content)
+            self.dirty = True
+
+    def remove_document(self, doc_id: UUID):
+        with self._lock:
+            for chunk_id in self.document_chunks.pop(str(doc_id), []):
+                self._remove_chunk(chunk_id, forget_document=False)
+            self.dirty = True
+
+    def search(self, query: str, limit: int = 5) -> list[tuple[str, float]]:
+        """Return up to limit (chunk id, BM25 score) pairs, best first.
+
+        Terms found in nearly every chunk (idf below min_idf) barely move the ranking
+        but would walk the whole corpus, so they are skipped. This walks posting lists
+        of up to the corpus size, call it from a worker thread."""
+        with self._lock:
+            return self._search(query, limit)
+
+    def _search(self, query: str, limit: int) -> list[tuple[str, float]]:
+        if not self.chunks:
+            return []
+        count = len(self.chunks)
+        lengths = self.lengths
+        # Hoisted BM25 length normalization: k1 * (1 - b + b * length / average_length)
+        base = self.k1 * (1 - self.b)
+        per_token = self.k1 * self.b * count / self.total_length if self.total_length else 0.0
+        scores: dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if idf < self.min_idf:
+                continue
+            weight = idf * (self.k1 + 1)
+            for chunk_id, frequency in postings.items():
+                scores[chunk_id] += weight * frequency / (frequency + base + per_token * lengths[chunk_id])
+        return heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+
+    def _add(self, chunk_id: str, document_id: str, sequence: int, content: str):
+        frequencies = Counter(tokenize(content))
+        length = sum(frequencies.values())
+        self.chunks[chunk_id] = IndexedChunk(document_id, sequence, content, length)
+        self.lengths[chunk_id] = length
+        self.document_chunks[document_id].append(chunk_id)
+        self.total_length += length
+        for term, frequency in frequencies.items():
+            self.postings[term][chunk_id] = frequency
+
+    def _remove_chunk(self, chunk_id: str, forget_document: bool = True):
+        chunk = self.chunks.pop(chunk_id)
+        del self.lengths[chunk_id]
+        self.total_length -= chunk.length
+        # Re-tokenizing is cheaper than keeping every chunk's term list in memory
+        for term in set(tokenize(chunk.content)):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self.postings[term]
+        if forget_document:
+            siblings = self.document_chunks.get(chunk.document_id, [])
+            if chunk_id in siblings:
+                siblings.remove(chunk_id)
+            if not siblings:
+                self.document_chunks.pop(chunk.document_id, None)
+
+    def save(self):
+        """Write the index atomically, postings are rebuilt on load"""
+        if self.path is not None:
+            self._write(self._snapshot())
+
+    def _snapshot(self) -> dict:
+        # Under the lock so a snapshot never sees the index mid-update
+        with self._lock:
+            self.dirty = False
+            return {
+                "version": self.FORMAT_VERSION,
+                "chunks": [
+                    [chunk_id, chunk.document_id, chunk.sequence, chunk.content]
+                    for chunk_id, chunk in self.chunks.items()
+                ]
+            }
+
+    def _write(self, data: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Every worker process saves to the same path, each writes its own temporary file
+        temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path)
+
+    def load(self) -> bool:
+        """Load a saved index, returns False when there is none to load"""
+        if self.path is None or not self.path.exists():
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != self.FORMAT_VERSION:
+            return False
+        for chunk_id, document_id, sequence, content in data["chunks"]:
+            self._add(chunk_id, document_id, sequence, content)
+        return True
+
+    async def initialize(self):
+        """Load the saved index, then start flushing. The saved index lags the database
+        after a crash between flushes, reconcile it before serving searches."""
+        self.load()
+        if self._flush_task is None and self.path is not None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def reconcile(
+        self,
+        chunk_ids: AsyncIterator[UUID],
+        load_chunks: Callable[[list[UUID]], Awaitable[list[ChunkRecord]]]
+    ):
+        """Make the index hold exactly the stored chunks, given the ids of all of them.
+        Chunks never change once stored: only the ones missing from the index are read,
+        through load_chunks, and the ones no longer stored are removed. Without a saved
+        index this rebuilds it."""
+        stored = set()
+        missing = []
+        async for chunk_id in chunk_ids:
+            stored.add(str(chunk_id))
+            if str(chunk_id) not in self.chunks:
+                missing.append(chunk_id)
+        added = await load_chunks(missing) if missing else []
+        await asyncio.to_thread(self._replace_with, stored, added)
+
+    def _replace_with(self, stored: set[str], added: list[ChunkRecord]):
+        with self._lock:
+            removed = [chunk_id for chunk_id in self.chunks if chunk_id not in stored]
+            for chunk_id in removed:
+                self._remove_chunk(chunk_id)
+            for chunk in added:
+                if str(chunk.id) not in self.chunks:
+                    self._add(str(chunk.id), str(chunk.document_id), chunk.sequence, chunk.content)
+            if removed or added:
+                self.dirty = True
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if self.dirty:
+            self.save()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.dirty:
+                try:
+                    await asyncio.to_thread(self.save)
+                except OSError:
+                    # The index stays in memory, the next flush retries
+                    self.dirty = True
@@ -1,16 +1,136 @@
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.sql import delete
-from storage.storage_interface import Base, DocumentMetadata, ChunkMetadata
-from uuid import UUID
+from sqlalchemy.sql import and_, delete, func, insert, or_, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from storage.storage_interface import Base, DocumentMetadata, ChunkMetadata, ChunkRecord, CorpusState, EmbeddingCacheEntry, Conversation
+from storage.pool_metrics import PoolMetrics
+from storage.migrations import upgrade_schema
+from uuid import UUID, uuid4
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+from datetime import datetime, timedelta
 
 # TODO: the class currently handles basic errors naively, the error handling should be made specific
-# and the structure of the class should be made to enable atomicity with concurrent operations
-# Inserting/deleting a document's metadata should come with a guaranteed insertion/deletion of all associated chunks
-# and vice versa
+
+CHUNK_COLUMNS = ("id", "document_id", "content", "sequence", "created_at", "embedding_id")
+# Rows per executemany call, SQLAlchemy packs each call into multi-row INSERT statements
+INSERT_BATCH_SIZE = 5000
+# Below this COPY's setup costs more than the INSERTs it replaces
+COPY_MIN_ROWS = 1000
+CORPUS_STATE_ID = 1
+
+class ClaimLostError(ValueError):
+    """The document is no longer claimed by the caller, its lease ran out and another
+    worker took it over"""
+    pass
+
+class UnitOfWork:
+    """Metadata writes staged on one session and committed together, see MetadataStore.unit_of_work"""
+
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def save_chunks(self, chunks: list[ChunkMetadata]):
+        """Bulk insert of chunk rows without ORM instances, identity map or per-row INSERTs:
+        COPY on asyncpg for large batches, multi-row INSERTs through Core otherwise"""
+        if not chunks:
+            return
+        now = datetime.now()
+        rows = [
+            (chunk.id, chunk.document_id, chunk.content, chunk.sequence, chunk.created_at or now, chunk.embedding_id)
+            for chunk in chunks
+        ]
+        connection = await self.session.connection()
+        if connection.dialect.driver == "asyncpg" and len(rows) >= COPY_MIN_ROWS:
+            # The driver adapter only sends BEGIN with the first statement, COPY bypasses it
+            await connection.execute(select(1))
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                ChunkMetadata.__tablename__, records=rows, columns=CHUNK_COLUMNS
+            )
+            return
+        statement = insert(ChunkMetadata.__table__)
+        for start in range(0, len(rows), INSERT_BATCH_SIZE):
+            await self.session.execute(
+                statement,
+                [dict(zip(CHUNK_COLUMNS, row)) for row in rows[start:start + INSERT_BATCH_SIZE]]
+            )
+
+    async def update_document_status(self, doc_id: UUID, status: str):
+        # A single UPDATE, no need to load the row first
+        result = await self.session.execute(
+            update(DocumentMetadata).where(DocumentMetadata.id == doc_id).values(status=status)
+        )
+        if result.rowcount == 0:
+            raise ValueError(f"Document {doc_id} not found.")
+
+    async def hold_claim(self, doc_id: UUID, claim: UUID):
+        """Check the caller still holds its claim on the document. The row stays locked
+        until commit, so no other worker can take the document over in the meantime."""
+        result = await self.session.execute(
+            update(DocumentMetadata)
+            .where(DocumentMetadata.id == doc_id, DocumentMetadata.claim_id == claim)
+            .values(claim_id=claim)
+        )
+        if result.rowcount == 0:
+            raise ClaimLostError(f"Document {doc_id} is no longer claimed by this worker.")
+
+    async def release_claim(self, doc_id: UUID, claim: UUID, status: str):
+        """Set the final status of a claimed document and drop the claim"""
+        result = await self.session.execute(
+            update(DocumentMetadata)
+            .where(DocumentMetadata.id == doc_id, DocumentMetadata.claim_id == claim)
+            .values(status=status, claim_id=None, claim_expires_at=None)
+        )
+        if result.rowcount == 0:
+            raise ClaimLostError(f"Document {doc_id} is no longer claimed by this worker.")
+
+    async def delete_document_metadata(self, doc_id: UUID):
+        result = await self.session.execute(
+            delete(DocumentMetadata).where(DocumentMetadata.id == doc_id)
+        )
+        if result.rowcount == 0:
+            raise ValueError(f"Document {doc_id} not found.")
+
+    async def delete_chunks(self, doc_id: UUID) -> int:
+        result = await self.session.execute(
+            delete(ChunkMetadata).where(ChunkMetadata.document_id == doc_id)
+        )
+        return result.rowcount
+
+    async def bump_corpus_version(self) -> int:
+        """Count a change to the searchable corpus and return the new version. The row stays
+        locked until commit, so this goes last in the transaction."""
+        version = await self.session.scalar(
+            update(CorpusState)
+            .where(CorpusState.id == CORPUS_STATE_ID)
+            .values(version=CorpusState.version + 1)
+            .returning(CorpusState.version)
+        )
+        if version is None:
+            # Databases made by initialize() start without the row
+            await self.session.execute(insert(CorpusState).values(id=CORPUS_STATE_ID, version=1))
+            version = 1
+        return version
 
 class MetadataStore:
-    def __init__(self, db_url: str):
-        self.engine = create_async_engine(db_url)
+    def __init__(
+        self,
+        db_url: str,
+        pool_size: int = 10,
+        max_overflow: int = 20,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = True,
+        statement_timeout_ms: int = 30_000,
+        prepared_statement_cache_size: int = 256
+    ):
+        self.metrics = PoolMetrics()
+        self.engine = create_async_engine(db_url, **self._engine_options(
+            db_url, pool_size, max_overflow, pool_timeout, pool_recycle,
+            pool_pre_ping, statement_timeout_ms, prepared_statement_cache_size
+        ))
+        self.metrics.attach(self.engine)
         self.session_local = async_sessionmaker(
             autocommit=False,
             autoflush=False,
@@ -19,10 +139,58 @@ class MetadataStore:
             expire_on_commit=False
         )
     
+    def _engine_options(
+        self,
+        db_url: str,
+        pool_size: int,
+        max_overflow: int,
+        pool_timeout: float,
+        pool_recycle: int,
+        pool_pre_ping: bool,
+        statement_timeout_ms: int,
+        prepared_statement_cache_size: int
+    ) -> dict:
+        url = make_url(db_url)
+        if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+            # In-memory SQLite lives in a single connection, there is no pool to tune
+            return {}
+        options = {
+            "poolclass": self.metrics.pool_class(),
+            "pool_size": pool_size,
+            "max_overflow": max_overflow,
+            "pool_timeout": pool_timeout,
+            "pool_recycle": pool_recycle,
+            "pool_pre_ping": pool_pre_ping
+        }
+        if url.get_driver_name() == "asyncpg":
+            options["connect_args"] = {
+                # Statements are prepared once per connection and reused from this cache
+                "prepared_statement_cache_size": prepared_statement_cache_size,
+                "server_settings": {"statement_timeout": str(statement_timeout_ms)}
+            }
+        return options
+
+    def pool_stats(self) -> dict:
+        return self.metrics.stats(self.engine.sync_engine.pool)
+
+    @asynccontextmanager
+    async def unit_of_work(self) -> AsyncIterator[UnitOfWork]:
+        """One transaction for several writes: committed when the block exits normally,
+        rolled back if it raises"""
+        async with self.session_local() as session:
+            async with session.begin():
+                yield UnitOfWork(session)
+
     async def initialize(self):
-        """Create all tables on startup"""
+        """Create all tables straight from the models, for throwaway databases.
+        Deployed databases are kept current with migrate."""
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+
+    async def migrate(self, revision: str = "head"):
+        """Apply the Alembic migrations in backend/migrations up to revision"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(upgrade_schema, revision)
                     
     async def save_document_metadata(self, metadata: DocumentMetadata):
         async with self.session_local() as session:
@@ -33,49 +201,308 @@ class MetadataStore:
                 await session.rollback()
                 raise e
     
+    async def get_document_metadata(self, doc_id: UUID) -> Optional[DocumentMetadata]:
+        async with self.session_local() as session:
+            return await session.get(DocumentMetadata, doc_id)
+    
+    async def get_document_by_hash(self, content_hash: str) -> Optional[DocumentMetadata]:
+        async with self.session_local() as session:
+            return await session.scalar(
+                select(DocumentMetadata).where(DocumentMetadata.content_hash == content_hash)
+            )
+    
+    async def list_documents(
+        self,
+        limit: int,
+        after: Optional[tuple[datetime, UUID]] = None,
+        status: Optional[str] = None,
+        mime_type: Optional[str] = None
+    ) -> list[DocumentMetadata]:
+        """Newest documents first, keyset paginated on (created_at, id). after is the
+        (created_at, id) of the last document of the previous page, so any page is read
+        from the index in limit rows instead of skipping over the ones before it."""
+        query = select(DocumentMetadata)
+        if status is not None:
+            query = query.where(DocumentMetadata.status == status)
+        if mime_type is not None:
+            query = query.where(DocumentMetadata.mime_type == mime_type)
+        if after is not None:
+            query = query.where(tuple_(DocumentMetadata.created_at, DocumentMetadata.id) < after)
+        query = query.order_by(DocumentMetadata.created_at.desc(), DocumentMetadata.id.desc()).limit(limit)
+        async with self.session_local() as session:
+            return list(await session.scalars(query))
+
+    async def count_chunks(self, doc_ids: list[UUID]) -> dict[UUID, int]:
+        """Chunks per document in one grouped query, documents without chunks are left out"""
+        if not doc_ids:
+            return {}
+        async with self.session_local() as session:
+            result = await session.execute(
+                select(ChunkMetadata.document_id, func.count())
+                .where(ChunkMetadata.document_id.in_(doc_ids))
+                .group_by(ChunkMetadata.document_id)
+            )
+            return {doc_id: count for doc_id, count in result}
+
     async def save_chunks(self, chunks: list[ChunkMetadata]):
+        async with self.unit_of_work() as uow:
+            await uow.save_chunks(chunks)
+    
+    async def stream_chunks(self, batch_size: int = 1000) -> AsyncIterator[ChunkRecord]:
+        """Yield every stored chunk without loading them all at once, as plain rows
+        rather than ORM instances"""
+        async with self.session_local() as session:
+            result = await session.stream(
+                select(
+                    ChunkMetadata.id, ChunkMetadata.document_id, ChunkMetadata.sequence, ChunkMetadata.content
+                ).execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                yield ChunkRecord(*row)
+
+    async def stream_chunk_ids(self, batch_size: int = 1000) -> AsyncIterator[UUID]:
+        """Yield the id of every stored chunk without loading them all at once"""
+        async with self.session_local() as session:
+            result = await session.stream_scalars(
+                select(ChunkMetadata.id).execution_options(yield_per=batch_size)
+            )
+            async for chunk_id in result:
+                yield chunk_id
+
+    async def get_chunk_records(self, chunk_ids: list[UUID]) -> list[ChunkRecord]:
+        """Chunks by id with their content, as plain rows, missing ids are left out"""
+        records = []
+        async with self.session_local() as session:
+            for start in range(0, len(chunk_ids), INSERT_BATCH_SIZE):
+                result = await session.execute(
+                    select(
+                        ChunkMetadata.id, ChunkMetadata.document_id, ChunkMetadata.sequence, ChunkMetadata.content
+                    ).where(ChunkMetadata.id.in_(chunk_ids[start:start + INSERT_BATCH_SIZE]))
+                )
+                records.extend(ChunkRecord(*row) for row in result)
+        return records
+
+    async def get_corpus_version(self) -> int:
+        async with self.session_local() as session:
+            version = await session.scalar(
+                select(CorpusState.version).where(CorpusState.id == CORPUS_STATE_ID)
+            )
+            return version or 0
+
+    async def claim_document(
+        self,
+        doc_id: UUID,
+        status: str,
+        exclude_statuses: list[str],
+        lease_seconds: float
+    ) -> Optional[UUID]:
+        """Claim a document for processing in a single UPDATE and set its status. Returns
+        the claim, or None when the document is in one of exclude_statuses or another
+        worker's claim on it has not expired. The claim lapses after lease_seconds
+        unless renewed."""
+        now = datetime.now()
+        claim = uuid4()
+        async with self.unit_of_work() as uow:
+            result = await uow.session.execute(
+                update(DocumentMetadata)
+                .where(
+                    DocumentMetadata.id == doc_id,
+                    DocumentMetadata.status.not_in(exclude_statuses),
+                    or_(DocumentMetadata.claim_expires_at.is_(None), DocumentMetadata.claim_expires_at < now)
+                )
+                .values(status=status, claim_id=claim, claim_expires_at=now + timedelta(seconds=lease_seconds))
+            )
+        return claim if result.rowcount == 1 else None
+
+    async def renew_claim(self, doc_id: UUID, claim: UUID, lease_seconds: float) -> bool:
+        """Extend the caller's claim, False when it no longer holds it"""
+        async with self.unit_of_work() as uow:
+            result = await uow.session.execute(
+                update(DocumentMetadata)
+                .where(DocumentMetadata.id == doc_id, DocumentMetadata.claim_id == claim)
+                .values(claim_expires_at=datetime.now() + timedelta(seconds=lease_seconds))
+            )
+        return result.rowcount == 1
+
+    async def release_claim(self, doc_id: UUID, claim: UUID, status: str) -> bool:
+        """Set the final status of a claimed document and drop the claim, False when the
+        caller no longer holds it"""
+        try:
+            async with self.unit_of_work() as uow:
+                await uow.release_claim(doc_id, claim, status)
+        except ClaimLostError:
+            return False
+        return True
+
+    async def get_stale_document_ids(self, exclude_statuses: list[str], lease_seconds: float) -> list[UUID]:
+        """Ids of the documents in any other status whose claim has expired, or that were
+        never claimed in the lease_seconds since they were created, oldest first"""
+        now = datetime.now()
+        async with self.session_local() as session:
+            result = await session.scalars(
+                select(DocumentMetadata.id)
+                .where(
+                    DocumentMetadata.status.not_in(exclude_statuses),
+                    or_(
+                        DocumentMetadata.claim_expires_at < now,
+                        and_(
+                            DocumentMetadata.claim_expires_at.is_(None),
+                            DocumentMetadata.created_at < now - timedelta(seconds=lease_seconds)
+                        )
+                    )
+                )
+                .order_by(DocumentMetadata.created_at)
+            )
+            return list(result)
+
+    async def get_chunk_ids(self, doc_id: UUID) -> list[UUID]:
+        """Ids of a document's chunks in sequence order, no other column is read"""
+        async with self.session_local() as session:
+            result = await session.scalars(
+                select(ChunkMetadata.id)
+                .where(ChunkMetadata.document_id == doc_id)
+                .order_by(ChunkMetadata.sequence)
+            )
+            return list(result)
+
+    async def update_document_status(self, doc_id: UUID, status: str):
+        async with self.unit_of_work() as uow:
+            await uow.update_document_status(doc_id, status)
+    
+    async def delete_document_metadata(self, doc_id: UUID):
+        async with self.unit_of_work() as uow:
+            await uow.delete_document_metadata(doc_id)
+    
+    async def delete_chunks(self, doc_id: UUID):
+        async with self.unit_of_work() as uow:
+            if await uow.delete_chunks(doc_id) == 0:
+                raise ValueError(f"No chunks found for document {doc_id}.")
+
+    def _insert_ignoring_conflicts(self, table):
+        """INSERT that skips rows whose primary key already exists"""
+        dialect = postgresql if self.engine.dialect.name == "postgresql" else sqlite
+        return dialect.insert(table).on_conflict_do_nothing()
+
+    def _upsert(self, table, values: dict, index_elements: list[str], update_columns: list[str]):
+        """INSERT that overwrites update_columns of the row whose key already exists"""
+        dialect = postgresql if self.engine.dialect.name == "postgresql" else sqlite
+        statement = dialect.insert(table).values(**values)
+        return statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+
+    async def get_cached_embeddings(self, model: str, content_hashes: list[str]) -> dict[str, bytes]:
+        """Fetch cached embeddings by content hash and mark them as recently used. A large
+        document has more hashes than a statement may bind (32767 on asyncpg), they are
+        looked up and marked in batches."""
+        async with self.session_local() as session:
+            try:
+                found = {}
+                now = datetime.now()
+                for start in range(0, len(content_hashes), INSERT_BATCH_SIZE):
+                    result = await session.execute(
+                        select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.embedding).where(
+                            EmbeddingCacheEntry.model == model,
+                            EmbeddingCacheEntry.content_hash.in_(content_hashes[start:start + INSERT_BATCH_SIZE])
+                        )
+                    )
+                    batch = {row.content_hash: row.embedding for row in result}
+                    if batch:
+                        await session.execute(
+                            update(EmbeddingCacheEntry).where(
+                                EmbeddingCacheEntry.model == model,
+                                EmbeddingCacheEntry.content_hash.in_(list(batch))
+                            ).values(last_used_at=now)
+                        )
+                    found.update(batch)
+                if found:
+                    await session.commit()
+                return found
+            except Exception as e:
+                await session.rollback()
+                raise e
+
+    async def save_cached_embeddings(self, model: str, embeddings: dict[str, bytes]):
         async with self.session_local() as session:
             try:
-                for chunk in chunks:
-                    session.add(chunk)
+                now = datetime.now()
+                await session.execute(
+                    self._insert_ignoring_conflicts(EmbeddingCacheEntry),
+                    [
+                        {"content_hash": content_hash, "model": model, "embedding": embedding, "last_used_at": now}
+                        for content_hash, embedding in embeddings.items()
+                    ]
+                )
                 await session.commit()
             except Exception as e:
                 await session.rollback()
                 raise e
-    
-    async def update_document_status(self, doc_id: UUID, status: str):
+
+    async def evict_cached_embeddings(self, max_entries: int) -> int:
+        """Delete the least recently used cache entries beyond max_entries"""
+        key = tuple_(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.model)
+        # A batch of entries shares one last_used_at, the key breaks ties so exactly the
+        # entries past max_entries go rather than every entry stamped with the cutoff time
+        victims = (
+            select(EmbeddingCacheEntry.content_hash, EmbeddingCacheEntry.model)
+            .order_by(
+                EmbeddingCacheEntry.last_used_at.desc(),
+                EmbeddingCacheEntry.content_hash.desc(),
+                EmbeddingCacheEntry.model.desc()
+            )
+            .offset(max_entries)
+        )
         async with self.session_local() as session:
             try:
-                doc = await session.get(DocumentMetadata, doc_id)
-                if not doc:
-                    raise ValueError(f"Document {doc_id} not found.")
-                doc.status = status
+                result = await session.execute(delete(EmbeddingCacheEntry).where(key.in_(victims)))
                 await session.commit()
+                return result.rowcount
             except Exception as e:
                 await session.rollback()
                 raise e
-    
-    async def delete_document_metadata(self, doc_id: UUID):
+
+    async def get_conversation(self, conversation_id: str, expires_at: datetime) -> Optional[list[dict]]:
+        """Fetch an unexpired conversation's messages and push its expiry out to expires_at"""
         async with self.session_local() as session:
             try:
-                doc = await session.get(DocumentMetadata, doc_id)
-                if not doc:
-                    raise ValueError(f"Document {doc_id} not found.")
-                await session.delete(doc)
+                conversation = await session.scalar(
+                    select(Conversation).where(
+                        Conversation.id == conversation_id,
+                        Conversation.expires_at > datetime.now()
+                    )
+                )
+                if conversation is None:
+                    return None
+                conversation.expires_at = expires_at
                 await session.commit()
+                return conversation.messages
             except Exception as e:
                 await session.rollback()
                 raise e
-    
-    async def delete_chunks(self, doc_id: UUID):
+
+    async def save_conversation(self, conversation_id: str, messages: list[dict], expires_at: datetime):
+        async with self.session_local() as session:
+            try:
+                await session.execute(self._upsert(
+                    Conversation,
+                    {"id": conversation_id, "messages": messages, "expires_at": expires_at},
+                    index_elements=["id"],
+                    update_columns=["messages", "expires_at"]
+                ))
+                await session.commit()
+            except Exception as e:
+                await session.rollback()
+                raise e
+
+    async def delete_expired_conversations(self) -> int:
         async with self.session_local() as session:
             try:
                 result = await session.execute(
-                    delete(ChunkMetadata).where(ChunkMetadata.document_id == doc_id)
+                    delete(Conversation).where(Conversation.expires_at <= datetime.now())
                 )
                 await session.commit()
-                if result.rowcount == 0:
-                    raise ValueError(f"No chunks found for document {doc_id}.")
+                return result.rowcount
             except Exception as e:
                 await session.rollback()
                 raise e
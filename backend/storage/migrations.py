@@ -0,0 +1,27 @@
+from pathlib import Path
+
+from sqlalchemy import inspect
+from sqlalchemy.engine import Connection
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# The schema create_all produced before migrations existed
+BASELINE_REVISION = "0001"
+
+def alembic_config(connection: Connection = None):
+    # Only needed when migrations run
+    from alembic.config import Config
+    config = Config(str(BACKEND_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(BACKEND_DIR / "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+def upgrade_schema(connection: Connection, revision: str = "head"):
+    """Migrate the database behind connection to revision. A database whose tables were
+    created without migrations is stamped at the baseline first, so only later revisions run."""
+    from alembic import command
+    config = alembic_config(connection)
+    tables = set(inspect(connection).get_table_names())
+    if "alembic_version" not in tables and "documents" in tables:
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, revision)
@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from processing.timing import percentile
+
+class _QueryCount:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = 0
+
+# Statements executed on behalf of the current HTTP request, when one is being tracked
+_request_queries: ContextVar[Optional[_QueryCount]] = ContextVar("request_queries", default=None)
+
+class PoolMetrics:
+    """Connection pool and query counters for one engine, read by /metrics"""
+
+    def __init__(self, window: int = 1000):
+        self.checked_out = 0
+        self.peak_checked_out = 0
+        self.checkouts = 0
+        self.connections_opened = 0
+        self.invalidated = 0
+        self.timeouts = 0
+        self.queries = 0
+        self.requests = 0
+        self.wait_ms: deque[float] = deque(maxlen=window)
+        self.request_queries: deque[int] = deque(maxlen=window)
+
+    def attach(self, engine: AsyncEngine):
+        pool = engine.sync_engine.pool
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+        event.listen(pool, "invalidate", self._on_invalidate)
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def pool_class(self) -> type[AsyncAdaptedQueuePool]:
+        """Queue pool that records how long each checkout waited for a connection"""
+        metrics = self
+
+        class MeteredQueuePool(AsyncAdaptedQueuePool):
+            # Pool.recreate() builds the replacement from self.__class__, so metering survives it
+            def connect(self):
+                start = time.perf_counter()
+                try:
+                    return super().connect()
+                except PoolTimeoutError:
+                    metrics.timeouts += 1
+                    raise
+                finally:
+                    metrics.wait_ms.append((time.perf_counter() - start) * 1000)
+
+        return MeteredQueuePool
+
+    @contextmanager
+    def track_request(self):
+        """Count the statements executed within the block as one request"""
+        count = _QueryCount()
+        token = _request_queries.set(count)
+        try:
+            yield count
+        finally:
+            _request_queries.reset(token)
+            self.requests += 1
+            self.request_queries.append(count.queries)
+
+    def stats(self, pool) -> dict:
+        waits = sorted(self.wait_ms)
+        per_request = sorted(self.request_queries)
+        return {
+            "pool_size": pool.size() if hasattr(pool, "size") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checked_out": self.checked_out,
+            "peak_checked_out": self.peak_checked_out,
+            "checkouts": self.checkouts,
+            "connections_opened": self.connections_opened,
+            "invalidated": self.invalidated,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": round(percentile(waits, 50), 3) if waits else None,
+            "wait_p99_ms": round(percentile(waits, 99), 3) if waits else None,
+            "queries": self.queries,
+            "queries_per_request_mean": (
+                round(sum(per_request) / len(per_request), 2) if per_request else None
+            ),
+            "queries_per_request_max": per_request[-1] if per_request else None
+        }
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connections_opened += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        self.checked_out -= 1
+
+    def _on_invalidate(self, dbapi_connection, connection_record, exception):
+        self.invalidated += 1
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.queries += 1
+        count = _request_queries.get()
+        if count is not None:
+            count.queries += 1
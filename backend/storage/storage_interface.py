@@ -1,9 +1,9 @@
 from sqlalchemy.dialects.postgresql import UUID as sqlUUID
 from uuid import UUID;
-from typing import Optional
+from typing import NamedTuple, Optional
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Integer, ForeignKey
+from sqlalchemy import String, Integer, ForeignKey, LargeBinary, JSON, Index, inspect
 from datetime import datetime
 from pydantic import BaseModel
 
@@ -17,9 +17,16 @@ class DocumentMetadataBase(BaseModel):
     size_bytes: int
     status: str = "pending"
     created_at: datetime = datetime.now()
+    content_hash: Optional[str] = None
 
 class DocumentMetadata(Base):
     __tablename__ = "documents"
+    __table_args__ = (
+        # Keyset pagination over all documents, and over the documents of one status or type
+        Index("ix_documents_created_at_id", "created_at", "id"),
+        Index("ix_documents_status_created_at_id", "status", "created_at", "id"),
+        Index("ix_documents_mime_type_created_at_id", "mime_type", "created_at", "id"),
+    )
     
     id: Mapped[UUID] = mapped_column(sqlUUID, primary_key=True)
     filename: Mapped[str] = mapped_column(String)
@@ -27,6 +34,11 @@ class DocumentMetadata(Base):
     size_bytes: Mapped[int] = mapped_column(Integer)
     status: Mapped[str] = mapped_column(String, default="pending")
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    # sha256 of the original bytes, unique so identical uploads resolve to one document
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), unique=True, nullable=True)
+    # The worker processing the document holds it until the lease runs out, see MetadataStore.claim_document
+    claim_id: Mapped[Optional[UUID]] = mapped_column(sqlUUID, nullable=True)
+    claim_expires_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
 
     def model_dump_json(self) -> str:
         return DocumentMetadataBase(
@@ -35,7 +47,8 @@ class DocumentMetadata(Base):
             mime_type=self.mime_type,
             size_bytes=self.size_bytes,
             status=self.status or "pending",
-            created_at=self.created_at or datetime.now()
+            created_at=self.created_at or datetime.now(),
+            content_hash=self.content_hash
         ).model_dump_json()
     def __eq__(self, other):
         if not isinstance(other, DocumentMetadata):
@@ -49,10 +62,16 @@ class DocumentMetadata(Base):
 
 class ChunkMetadata(Base):
     __tablename__ = "chunks"
+    __table_args__ = (
+        # Every per-document read and delete filters on document_id, reads come back in sequence order
+        Index("ix_chunks_document_id_sequence", "document_id", "sequence"),
+    )
     
     id: Mapped[UUID] = mapped_column(sqlUUID, primary_key=True)
     document_id: Mapped[UUID] = mapped_column(ForeignKey("documents.id"))
-    content: Mapped[str] = mapped_column(String)
+    # Deferred so queries for ids or positions never pull chunk text, raiseload turns an
+    # accidental lazy load into an error instead of a hidden query per row
+    content: Mapped[str] = mapped_column(String, deferred=True, deferred_raiseload=True)
     sequence: Mapped[int] = mapped_column(Integer)
     created_at: Mapped[datetime] = mapped_column(default=datetime.now)
     embedding_id: Mapped[Optional[str]] = mapped_column(String, nullable=True)
@@ -60,15 +79,53 @@ class ChunkMetadata(Base):
     def __eq__(self, other):
         if not isinstance(other, ChunkMetadata):
             return False
+        # Content is only compared when both sides have it, reading it on an instance
+        # loaded without it would raise
+        compare_content = "content" not in inspect(self).unloaded and "content" not in inspect(other).unloaded
         return (
                 self.id == other.id and
                 self.document_id == other.document_id and
-                self.content == other.content and
+                (not compare_content or self.content == other.content) and
                 self.sequence == other.sequence and
                 self.embedding_id == other.embedding_id
             )
+
+
+class CorpusState(Base):
+    """Single row counting changes to the searchable corpus across every worker"""
+    __tablename__ = "corpus_state"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, default=0)
+
+
+class ChunkRecord(NamedTuple):
+    """Plain row for read paths that do not need ORM instances, content is None
+    when it was not loaded"""
+    id: UUID
+    document_id: UUID
+    sequence: int
+    content: Optional[str] = None
     
 
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    content_hash: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String, primary_key=True)
+    embedding: Mapped[bytes] = mapped_column(LargeBinary)
+    last_used_at: Mapped[datetime] = mapped_column(default=datetime.now, index=True)
+
+
+class Conversation(Base):
+    __tablename__ = "conversations"
+
+    id: Mapped[str] = mapped_column(String, primary_key=True)
+    messages: Mapped[list] = mapped_column(JSON)
+    # Indexed so expiry deletes a range instead of scanning every conversation
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
 class StorageInterface:
     """Abstract base class for all storage operations"""
     
@@ -1,15 +1,21 @@
+import asyncio
+import time
 from uuid import uuid4, UUID
+from hashlib import sha256
 import magic
-from .file_system_storage import FileSystemStorage
+from sqlalchemy.exc import IntegrityError
+from .file_system_storage import FileSystemStorage, SpooledFile
 from .vector_storage import VectorStorage
 from .metadata_store import MetadataStore
+from .lexical_index import LexicalIndex
 from .storage_interface import DocumentMetadata, ChunkMetadata
 from processing.doc_status import DocumentStatus
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
+from functools import partial
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
 
-# TODO: Currently, operations can fail intermittently and leave the storage in an inconsistent state
-# implement proper error handling to make the operations atomic, perhaps using sqlalchely's begin
-# clause and passing the session to the method
+FINISHED_STATUSES = [DocumentStatus.COMPLETED.value, DocumentStatus.FAILED.value]
 
 class StorageManager:
     """Coordinates between different storage systems"""
@@ -18,59 +24,269 @@ class StorageManager:
         self,
         file_storage: FileSystemStorage,
         vector_storage: VectorStorage,
-        metadata_storage: MetadataStore
+        metadata_storage: MetadataStore,
+        lexical_index: Optional[LexicalIndex] = None,
+        corpus_version_refresh: float = 1.0,
+        claim_lease: float = 60.0
     ):
         self.files = file_storage
         self.vectors = vector_storage
         self.metadata = metadata_storage
+        self.lexical = lexical_index
         self.mime = magic.Magic(mime=True)
+        # Bumped in the metadata store whenever searchable content changes, lets answer
+        # caches drop stale entries; this is the last value seen by this process
+        self.corpus_version = 0
+        self.corpus_version_refresh = corpus_version_refresh
+        self._corpus_version_read_at: Optional[float] = None
+        # Corpus version the lexical index is known to match, None until first reconciled.
+        # The lock keeps this process's own updates out of a reconcile in progress.
+        self._lexical_version: Optional[int] = None
+        self._lexical_lock = asyncio.Lock()
+        # Seconds a claim on a document lasts without renewal, see claim_document
+        self.claim_lease = claim_lease
+
+    async def get_corpus_version(self) -> int:
+        """Version of the searchable corpus, shared by all workers. Changes made here are
+        seen at once, other workers' after at most corpus_version_refresh seconds, when
+        the lexical index is brought up to date with them as well."""
+        now = time.monotonic()
+        if self._corpus_version_read_at is None or now - self._corpus_version_read_at >= self.corpus_version_refresh:
+            self.corpus_version = await self.metadata.get_corpus_version()
+            self._corpus_version_read_at = now
+            if self.lexical is not None and self.corpus_version != self._lexical_version:
+                await self.reconcile_lexical_index()
+        return self.corpus_version
+
+    async def reconcile_lexical_index(self):
+        """Bring this process's lexical index in line with the stored chunks, including the
+        documents other workers stored or deleted. Reads the ids of all chunks and the content
+        of the new ones only."""
+        async with self._lexical_lock:
+            # Read first: a change committed while reconciling leaves the index marked stale
+            version = await self.metadata.get_corpus_version()
+            if version == self._lexical_version:
+                return
+            await self.lexical.reconcile(self.metadata.stream_chunk_ids(), self.metadata.get_chunk_records)
+            self._lexical_version = version
+
+    async def _update_lexical_index(self, version: int, update: Callable[[], None]):
+        """Apply this process's own change to the lexical index. The index still matches the
+        corpus afterwards only if no other worker changed it since the last version seen."""
+        async with self._lexical_lock:
+            await asyncio.to_thread(update)
+            if self._lexical_version == version - 1:
+                self._lexical_version = version
     
     async def save_document(self, content: bytes, filename: str) -> UUID:
         """Complete save operation of unprocessed file"""
-        doc_id = uuid4()
-        mime_type = self.mime.from_buffer(content)
-        metadata = DocumentMetadata(
-            id=doc_id,
+        doc_id, _ = await self.save_or_get_document(content, filename)
+        return doc_id
+
+    async def save_or_get_document(self, content: bytes, filename: str) -> tuple[UUID, bool]:
+        """Save an unprocessed file unless identical bytes were uploaded before.
+        Returns the document id and whether a new document was created. An earlier
+        upload that never finished processing gets its file back from this one if it
+        was lost, so it can be processed again."""
+        content_hash = sha256(content).hexdigest()
+        existing = await self.metadata.get_document_by_hash(content_hash)
+        if existing:
+            if self._file_missing(existing):
+                await self.files.save_document(content, existing)
+            return existing.id, False
+
+        metadata = self._new_document_metadata(
             filename=filename,
-            mime_type=mime_type,
+            mime_type=self.mime.from_buffer(content),
             size_bytes=len(content),
-            status="pending",
-            created_at=datetime.now()
+            content_hash=content_hash
         )
+        existing_id = await self._claim_content(metadata)
+        if existing_id:
+            return existing_id, False
+
         try:
             await self.files.save_document(content, metadata)
-            await self.metadata.save_document_metadata(metadata)
         except Exception as e:
+            await self.metadata.delete_document_metadata(metadata.id)
             raise e
         
-        return doc_id
+        return metadata.id, True
+
+    async def spool_upload(
+        self,
+        read: Callable[[int], Awaitable[bytes]],
+        buffer_size: int,
+        max_bytes: Optional[int] = None
+    ) -> SpooledFile:
+        """Stream an upload to disk without holding it in memory, see FileSystemStorage.spool"""
+        return await self.files.spool(read, buffer_size, max_bytes)
+
+    async def save_or_get_spooled_document(self, spooled: SpooledFile, filename: str) -> tuple[UUID, bool]:
+        """Same as save_or_get_document for an upload already streamed to disk"""
+        try:
+            existing = await self.metadata.get_document_by_hash(spooled.content_hash)
+            if existing:
+                if self._file_missing(existing):
+                    await self.files.save_spooled_document(spooled, existing)
+                return existing.id, False
+
+            metadata = self._new_document_metadata(
+                filename=filename,
+                mime_type=self.mime.from_buffer(spooled.head),
+                size_bytes=spooled.size_bytes,
+                content_hash=spooled.content_hash
+            )
+            existing_id = await self._claim_content(metadata)
+            if existing_id:
+                return existing_id, False
+
+            try:
+                await self.files.save_spooled_document(spooled, metadata)
+            except Exception as e:
+                await self.metadata.delete_document_metadata(metadata.id)
+                raise e
+
+            return metadata.id, True
+        finally:
+            # No-op once the file has been moved into place
+            self.discard_spooled(spooled)
+
+    def discard_spooled(self, spooled: SpooledFile):
+        self.files.discard_spooled(spooled)
+
+    def document_path(self, doc_id: UUID) -> Path:
+        return self.files.document_path(doc_id)
+
+    def _file_missing(self, doc: DocumentMetadata) -> bool:
+        """An unfinished document without its file, the process stopped between claiming
+        the content and saving it"""
+        return doc.status != DocumentStatus.COMPLETED.value and not self.files.document_path(doc.id).exists()
+
+    async def get_stale_document_ids(self) -> list[UUID]:
+        """Documents neither completed nor failed that no live worker is on: left behind
+        by a worker that stopped renewing its claim, or never claimed within a lease of
+        their upload (the queue holding them was lost). Oldest first."""
+        return await self.metadata.get_stale_document_ids(FINISHED_STATUSES, self.claim_lease)
+
+    def is_stale(self, doc: DocumentMetadata) -> bool:
+        """Same test as get_stale_document_ids, for a document already loaded"""
+        now = datetime.now()
+        if doc.status in FINISHED_STATUSES:
+            return False
+        if doc.claim_expires_at is None:
+            return doc.created_at < now - timedelta(seconds=self.claim_lease)
+        return doc.claim_expires_at < now
+
+    async def claim_document(self, doc_id: UUID) -> Optional[UUID]:
+        """Take a document for processing and mark it extracting. Returns the claim to pass
+        to renew_claim, save_processed_chunks and fail_document, or None when the document
+        is finished or another worker's claim on it is still live. Unless renewed, the
+        claim lapses after claim_lease seconds and the document can be claimed again."""
+        return await self.metadata.claim_document(
+            doc_id, DocumentStatus.EXTRACTING.value, FINISHED_STATUSES, self.claim_lease
+        )
+
+    async def renew_claim(self, doc_id: UUID, claim: UUID) -> bool:
+        return await self.metadata.renew_claim(doc_id, claim, self.claim_lease)
+
+    async def fail_document(self, doc_id: UUID, claim: UUID) -> bool:
+        """Mark a claimed document failed. False when the claim was lost, the worker that
+        took the document over decides what becomes of it."""
+        return await self.metadata.release_claim(doc_id, claim, DocumentStatus.FAILED.value)
+
+    def _new_document_metadata(self, filename: str, mime_type: str, size_bytes: int, content_hash: str) -> DocumentMetadata:
+        return DocumentMetadata(
+            id=uuid4(),
+            filename=filename,
+            mime_type=mime_type,
+            size_bytes=size_bytes,
+            status="pending",
+            created_at=datetime.now(),
+            content_hash=content_hash
+        )
+
+    async def _claim_content(self, metadata: DocumentMetadata) -> Optional[UUID]:
+        """Insert the metadata row, the unique hash index claims the content before anything
+        is written to disk. Returns the existing document's id if an identical upload won."""
+        try:
+            await self.metadata.save_document_metadata(metadata)
+            return None
+        except IntegrityError:
+            existing = await self.metadata.get_document_by_hash(metadata.content_hash)
+            if existing is None:
+                raise
+            return existing.id
+
+    async def get_document_metadata(self, doc_id: UUID) -> Optional[DocumentMetadata]:
+        """Fetch a document's metadata, None if it does not exist"""
+        return await self.metadata.get_document_metadata(doc_id)
+
+    async def list_documents(
+        self,
+        limit: int,
+        after: Optional[tuple[datetime, UUID]] = None,
+        status: Optional[str] = None,
+        mime_type: Optional[str] = None
+    ) -> list[DocumentMetadata]:
+        """A page of documents, newest first, see MetadataStore.list_documents"""
+        return await self.metadata.list_documents(limit, after=after, status=status, mime_type=mime_type)
+
+    async def count_chunks(self, doc_ids: list[UUID]) -> dict[UUID, int]:
+        """Number of stored chunks of each document"""
+        return await self.metadata.count_chunks(doc_ids)
 
     async def save_processed_chunks(
         self,
         doc_id: UUID,
         chunks: list[ChunkMetadata],
-        embeddings: list[list[float]]
+        embeddings: list[list[float]],
+        claim: Optional[UUID] = None
     ):
-        """Save processed chunks and their embeddings"""
-        await self.metadata.update_document_status(doc_id, DocumentStatus.STORING.value)
-        try:
-            await self.metadata.save_chunks(chunks)
-            await self.vectors.add_chunks(chunks, embeddings)
-            await self.metadata.update_document_status(doc_id, "processed")
-        except Exception as e:
-            raise e                         
+        """Save processed chunks and their embeddings and mark the document completed.
+        The chunk rows and the status change commit in one transaction, vectors are written
+        alongside it and a failure in either rolls the transaction back. With the claim
+        from claim_document, nothing is written unless it is still held (ClaimLostError),
+        and it stays held until commit."""
+        async with self.metadata.unit_of_work() as uow:
+            if claim is not None:
+                await uow.hold_claim(doc_id, claim)
+            # A document processed again after a restart replaces what an interrupted run
+            # left behind: vectors are not part of the transaction and may have been written
+            await uow.delete_chunks(doc_id)
+            await self.vectors.delete_chunks(doc_id)
+            # The two stores are independent, write them concurrently
+            results = await asyncio.gather(
+                uow.save_chunks(chunks),
+                self.vectors.add_chunks(chunks, embeddings),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            if claim is not None:
+                await uow.release_claim(doc_id, claim, DocumentStatus.COMPLETED.value)
+            else:
+                await uow.update_document_status(doc_id, DocumentStatus.COMPLETED.value)
+            version = await uow.bump_corpus_version()
+        if self.lexical is not None:
+            def replace():
+                self.lexical.remove_document(doc_id)
+                self.lexical.add_chunks(chunks)
+            await self._update_lexical_index(version, replace)
+        self.corpus_version = version
     
     async def delete_document(self, doc_id: UUID) -> bool:
-        """Delete document and all associated data"""
-        try:
-            file_deleted = await self.files.delete_document(doc_id)
-            
-            await self.metadata.delete_document_metadata(doc_id)
-            await self.metadata.delete_chunks(doc_id)
-            
-            await self.vectors.delete_chunks(doc_id)
-            
-            return file_deleted
-        except Exception as e:
-                # TODO: Proper error handling
-                raise e
+        """Delete document and all associated data. The document row and its chunk rows go
+        in one transaction, vectors and the stored file are removed once it has committed."""
+        async with self.metadata.unit_of_work() as uow:
+            await uow.delete_chunks(doc_id)
+            await uow.delete_document_metadata(doc_id)
+            version = await uow.bump_corpus_version()
+
+        await self.vectors.delete_chunks(doc_id)
+        if self.lexical is not None:
+            await self._update_lexical_index(version, partial(self.lexical.remove_document, doc_id))
+        self.corpus_version = version
+
+        return await self.files.delete_document(doc_id)
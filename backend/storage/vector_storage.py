@@ -1,10 +1,22 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable
+
+import numpy as np
 from chromadb import Client
 from chromadb.config import Settings
-from .storage_interface import ChunkMetadata
+from .storage_interface import ChunkMetadata, ChunkRecord
 from uuid import UUID
 
+# used when the client cannot report the largest batch it accepts
+DEFAULT_MAX_BATCH_SIZE = 5000
+
 class VectorStorage:
-    def __init__(self, persist_dir: str):
+    """Chroma collection access; the client is synchronous, so every call runs on
+    a dedicated bounded thread pool instead of the event loop"""
+
+    def __init__(self, persist_dir: str, max_workers: int = 4):
         self.client = Client(Settings(
             persist_directory=persist_dir,
             is_persistent=True
@@ -13,52 +25,121 @@ class VectorStorage:
             name="document_chunks",
             metadata={"hnsw:space": "cosine"}
         )
+        self.max_batch_size = self._get_max_batch_size()
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chroma")
+        # Calls wait here rather than in the executor queue, so a cancelled caller never reaches Chroma
+        self._slots = asyncio.Semaphore(max_workers)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.cancelled = 0
+
+    def _get_max_batch_size(self) -> int:
+        try:
+            return int(self.client.get_max_batch_size())
+        except Exception:
+            return DEFAULT_MAX_BATCH_SIZE
+
+    async def _run(self, func: Callable, *args, **kwargs):
+        """Run a blocking Chroma call on the pool, at most max_workers at a time"""
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            # The thread finishes its call, the caller just stops waiting for it
+            self.cancelled += 1
+            raise
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.max_workers,
+            "waiting": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "cancelled": self.cancelled
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
     
     async def add_chunks(self, chunks: list[ChunkMetadata], embeddings: list[list[float]]):
-        """Add chunks with their embeddings to vector store"""
-        for chunk in chunks:
-            ids = [str(chunk.id)]
-            metadatas=[{
-                "document_id": str(chunk.document_id),
-                "sequence": chunk.sequence
-            }]
-            documents=[chunk.content]
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            documents=documents
-        )
+        """Upsert chunks with their embeddings, split into batches the client accepts"""
+        if not chunks:
+            return
+        # Build each column once, embeddings as one contiguous float32 matrix
+        ids = [str(chunk.id) for chunk in chunks]
+        metadatas = [{
+            "document_id": str(chunk.document_id),
+            "sequence": chunk.sequence
+        } for chunk in chunks]
+        documents = [chunk.content for chunk in chunks]
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if len(vectors) != len(ids):
+            raise ValueError(f"Got {len(vectors)} embeddings for {len(ids)} chunks")
+
+        for start in range(0, len(ids), self.max_batch_size):
+            end = start + self.max_batch_size
+            await self._run(
+                self.collection.upsert,
+                ids=ids[start:end],
+                embeddings=vectors[start:end],
+                metadatas=metadatas[start:end],
+                documents=documents[start:end]
+            )
     
-    async def search(self, query_embedding: list[float], limit: int = 5) -> list[dict]:
-        """Search for similar chunks"""
-        results = self.collection.query(
+    async def search(self, query_embedding: list[float], limit: int = 5, include_documents: bool = True) -> dict:
+        """Search for similar chunks. Without documents only ids, metadata and distances
+        are read, for candidate lists whose text is loaded later with get_contents."""
+        include = ["metadatas", "documents", "distances"] if include_documents else ["metadatas", "distances"]
+        return await self._run(
+            self.collection.query,
             query_embeddings=[query_embedding],
             n_results=limit,
-            include=["metadatas", "documents", "distances"]
+            include=include
         )
-        
-        return results
+
+    async def get_contents(self, chunk_ids: list[str]) -> dict[str, str]:
+        """Text of the given chunks by id"""
+        if not chunk_ids:
+            return {}
+        results = await self._run(self.collection.get, ids=chunk_ids, include=["documents"])
+        return dict(zip(results["ids"], results["documents"]))
     
     async def delete_chunks(self, doc_id: UUID):
         """Delete chunks associated with a document ID"""
-        chunk_ids = [str(chunk.id) for chunk in await self.get_chunks_by_document_id(doc_id)]
-        if chunk_ids:
-            await self.collection.delete(ids=chunk_ids)
+        await self._run(self.collection.delete, where={"document_id": str(doc_id)})
+
+    async def get_chunk_ids(self, doc_id: UUID) -> list[str]:
+        """Ids of a document's chunks, neither metadata nor documents are read"""
+        results = await self._run(self.collection.get, where={"document_id": str(doc_id)}, include=[])
+        return results["ids"]
     
-    async def get_chunks_by_document_id(self, doc_id: UUID) -> list[ChunkMetadata]:
+    async def get_chunks_by_document_id(self, doc_id: UUID) -> list[ChunkRecord]:
         """Retrieve chunks by document ID"""
-        results = await self.collection.query(
-            query_filter={"document_id": str(doc_id)},
+        results = await self._run(
+            self.collection.get,
+            where={"document_id": str(doc_id)},
             include=["metadatas", "documents"]
         )
         return [
-            ChunkMetadata(
-                id=UUID(result["id"]),
-                document_id=UUID(result["metadata"]["document_id"]),
-                sequence=result["metadata"]["sequence"],
-                content=result["document"],
-                embedding_id=result["id"]
+            ChunkRecord(UUID(chunk_id), UUID(metadata["document_id"]), metadata["sequence"], document)
+            for chunk_id, metadata, document in zip(
+                results["ids"], results["metadatas"], results["documents"]
             )
-            for result in results
         ]
@@ -1,3 +1,5 @@
+import asyncio
+import anyio
 import pytest
 from unittest.mock import Mock, AsyncMock, patch
 from openai.types.chat import ChatCompletion, ChatCompletionMessage
@@ -5,6 +7,8 @@ from openai.types.chat.chat_completion import Choice
 from processing.completion_handler import CompletionHandler
 from processing.prompt_manager import PromptManager
 from processing.query_processor import QueryProcessor
+from processing.semantic_cache import SemanticCache
+from processing.response_cache import ResponseCache
 
 @pytest.fixture
 def mock_query_processor():
@@ -87,7 +91,7 @@ async def test_get_response_with_existing_history(completion_handler):
         {"role": "user", "content": "previous question"},
         {"role": "assistant", "content": "previous answer"}
     ]
-    completion_handler.conversation_manager.update_history(
+    await completion_handler.conversations.update_history(
         conversation_id,
         existing_history
     )
@@ -113,7 +117,8 @@ async def test_get_response_error_handling(completion_handler, mock_openai):
         await completion_handler.get_response("test question")
     assert "Failed to get completion" in str(exc_info.value)
 
-def test_update_history_creates_new_history_if_none_exists(completion_handler):
+@pytest.mark.asyncio
+async def test_update_history_creates_new_history_if_none_exists(completion_handler):
     # Given
     mock_completion = Mock()
     mock_choice = Mock()
@@ -121,7 +126,7 @@ def test_update_history_creates_new_history_if_none_exists(completion_handler):
     mock_completion.choices = [mock_choice]
     
     # When
-    history = completion_handler.update_history(
+    history = await completion_handler.update_history(
         "test question",
         "conv-id",
         None,
@@ -132,3 +137,226 @@ def test_update_history_creates_new_history_if_none_exists(completion_handler):
     assert len(history) == 2
     assert history[0]["content"] == "test question"
     assert history[1]["content"] == "test response"
+
+@pytest.fixture
+def cached_handler(mock_query_processor, mock_openai):
+    mock_query_processor.get_corpus_version = AsyncMock(return_value=0)
+    mock_query_processor.embed_query = AsyncMock(return_value=[1.0, 0.0])
+    return CompletionHandler(
+        query_processor=mock_query_processor,
+        prompt_manager=PromptManager(),
+        openai_client=mock_openai,
+        semantic_cache=SemanticCache(threshold=0.9)
+    )
+
+@pytest.mark.asyncio
+async def test_get_response_served_from_semantic_cache(cached_handler, mock_query_processor, mock_openai):
+    # Given
+    first = await cached_handler.get_response("how do I reset my password?")
+
+    # When
+    second = await cached_handler.get_response("how can I reset my password")
+
+    # Then
+    assert not first["cached"]
+    assert second["cached"]
+    assert second["answer"] == "Test response"
+    mock_query_processor.process_query.assert_called_once_with(
+        query="how do I reset my password?", limit=None, query_embedding=[1.0, 0.0]
+    )
+    mock_openai.chat.completions.create.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_semantic_cache_skipped_for_follow_ups(cached_handler, mock_openai):
+    # Given
+    await cached_handler.get_response("question", conversation_id="conv")
+
+    # When
+    result = await cached_handler.get_response("question", conversation_id="conv")
+
+    # Then
+    assert not result["cached"]
+    assert mock_openai.chat.completions.create.call_count == 2
+
+@pytest.mark.asyncio
+async def test_semantic_cache_invalidated_by_corpus_change(cached_handler, mock_query_processor, mock_openai):
+    # Given
+    await cached_handler.get_response("question")
+
+    # When
+    mock_query_processor.get_corpus_version = AsyncMock(return_value=1)
+    result = await cached_handler.get_response("question")
+
+    # Then
+    assert not result["cached"]
+    assert mock_openai.chat.completions.create.call_count == 2
+
+class FakeStream:
+    def __init__(self, tokens, then_wait: bool = False):
+        self.tokens = tokens
+        self.then_wait = then_wait
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for token in self.tokens:
+            choice = Mock()
+            choice.delta.content = token
+            yield Mock(choices=[choice])
+        if self.then_wait:
+            # The model is slow to produce the next token
+            await asyncio.Event().wait()
+
+    async def close(self):
+        # Closing the HTTP response awaits, a pending cancellation would interrupt it
+        await asyncio.sleep(0)
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_stream_response(completion_handler, mock_query_processor, mock_openai):
+    # Given
+    mock_query_processor.process_query.return_value = {
+        "query": "test question",
+        "chunks": [{"document_id": "doc-1"}, {"document_id": "doc-1"}, {"document_id": "doc-2"}],
+        "context": "test context"
+    }
+    stream = FakeStream(["Hel", None, "lo"])
+    mock_openai.chat.completions.create = AsyncMock(return_value=stream)
+
+    # When
+    events = [event async for event in completion_handler.stream_response("test question", conversation_id="conv")]
+
+    # Then
+    assert events[0] == {"event": "sources", "data": {"sources": ["doc-1", "doc-2"]}}
+    assert [e["data"]["content"] for e in events if e["event"] == "token"] == ["Hel", "lo"]
+    assert events[-1]["event"] == "done"
+    assert mock_openai.chat.completions.create.call_args.kwargs["stream"] is True
+    assert stream.closed
+    history = await completion_handler.conversations.get_history("conv")
+    assert history[-1] == {"role": "assistant", "content": "Hello"}
+
+@pytest.mark.asyncio
+async def test_stream_response_cancelled_keeps_partial_answer(completion_handler, mock_openai):
+    # Given a client that disconnects while the model is still answering
+    stream = FakeStream(["Partial", " answer"], then_wait=True)
+    mock_openai.chat.completions.create = AsyncMock(return_value=stream)
+    received = []
+
+    async def respond(task_group):
+        async for event in completion_handler.stream_response("test question", conversation_id="conv"):
+            received.append(event)
+            if len(received) == 3:
+                # Starlette cancels the response's task group when it sees the disconnect
+                task_group.cancel_scope.cancel()
+
+    # When
+    async with anyio.create_task_group() as task_group:
+        task_group.start_soon(respond, task_group)
+
+    # Then
+    assert received[-1]["data"]["content"] == " answer"
+    assert stream.closed
+    history = await completion_handler.conversations.get_history("conv")
+    assert history == [
+        {"role": "user", "content": "test question"},
+        {"role": "assistant", "content": "Partial answer"}
+    ]
+
+@pytest.mark.asyncio
+async def test_stream_response_served_from_semantic_cache(cached_handler, mock_openai):
+    # Given
+    await cached_handler.get_response("question")
+
+    # When
+    events = [event async for event in cached_handler.stream_response("question")]
+
+    # Then
+    assert [e["event"] for e in events] == ["sources", "token", "done"]
+    assert events[1]["data"]["content"] == "Test response"
+    assert events[-1]["data"]["cached"] is True
+    mock_openai.chat.completions.create.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced(mock_query_processor, mock_openai):
+    # Given
+    release = asyncio.Event()
+    completion = mock_openai.chat.completions.create.return_value
+
+    async def slow_completion(**kwargs):
+        await release.wait()
+        return completion
+    mock_openai.chat.completions.create = AsyncMock(side_effect=slow_completion)
+    handler = CompletionHandler(
+        query_processor=mock_query_processor,
+        prompt_manager=PromptManager(),
+        openai_client=mock_openai
+    )
+
+    # When
+    requests = [
+        asyncio.create_task(handler.get_response(question))
+        for question in ["Popular question?", "popular   question?", "popular question?"]
+    ]
+    await asyncio.sleep(0.01)
+    release.set()
+    results = await asyncio.gather(*requests)
+
+    # Then
+    assert [result["answer"] for result in results] == ["Test response"] * 3
+    mock_openai.chat.completions.create.assert_called_once()
+    mock_query_processor.process_query.assert_called_once()
+    assert handler.stats()["coalesced"] == 2
+
+@pytest.mark.asyncio
+async def test_completion_is_cancelled_when_its_only_request_goes_away(mock_query_processor, mock_openai):
+    # Given
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def endless_completion(**kwargs):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+    mock_openai.chat.completions.create = AsyncMock(side_effect=endless_completion)
+    handler = CompletionHandler(
+        query_processor=mock_query_processor,
+        prompt_manager=PromptManager(),
+        openai_client=mock_openai
+    )
+    request = asyncio.create_task(handler.get_response("test question"))
+    await started.wait()
+
+    # When the client disconnects
+    request.cancel()
+
+    # Then the upstream call does not run on
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert handler.stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_exact_match_served_from_response_cache(mock_query_processor, mock_openai):
+    # Given
+    mock_query_processor.get_corpus_version = AsyncMock(return_value=0)
+    handler = CompletionHandler(
+        query_processor=mock_query_processor,
+        prompt_manager=PromptManager(),
+        openai_client=mock_openai,
+        response_cache=ResponseCache(max_entries=10)
+    )
+    await handler.get_response("test question", conversation_id="conv-a")
+
+    # When
+    other_user = await handler.get_response("test question", conversation_id="conv-b")
+    mock_query_processor.get_corpus_version = AsyncMock(return_value=1)
+    after_upload = await handler.get_response("test question")
+
+    # Then
+    assert other_user["cached"]
+    assert other_user["conversation_history"][-1]["content"] == "Test response"
+    assert not after_upload["cached"]
+    assert mock_openai.chat.completions.create.call_count == 2
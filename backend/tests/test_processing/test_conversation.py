@@ -1,19 +1,27 @@
 import pytest
-from datetime import datetime, timedelta
 from processing.conversation import ConversationManager
 import time
 import asyncio
 
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
 @pytest.fixture
-def conversation_manager():
-    """Create manager with very short expiry for testing
-    expiry_minutes=0.1 means 6 seconds
-    cleanup_interval=0.05 means 3 seconds
-    """
+def conversation_manager(clock):
+    """Manager with a one minute expiry driven by a fake clock"""
     return ConversationManager(
         max_history=3,
-        expiry_minutes=0.075,  # 6 seconds
-        cleanup_interval=0.05  # 3 seconds
+        expiry_minutes=1,
+        cleanup_interval=0.05,
+        clock=clock
     )
 
 def test_get_history_nonexistent(conversation_manager):
@@ -56,29 +64,26 @@ def test_max_history_limit(conversation_manager):
     assert history[-1]["content"] == "Message 4"
 
 @pytest.mark.asyncio
-async def test_conversation_expiry(conversation_manager):
-    """Test that conversations expire after the configured time
-    Wait time is 0.15 minutes (9 seconds), which is longer than
-    expiry_minutes (0.1 = 6 seconds)
-    """
+async def test_conversation_expiry():
+    """Conversations are cleaned up by the loop started on the event loop"""
     # Given
+    conversation_manager = ConversationManager(expiry_minutes=0.05 / 60, cleanup_interval=0.05)
     conv_id = "test_conv_3"
     messages = [{"role": "user", "content": "Test message"}]
+    await conversation_manager.start()
     
     # When
     conversation_manager.update_history(conv_id, messages)
+    await asyncio.sleep(0.2)
+    await conversation_manager.stop()
     
-    # Wait for expiry (9 seconds > 6 seconds expiry time)
-    await asyncio.sleep(0.1)
-    
-    # Verify conversation was cleaned up
-    history = conversation_manager.get_history(conv_id)
-
+    # Then
     assert conv_id not in conversation_manager.conversations
     assert conv_id not in conversation_manager.last_accessed
 
-def test_last_accessed_updates(conversation_manager):
+def test_last_accessed_updates():
     # Given
+    conversation_manager = ConversationManager()
     conv_id = "test_conv_4"
     messages = [{"role": "user", "content": "Test message"}]
     
@@ -96,7 +101,7 @@ def test_last_accessed_updates(conversation_manager):
     # Then
     assert second_access > first_access
 
-def test_cleanup_expired_conversations(conversation_manager):
+def test_cleanup_expired_conversations(conversation_manager, clock):
     # Given
     conv_id = "test_conv_5"
     messages = [{"role": "user", "content": "Test message"}]
@@ -104,12 +109,57 @@ def test_cleanup_expired_conversations(conversation_manager):
     # When
     conversation_manager.update_history(conv_id, messages)
     
-    # Manually set last_accessed to an expired time
-    conversation_manager.last_accessed[conv_id] = datetime.now() - timedelta(minutes=2)
-    
-    # Trigger cleanup manually
-    conversation_manager._cleanup_expired()
+    # Trigger cleanup manually, two minutes later
+    removed = conversation_manager._cleanup_expired(now=clock.now + 120)
     
     # Then
+    assert removed == 1
     assert conv_id not in conversation_manager.conversations
     assert conv_id not in conversation_manager.last_accessed
+    assert conversation_manager.total_bytes == 0
+
+def test_cleanup_keeps_recently_accessed(conversation_manager, clock):
+    # Given
+    conversation_manager.update_history("idle", [{"role": "user", "content": "a"}])
+    conversation_manager.update_history("active", [{"role": "user", "content": "b"}])
+    clock.now += 50
+    conversation_manager.get_history("active")
+
+    # When
+    clock.now += 20
+    removed = conversation_manager._cleanup_expired()
+
+    # Then
+    assert removed == 1
+    assert conversation_manager.get_history("idle") is None
+    assert conversation_manager.get_history("active") is not None
+    # The stale deadline was re-pushed, not duplicated
+    assert len(conversation_manager._deadlines) == 1
+
+def test_expired_conversation_hidden_before_cleanup(conversation_manager, clock):
+    # Given
+    conversation_manager.update_history("conv", [{"role": "user", "content": "a"}])
+
+    # When
+    clock.now += 61
+
+    # Then
+    assert conversation_manager.get_history("conv") is None
+    assert "conv" not in conversation_manager.conversations
+
+def test_byte_cap_evicts_least_recently_used(clock):
+    # Given
+    message = [{"role": "user", "content": "x" * 85}]  # 100 bytes
+    conversation_manager = ConversationManager(max_bytes=250, clock=clock)
+    conversation_manager.update_history("first", message)
+    conversation_manager.update_history("second", message)
+    conversation_manager.get_history("first")
+
+    # When
+    conversation_manager.update_history("third", message)
+
+    # Then
+    assert conversation_manager.get_history("second") is None
+    assert conversation_manager.get_history("first") == message
+    assert conversation_manager.total_bytes == 200
+    assert conversation_manager.stats()["evicted"] == 1
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from processing.embedding_batcher import EmbeddingBatcher
+from processing.exceptions import EmbeddingError
+
+class FakeEmbeddingsServer:
+    """Local stand-in for the OpenAI embeddings endpoint"""
+
+    def __init__(self, rate_limited: int = 0, delay: float = 0.0):
+        self.requests: list[list[str]] = []
+        self.rate_limited = rate_limited
+        self.delay = delay
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        inputs = json.loads(request.content)["input"]
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.rate_limited > 0:
+                self.rate_limited -= 1
+                return httpx.Response(429, json={"error": {"message": "Rate limit reached"}})
+            self.requests.append(inputs)
+            return httpx.Response(200, json={
+                "object": "list",
+                "model": "text-embedding-ada-002",
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": [float(len(text)), 1.0]}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0}
+            })
+        finally:
+            self.in_flight -= 1
+
+def make_batcher(server: FakeEmbeddingsServer, **kwargs) -> EmbeddingBatcher:
+    client = AsyncOpenAI(
+        api_key="test",
+        base_url="http://fake-openai/v1",
+        max_retries=0,
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(server.handler))
+    )
+    kwargs.setdefault("backoff_base", 0.001)
+    return EmbeddingBatcher(client, "text-embedding-ada-002", **kwargs)
+
+@pytest.mark.asyncio
+async def test_embed_preserves_order():
+    # Given
+    server = FakeEmbeddingsServer()
+    batcher = make_batcher(server)
+    texts = ["a", "bb", "ccc"]
+
+    # When
+    embeddings = await batcher.embed(texts)
+
+    # Then
+    assert [embedding[0] for embedding in embeddings] == [1.0, 2.0, 3.0]
+    assert server.requests == [texts]
+
+@pytest.mark.asyncio
+async def test_batches_respect_token_budget():
+    # Given
+    server = FakeEmbeddingsServer()
+    batcher = make_batcher(server, max_batch_tokens=30)
+    texts = ["x" * 40] * 6  # 11 estimated tokens each
+
+    # When
+    embeddings = await batcher.embed(texts)
+
+    # Then
+    assert len(embeddings) == 6
+    assert [len(request) for request in server.requests] == [2, 2, 2]
+
+@pytest.mark.asyncio
+async def test_concurrent_documents_share_batches():
+    # Given
+    server = FakeEmbeddingsServer(delay=0.01)
+    batcher = make_batcher(server, max_concurrency=1)
+
+    # When
+    results = await asyncio.gather(*(
+        batcher.embed([f"doc {i} chunk {j}" for j in range(3)]) for i in range(5)
+    ))
+
+    # Then
+    assert all(len(result) == 3 for result in results)
+    assert len(server.requests) < 5
+    assert server.peak_in_flight == 1
+
+@pytest.mark.asyncio
+async def test_max_wait_batches_single_text_callers():
+    # Given
+    server = FakeEmbeddingsServer()
+    batcher = make_batcher(server, max_wait_ms=20)
+
+    # When
+    results = await asyncio.gather(*(batcher.embed(["q" * i]) for i in range(1, 9)))
+
+    # Then
+    assert [result[0][0] for result in results] == [float(i) for i in range(1, 9)]
+    assert len(server.requests) == 1
+    assert batcher.batches_sent == 1
+
+@pytest.mark.asyncio
+async def test_retries_rate_limits():
+    # Given
+    server = FakeEmbeddingsServer(rate_limited=2)
+    batcher = make_batcher(server, max_retries=3)
+
+    # When
+    embeddings = await batcher.embed(["text"])
+
+    # Then
+    assert len(embeddings) == 1
+    assert batcher.retries == 2
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    # Given
+    server = FakeEmbeddingsServer(rate_limited=10)
+    batcher = make_batcher(server, max_retries=2)
+
+    # When / Then
+    with pytest.raises(EmbeddingError, match="after 3 attempts"):
+        await batcher.embed(["text"])
+    assert batcher.retries == 2
+
+@pytest.mark.asyncio
+async def test_reports_progress_as_batches_return():
+    # Given
+    server = FakeEmbeddingsServer()
+    batcher = make_batcher(server, max_batch_size=2)
+    seen = []
+
+    # When
+    await batcher.embed(["a", "b", "c"], on_embedded=seen.append)
+
+    # Then
+    assert seen == [1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_close_cancels_waiting_callers():
+    # Given
+    server = FakeEmbeddingsServer(delay=1)
+    batcher = make_batcher(server)
+    waiting = asyncio.create_task(batcher.embed(["text"]))
+    await asyncio.sleep(0.01)
+
+    # When
+    await batcher.close()
+
+    # Then
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
@@ -0,0 +1,154 @@
+import asyncio
+import concurrent.futures
+import time
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from processing import extraction
+from processing.extraction import ExtractionPool
+from processing.exceptions import ExtractionError
+
+def _decode(contents: bytes) -> str:
+    return contents.decode()
+
+def _hang(contents: bytes) -> str:
+    time.sleep(10)
+    return ""
+
+def _allocate(contents: bytes) -> str:
+    return "x" * (512 * 1024 * 1024)
+
+@pytest.fixture
+def make_pool():
+    pools = []
+    def _make(**kwargs):
+        pool = ExtractionPool(workers=1, **kwargs)
+        pools.append(pool)
+        return pool
+    yield _make
+    for pool in pools:
+        pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_extract_runs_in_worker(make_pool):
+    # Given
+    pool = make_pool(extract_fn=_decode)
+
+    # When
+    text = await pool.extract(b"Test document content")
+
+    # Then
+    assert text == "Test document content"
+
+@pytest.mark.asyncio
+async def test_extract_timeout(make_pool):
+    # Given
+    pool = make_pool(extract_fn=_hang, timeout=0.5)
+
+    # When / Then
+    with pytest.raises(ExtractionError, match="timed out"):
+        await pool.extract(b"content")
+    assert pool.restarts == 0
+
+@pytest.mark.asyncio
+async def test_extract_memory_limit(make_pool):
+    # Given
+    pool = make_pool(extract_fn=_allocate, memory_limit_mb=256)
+
+    # When / Then
+    with pytest.raises(ExtractionError, match="memory limit"):
+        await pool.extract(b"content")
+
+@pytest.mark.asyncio
+async def test_pool_usable_after_failure(make_pool):
+    # Given
+    pool = make_pool(extract_fn=_hang, timeout=0.5)
+    with pytest.raises(ExtractionError):
+        await pool.extract(b"content")
+
+    # When
+    pool.extract_fn = _decode
+    text = await pool.extract(b"recovered")
+
+    # Then
+    assert text == "recovered"
+
+class FakeExecutor:
+    """Stands in for a process pool: "hang" never finishes, "crash" kills its worker and
+    with it every job in the pool, anything else is decoded once the test releases it"""
+
+    def __init__(self):
+        self._processes = {}
+        self.futures = []
+
+    def submit(self, fn, extract_fn, timeout, source):
+        future = concurrent.futures.Future()
+        self.futures.append((future, source))
+        if source == b"crash":
+            asyncio.get_running_loop().call_soon(self.crash)
+        return future
+
+    def release(self):
+        for future, source in self.futures:
+            if source not in (b"hang", b"crash") and not future.done():
+                future.set_result(source.decode())
+
+    def crash(self):
+        for future, _ in self.futures:
+            if not future.done():
+                future.set_exception(BrokenProcessPool("A worker died"))
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        # Killing the workers breaks every job still running in them
+        self.crash()
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    monkeypatch.setattr(extraction, "KILL_GRACE_SECONDS", 0)
+    pool = ExtractionPool(timeout=0.1)
+    executors = []
+    def create_executor():
+        executors.append(FakeExecutor())
+        return executors[-1]
+    pool._create_executor = create_executor
+    return pool, executors
+
+async def release_when_replaced(executors, count: int):
+    while len(executors) < count:
+        await asyncio.sleep(0.01)
+    executors[-1].release()
+
+@pytest.mark.asyncio
+async def test_jobs_killed_with_a_stuck_one_are_resubmitted(fake_pool):
+    # Given a job stuck past its deadline and another one running next to it
+    pool, executors = fake_pool
+
+    async def innocent():
+        await asyncio.sleep(0.05)
+        return await pool.extract(b"innocent")
+
+    # When
+    stuck, other, _ = await asyncio.gather(
+        pool.extract(b"hang"), innocent(), release_when_replaced(executors, 2), return_exceptions=True
+    )
+
+    # Then only the stuck job fails, the other is run again on the new pool
+    assert isinstance(stuck, ExtractionError)
+    assert other == "innocent"
+    assert pool.restarts == 1
+
+@pytest.mark.asyncio
+async def test_job_crashing_the_pool_again_fails(fake_pool):
+    # Given
+    pool, executors = fake_pool
+
+    # When a worker dies, nobody knows which job killed it
+    crashing, other, _ = await asyncio.gather(
+        pool.extract(b"crash"), pool.extract(b"innocent"), release_when_replaced(executors, 2),
+        return_exceptions=True
+    )
+
+    # Then every job in the pool is retried once, the one crashing the pool again fails
+    assert isinstance(crashing, ExtractionError)
+    assert other == "innocent"
+    assert pool.restarts == 2
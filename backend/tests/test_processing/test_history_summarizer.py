@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, Mock
+from processing.conversation import SUMMARY_NAME
+from processing.history_summarizer import HistorySummarizer
+from storage.conversation_store import InMemoryConversationStore
+
+def turns(count, words=20):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Turn {i} " + "word " * words}
+        for i in range(count)
+    ]
+
+@pytest.fixture
+def mock_openai():
+    client = AsyncMock()
+    choice = Mock()
+    choice.message.content = "Summary of earlier turns"
+    client.chat.completions.create = AsyncMock(return_value=Mock(choices=[choice]))
+    return client
+
+async def drain(summarizer):
+    await asyncio.gather(*summarizer._background)
+
+@pytest.mark.asyncio
+async def test_replaces_older_turns_with_summary(mock_openai):
+    # Given
+    store = InMemoryConversationStore()
+    history = turns(8)
+    await store.update_history("conv", history)
+    summarizer = HistorySummarizer(mock_openai, store, trigger_tokens=100, keep_recent=2)
+
+    # When
+    summarizer.schedule("conv", history)
+    await drain(summarizer)
+
+    # Then
+    summarized = await store.get_history("conv")
+    assert summarized[0] == {"role": "system", "name": SUMMARY_NAME, "content": "Summary of earlier turns"}
+    assert summarized[1:] == history[-2:]
+    assert summarizer.summaries == 1
+
+@pytest.mark.asyncio
+async def test_short_history_is_left_alone(mock_openai):
+    # Given
+    store = InMemoryConversationStore()
+    history = turns(8, words=1)
+    await store.update_history("conv", history)
+    summarizer = HistorySummarizer(mock_openai, store, trigger_tokens=1000, keep_recent=2)
+
+    # When
+    summarizer.schedule("conv", history)
+
+    # Then
+    assert not summarizer._background
+    mock_openai.chat.completions.create.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_history_changed_during_summary_is_kept(mock_openai):
+    # Given
+    store = InMemoryConversationStore()
+    history = turns(8)
+    await store.update_history("conv", history)
+    summarizer = HistorySummarizer(mock_openai, store, trigger_tokens=100, keep_recent=2)
+
+    async def clear_history(**kwargs):
+        # Another worker trimmed the conversation meanwhile
+        await store.update_history("conv", history[-1:])
+        return Mock(choices=[Mock(message=Mock(content="stale summary"))])
+    mock_openai.chat.completions.create = AsyncMock(side_effect=clear_history)
+
+    # When
+    summarizer.schedule("conv", history)
+    await drain(summarizer)
+
+    # Then
+    assert await store.get_history("conv") == history[-1:]
+    assert summarizer.summaries == 0
@@ -0,0 +1,212 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from unittest.mock import Mock, AsyncMock
+from pathlib import Path
+from uuid import UUID
+
+from processing.job_queue import IngestionQueue
+from processing.processor import DocumentProcessor
+from processing.doc_status import DocumentStatus
+from processing.exceptions import ProcessingError
+from storage.storage_manager import StorageManager
+from storage.file_system_storage import SpooledFile
+
+DOC_ID = UUID('12345678-1234-5678-1234-567812345678')
+DOC_PATH = Path("/data/documents/12345678-1234-5678-1234-567812345678/original")
+
+def spooled(name: str = "upload") -> SpooledFile:
+    return SpooledFile(path=Path(f"/data/temp/{name}"), size_bytes=7, content_hash=name, head=b"content")
+
+@pytest.fixture
+def mock_processor():
+    processor = Mock(spec=DocumentProcessor)
+    processor.storage = Mock(spec=StorageManager)
+    processor.storage.save_or_get_spooled_document = AsyncMock(return_value=(DOC_ID, True))
+    processor.storage.document_path = Mock(return_value=DOC_PATH)
+    processor.storage.get_document_metadata = AsyncMock(return_value=Mock(status=DocumentStatus.COMPLETED.value))
+    processor.storage.get_stale_document_ids = AsyncMock(return_value=[])
+    processor.storage.is_stale = Mock(side_effect=lambda doc: doc.status != DocumentStatus.COMPLETED.value)
+    processor.process_saved_document = AsyncMock(return_value=True)
+    return processor
+
+@pytest_asyncio.fixture
+async def queue(mock_processor):
+    queue = IngestionQueue(mock_processor, workers=2, max_pending=10)
+    await queue.start()
+    yield queue
+    await queue.stop()
+
+@pytest.mark.asyncio
+async def test_submit_returns_id_before_processing(queue, mock_processor):
+    # Given
+    release = asyncio.Event()
+    async def slow_pipeline(doc_id, content, progress):
+        await release.wait()
+        return True
+    mock_processor.process_saved_document.side_effect = slow_pipeline
+
+    # When
+    upload = spooled()
+    doc_id, created = await queue.submit(upload, "test.txt")
+
+    # Then
+    assert doc_id == DOC_ID
+    assert created
+    mock_processor.storage.save_or_get_spooled_document.assert_called_once_with(upload, "test.txt")
+    assert queue.get_progress(str(doc_id)).current_stage == DocumentStatus.PENDING.value
+    release.set()
+    await queue.queue.join()
+    mock_processor.process_saved_document.assert_called_once_with(DOC_ID, DOC_PATH, queue.get_progress(str(DOC_ID)))
+
+@pytest.mark.asyncio
+async def test_workers_process_concurrently(queue, mock_processor):
+    # Given
+    running = 0
+    peak = 0
+    async def pipeline(doc_id, content, progress):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return True
+    mock_processor.process_saved_document.side_effect = pipeline
+
+    # When
+    for i in range(4):
+        await queue.submit(spooled(str(i)), f"test{i}.txt")
+    await queue.queue.join()
+
+    # Then
+    assert peak == 2
+    assert mock_processor.process_saved_document.call_count == 4
+
+@pytest.mark.asyncio
+async def test_worker_survives_failed_job(queue, mock_processor):
+    # Given
+    mock_processor.process_saved_document.side_effect = [ProcessingError("boom"), True]
+
+    # When
+    await queue.submit(spooled("bad"), "bad.txt")
+    await queue.submit(spooled("good"), "good.txt")
+    await queue.queue.join()
+
+    # Then
+    assert mock_processor.process_saved_document.call_count == 2
+
+@pytest.mark.asyncio
+async def test_duplicate_upload_is_not_queued(queue, mock_processor):
+    # Given
+    mock_processor.storage.save_or_get_spooled_document.return_value = (DOC_ID, False)
+
+    # When
+    doc_id, created = await queue.submit(spooled(), "test.txt")
+
+    # Then
+    assert doc_id == DOC_ID
+    assert not created
+    assert queue.pending == 0
+    mock_processor.process_saved_document.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_duplicate_of_unfinished_upload_is_queued_again(queue, mock_processor):
+    # Given an earlier identical upload that was never processed
+    mock_processor.storage.save_or_get_spooled_document.return_value = (DOC_ID, False)
+    mock_processor.storage.get_document_metadata.return_value = Mock(status=DocumentStatus.PENDING.value)
+    release = asyncio.Event()
+    async def slow_pipeline(doc_id, content, progress):
+        await release.wait()
+        return True
+    mock_processor.process_saved_document.side_effect = slow_pipeline
+
+    # When
+    first = await queue.submit(spooled(), "test.txt")
+    second = await queue.submit(spooled(), "test.txt")
+    release.set()
+    await queue.queue.join()
+
+    # Then the first resubmits it, the second finds it already queued here
+    assert first == (DOC_ID, True)
+    assert second == (DOC_ID, False)
+    mock_processor.process_saved_document.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_duplicate_of_upload_another_worker_is_on_is_not_queued(queue, mock_processor):
+    # Given an unfinished upload another worker holds a live claim on
+    mock_processor.storage.save_or_get_spooled_document.return_value = (DOC_ID, False)
+    mock_processor.storage.get_document_metadata.return_value = Mock(status=DocumentStatus.EXTRACTING.value)
+    mock_processor.storage.is_stale = Mock(return_value=False)
+
+    # When
+    result = await queue.submit(spooled(), "test.txt")
+
+    # Then
+    assert result == (DOC_ID, False)
+    mock_processor.process_saved_document.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_job_claimed_elsewhere_drops_its_progress(queue, mock_processor):
+    # Given another worker claimed the document first
+    mock_processor.process_saved_document.return_value = False
+
+    # When
+    await queue.submit(spooled(), "test.txt")
+    await queue.queue.join()
+
+    # Then the status is read from the metadata store instead
+    assert queue.get_progress(str(DOC_ID)) is None
+
+@pytest.mark.asyncio
+async def test_start_requeues_unfinished_documents(mock_processor):
+    # Given documents a previous run left pending or mid-pipeline
+    other_id = UUID(int=1)
+    mock_processor.storage.get_stale_document_ids.return_value = [DOC_ID, other_id]
+    queue = IngestionQueue(mock_processor, workers=1, max_pending=1)
+
+    # When
+    await queue.start()
+    while mock_processor.process_saved_document.call_count < 2:
+        await asyncio.sleep(0)
+    await queue.queue.join()
+    await queue.stop()
+
+    # Then
+    processed = [call.args[0] for call in mock_processor.process_saved_document.call_args_list]
+    assert processed == [DOC_ID, other_id]
+
+@pytest.mark.asyncio
+async def test_stale_documents_are_requeued_periodically(mock_processor):
+    # Given a document that goes stale after start, its worker having stopped
+    mock_processor.storage.get_stale_document_ids.side_effect = [[], [DOC_ID]] + [[]] * 100
+    queue = IngestionQueue(mock_processor, workers=1, requeue_interval=0.01)
+
+    # When
+    await queue.start()
+    while not mock_processor.process_saved_document.called:
+        await asyncio.sleep(0.01)
+    await queue.stop()
+
+    # Then
+    mock_processor.process_saved_document.assert_called_once_with(DOC_ID, DOC_PATH, queue.get_progress(str(DOC_ID)))
+
+@pytest.mark.asyncio
+async def test_submit_before_start_fails(mock_processor):
+    queue = IngestionQueue(mock_processor)
+    upload = spooled()
+
+    with pytest.raises(ProcessingError):
+        await queue.submit(upload, "test.txt")
+    mock_processor.storage.discard_spooled.assert_called_once_with(upload)
+
+def test_progress_tracking_is_bounded(mock_processor):
+    # Given
+    queue = IngestionQueue(mock_processor, max_tracked=2)
+
+    # When
+    for i in range(3):
+        queue._track(Mock(doc_id=str(i)))
+
+    # Then
+    assert queue.get_progress("0") is None
+    assert list(queue.progress) == ["1", "2"]
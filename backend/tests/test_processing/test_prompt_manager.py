@@ -1,5 +1,8 @@
 import pytest
 from processing.prompt_manager import PromptManager
+from processing.conversation import summary_message
+from processing import tokens
+from processing.tokens import REPLY_PRIMING_TOKENS, _count_history_tokens, count_message_tokens, count_tokens, load_encoding
 
 @pytest.fixture
 def prompt_manager():
@@ -94,3 +97,97 @@ def test_create_chat_messages_with_empty_history(prompt_manager):
     assert len(messages) == 2  # Should only have system and user message
     assert messages[0]["role"] == "system"
     assert messages[1]["role"] == "user"
+
+def _tokens(messages):
+    return REPLY_PRIMING_TOKENS + sum(count_message_tokens(message) for message in messages)
+
+def test_budget_keeps_most_recent_turns():
+    # Given
+    prompt_manager = PromptManager(token_budget=250)
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"Turn {i} " + "word " * 30}
+        for i in range(10)
+    ]
+
+    # When
+    messages = prompt_manager.create_chat_messages("Follow-up question", "Relevant context", history)
+
+    # Then
+    kept = messages[1:-1]
+    assert 0 < len(kept) < len(history)
+    assert kept == history[-len(kept):]
+    assert "Relevant context" in messages[-1]["content"]
+    assert _tokens(messages) <= 250
+
+def test_budget_drops_least_relevant_context_blocks():
+    # Given
+    prompt_manager = PromptManager(token_budget=200)
+    context = "\n\n".join(f"[{i}] " + f"block{i} " * 40 for i in range(1, 4))
+
+    # When
+    messages = prompt_manager.create_chat_messages("Question", context)
+
+    # Then
+    assert "[1] block1" in messages[-1]["content"]
+    assert "[3] block3" not in messages[-1]["content"]
+    assert _tokens(messages) <= 200
+
+def test_budget_prefers_summary_over_older_turns():
+    # Given
+    prompt_manager = PromptManager(token_budget=200)
+    history = [summary_message("The user is planning a trip to Paris.")] + [
+        {"role": "user", "content": "word " * 60},
+        {"role": "assistant", "content": "Short answer"}
+    ]
+
+    # When
+    messages = prompt_manager.create_chat_messages("Question", "Context", history)
+
+    # Then
+    assert messages[1] == history[0]
+    assert messages[2] == {"role": "assistant", "content": "Short answer"}
+    assert len(messages) == 4
+
+def test_only_history_token_counts_are_cached():
+    # Given
+    _count_history_tokens.cache_clear()
+    manager = PromptManager(token_budget=4000)
+    history = [
+        {"role": "user", "content": "Where is the printer?"},
+        {"role": "assistant", "content": "On floor two."}
+    ]
+
+    # When
+    for context in ("first retrieved context", "second retrieved context"):
+        manager.create_chat_messages("And the toner?", context, history)
+
+    # Then the two history messages are counted once, contexts and prompts never cached
+    info = _count_history_tokens.cache_info()
+    assert (info.currsize, info.hits) == (2, 2)
+
+def test_count_tokens_reuses_the_encoding_loaded_at_startup(monkeypatch):
+    # Given
+    loads = []
+
+    class WordEncoding:
+        def encode(self, text, disallowed_special):
+            return text.split()
+
+    class FakeTiktoken:
+        @staticmethod
+        def encoding_for_model(model):
+            loads.append(model)
+            return WordEncoding()
+
+    monkeypatch.setattr(tokens, "tiktoken", FakeTiktoken)
+    tokens._encoding.cache_clear()
+
+    # When
+    loaded = load_encoding("gpt-test")
+    count = count_tokens("three word text", "gpt-test")
+    tokens._encoding.cache_clear()
+
+    # Then
+    assert loaded
+    assert count == 3
+    assert loads == ["gpt-test"]
@@ -1,11 +1,14 @@
+import asyncio
 import pytest
 from unittest.mock import Mock, AsyncMock
 from uuid import UUID
 
-from backend.processing.query_processor import QueryProcessor
+from backend.processing.query_processor import QueryProcessor, ChunkResult, reciprocal_rank_fusion
 from backend.processing.config import ProcessingConfig
+from backend.processing.response_cache import LRUCache
 from backend.processing.exceptions import EmbeddingError
 from backend.storage.storage_manager import StorageManager
+from backend.storage.lexical_index import LexicalIndex
 from backend.storage.storage_interface import ChunkMetadata
 
 @pytest.fixture
@@ -28,6 +31,19 @@ def config():
 def processor(mock_storage, mock_openai, config):
     return QueryProcessor(mock_storage, mock_openai, config)
 
+@pytest.fixture
+def lexical_index():
+    index = LexicalIndex()
+    doc_id = UUID("12345678-1234-5678-1234-567812345678")
+    index.add_chunks([
+        ChunkMetadata(id=UUID(int=1), document_id=doc_id, sequence=0, content="Ticket INC-20431 is resolved"),
+        ChunkMetadata(id=UUID(int=2), document_id=doc_id, sequence=1, content="The printer jams on heavy paper")
+    ])
+    return index
+
+def chunk(embedding_id, score=0.0):
+    return ChunkResult(content=embedding_id, document_id="doc", sequence=0, embedding_id=embedding_id, score=score)
+
 @pytest.mark.asyncio
 @pytest.mark.skip("Not implemented")
 async def test_generate_embedding(processor, mock_openai):
@@ -57,6 +73,31 @@ async def test_generate_embedding_error(processor, mock_openai):
     with pytest.raises(EmbeddingError):
         await processor._generate_embedding("Failed to generate query embedding: API error")
 
+@pytest.mark.asyncio
+async def test_query_embedding_is_cancelled_with_its_last_caller(processor, mock_openai):
+    # Given
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def create(**kwargs):
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    mock_openai.embeddings.create = create
+    caller = asyncio.create_task(processor._generate_embedding("printer setup"))
+    await started.wait()
+
+    # When
+    caller.cancel()
+
+    # Then
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+    assert processor._embedding_flight.in_flight == 0
+
 def test_format_context(processor):
     # Given
     chunks = [
@@ -81,7 +122,8 @@ async def test_get_relevant_chunks(processor, mock_storage):
         'metadatas': [[
             {'document_id': str(UUID(int=10)), 'sequence': 1},
             {'document_id': str(UUID(int=11)), 'sequence': 2}
-        ]]
+        ]],
+        'distances': [[0.1, 0.3]]
     }
     mock_storage.vectors.search.return_value = mock_search_results
 
@@ -90,25 +132,42 @@ async def test_get_relevant_chunks(processor, mock_storage):
 
     # Then
     assert len(result) == 2
-    assert str(result[0].document_id) == str(UUID(int=10))
-    assert result[0].sequence == 1
-    assert result[0].content == "content1"
+    assert result[0]["document_id"] == str(UUID(int=10))
+    assert result[0]["sequence"] == 1
+    assert result[0]["content"] == "content1"
+    assert result[0]["score"] == pytest.approx(0.9)
+
+@pytest.mark.asyncio
+async def test_get_relevant_chunks_drops_below_threshold(processor, mock_storage):
+    # Given
+    mock_storage.vectors.search.return_value = {
+        'ids': [[str(UUID(int=1)), str(UUID(int=2))]],
+        'documents': [["close", "far"]],
+        'metadatas': [[
+            {'document_id': str(UUID(int=10)), 'sequence': 1},
+            {'document_id': str(UUID(int=11)), 'sequence': 2}
+        ]],
+        'distances': [[0.2, 0.8]]
+    }
+
+    # When
+    result = await processor.get_relevant_chunks([0.1, 0.2], limit=2, min_similarity=0.5)
+
+    # Then
+    assert [chunk["content"] for chunk in result] == ["close"]
 
 @pytest.mark.asyncio
-@pytest.mark.skip("Not implemented")
 async def test_process_query(processor):
     # Given
     query = "test query"
     embedding = [0.1, 0.2, 0.3]
-    chunks = [
-        ChunkMetadata(
-            id=UUID(int=1),
-            document_id=UUID(int=10),
-            sequence=1,
-            content="relevant content",
-            embedding_id=str(UUID(int=1))
-        )
-    ]
+    chunks = [{
+        "content": "relevant content",
+        "document_id": str(UUID(int=10)),
+        "sequence": 1,
+        "embedding_id": str(UUID(int=1)),
+        "score": 0.9
+    }]
 
     processor._generate_embedding = AsyncMock(return_value=embedding)
     processor.get_relevant_chunks = AsyncMock(return_value=chunks)
@@ -120,5 +179,225 @@ async def test_process_query(processor):
     assert result["query"] == query
     assert result["chunks"] is not None
     assert isinstance(result["context"], str)
+    assert result["context"] == "[1] relevant content"
+    assert not result["degraded"]
+    assert set(result["timings"]) == {"embed", "search", "format", "total"}
     processor._generate_embedding.assert_called_once_with(query)
     processor.get_relevant_chunks.assert_called_once_with(embedding, limit=1)
+
+@pytest.mark.asyncio
+async def test_process_query_uses_configured_top_k(mock_storage, mock_openai):
+    # Given
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(retrieval_top_k=7))
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+    processor.get_relevant_chunks = AsyncMock(return_value=[])
+
+    # When
+    await processor.process_query("test query")
+
+    # Then
+    processor.get_relevant_chunks.assert_called_once_with([0.1], limit=7)
+
+@pytest.mark.asyncio
+async def test_process_query_degrades_when_budget_exceeded(mock_storage, mock_openai):
+    # Given
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(retrieval_latency_budget_ms=50))
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+
+    async def slow_search(*args, **kwargs):
+        await asyncio.sleep(1)
+    processor.get_relevant_chunks = slow_search
+
+    # When
+    result = await processor.process_query("test query")
+
+    # Then
+    assert result["degraded"]
+    assert result["chunks"] == []
+    assert result["context"] == ""
+    assert processor.latency.stats()["degraded"] == 1
+
+@pytest.mark.asyncio
+async def test_process_query_error(processor):
+    # Given
+    processor._generate_embedding = AsyncMock(side_effect=Exception("API error"))
+
+    # When / Then
+    # The module raises the error class imported as processing.exceptions
+    with pytest.raises(Exception, match="Query processing failed: API error"):
+        await processor.process_query("test query")
+
+def test_reciprocal_rank_fusion():
+    # Given
+    vector = [chunk("a", 0.9), chunk("b", 0.8), chunk("c", 0.7)]
+    lexical = [chunk("c", 12.0), chunk("d", 9.0), chunk("a", 3.0)]
+
+    # When
+    fused = reciprocal_rank_fusion([vector, lexical], limit=3, k=60)
+
+    # Then
+    # "a" is ranked 1st and 3rd, "c" 3rd and 1st, both beat chunks found by one retriever
+    assert [result["embedding_id"] for result in fused[:2]] == ["a", "c"]
+    assert fused[0]["score"] == pytest.approx(1 / 61 + 1 / 63)
+    assert len(fused) == 3
+
+@pytest.mark.asyncio
+async def test_process_query_lexical_mode(mock_storage, mock_openai, lexical_index):
+    # Given
+    config = ProcessingConfig(retrieval_mode="lexical")
+    processor = QueryProcessor(mock_storage, mock_openai, config, lexical_index=lexical_index)
+    processor._generate_embedding = AsyncMock()
+
+    # When
+    result = await processor.process_query("INC-20431")
+
+    # Then
+    assert result["chunks"][0]["embedding_id"] == str(UUID(int=1))
+    assert result["context"] == "[1] Ticket INC-20431 is resolved"
+    processor._generate_embedding.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_process_query_hybrid_fuses_results(mock_storage, mock_openai, lexical_index):
+    # Given
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(retrieval_top_k=2), lexical_index=lexical_index)
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+    processor.get_relevant_chunks = AsyncMock(return_value=[chunk("vector-only", 0.9)])
+
+    # When
+    result = await processor.process_query("INC-20431")
+
+    # Then
+    ids = [result_chunk["embedding_id"] for result_chunk in result["chunks"]]
+    assert set(ids) == {"vector-only", str(UUID(int=1))}
+    assert not result["degraded"]
+    assert set(result["timings"]) == {"lexical", "embed", "search", "format", "total"}
+    processor.get_relevant_chunks.assert_called_once_with([0.1], limit=20, with_content=False)
+
+@pytest.mark.asyncio
+async def test_process_query_hybrid_loads_content_of_fused_chunks_only(mock_storage, mock_openai, lexical_index):
+    # Given
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(retrieval_top_k=2), lexical_index=lexical_index)
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+    mock_storage.vectors.search.return_value = {
+        'ids': [["vector-only", str(UUID(int=2)), "dropped"]],
+        'metadatas': [[{'document_id': "doc", 'sequence': i} for i in range(3)]],
+        'distances': [[0.1, 0.2, 0.3]],
+        'documents': None
+    }
+    mock_storage.vectors.get_contents.return_value = {"vector-only": "Only in the vector store"}
+
+    # When
+    result = await processor.process_query("INC-20431")
+
+    # Then
+    mock_storage.vectors.search.assert_called_once_with([0.1], limit=20, include_documents=False)
+    # The lexical index already holds the text of chunk 2, "dropped" did not survive fusion
+    mock_storage.vectors.get_contents.assert_called_once_with(["vector-only"])
+    assert [c["content"] for c in result["chunks"]] == ["Only in the vector store", "Ticket INC-20431 is resolved"]
+
+@pytest.mark.asyncio
+async def test_process_query_hybrid_falls_back_to_lexical(mock_storage, mock_openai, lexical_index):
+    # Given
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(), lexical_index=lexical_index)
+    processor._generate_embedding = AsyncMock(side_effect=Exception("API error"))
+
+    # When
+    result = await processor.process_query("INC-20431")
+
+    # Then
+    assert result["degraded"]
+    assert result["chunks"][0]["embedding_id"] == str(UUID(int=1))
+
+@pytest.mark.asyncio
+async def test_process_query_reranks_wider_pool(mock_storage, mock_openai):
+    # Given
+    reranker = Mock()
+    reranker.rerank = AsyncMock(side_effect=lambda query, chunks, top_n: list(reversed(chunks))[:top_n])
+    config = ProcessingConfig(retrieval_top_k=2, rerank_candidates=50)
+    processor = QueryProcessor(mock_storage, mock_openai, config, reranker=reranker)
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+    processor.get_relevant_chunks = AsyncMock(return_value=[chunk("a"), chunk("b"), chunk("c")])
+
+    # When
+    result = await processor.process_query("test query")
+
+    # Then
+    processor.get_relevant_chunks.assert_called_once_with([0.1], limit=50)
+    assert [c["embedding_id"] for c in result["chunks"]] == ["c", "b"]
+    assert "rerank" in result["timings"]
+    assert {"p50_ms", "p99_ms"} <= set(processor.latency.stats()["stages"]["rerank"])
+
+@pytest.mark.asyncio
+async def test_process_query_keeps_retrieval_order_when_rerank_fails(mock_storage, mock_openai):
+    # Given
+    reranker = Mock()
+    reranker.rerank = AsyncMock(side_effect=RuntimeError("model failed"))
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(retrieval_top_k=2), reranker=reranker)
+    processor._generate_embedding = AsyncMock(return_value=[0.1])
+    processor.get_relevant_chunks = AsyncMock(return_value=[chunk("a"), chunk("b"), chunk("c")])
+
+    # When
+    result = await processor.process_query("test query")
+
+    # Then
+    assert result["degraded"]
+    assert [c["embedding_id"] for c in result["chunks"]] == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_query_embeddings_cached_by_normalized_text(mock_storage, mock_openai):
+    # Given
+    mock_openai.embeddings.create.return_value.data = [Mock(embedding=[0.1, 0.2])]
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(), query_embeddings=LRUCache(10))
+
+    # When
+    first = await processor.embed_query("How do I reset my VPN?")
+    second = await processor.embed_query("  how do i reset  my vpn? ")
+
+    # Then
+    assert first == second == [0.1, 0.2]
+    mock_openai.embeddings.create.assert_called_once()
+    assert processor.embedding_stats()["cache"]["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_queries_share_one_embedding(mock_storage, mock_openai):
+    # Given
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.01)
+        return Mock(data=[Mock(embedding=[0.3])])
+    mock_openai.embeddings.create = AsyncMock(side_effect=slow_create)
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig())
+
+    # When
+    results = await asyncio.gather(*(processor.embed_query("same question") for _ in range(5)))
+
+    # Then
+    assert results == [[0.3]] * 5
+    mock_openai.embeddings.create.assert_called_once()
+    assert processor.embedding_stats()["coalesced"] == 4
+
+@pytest.mark.asyncio
+async def test_query_embeddings_go_through_batcher(mock_storage, mock_openai):
+    # Given
+    embedder = Mock()
+    embedder.embed = AsyncMock(return_value=[[0.5]])
+    embedder.batches_sent = 1
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(), embedder=embedder)
+
+    # When
+    embedding = await processor.embed_query("question")
+
+    # Then
+    assert embedding == [0.5]
+    embedder.embed.assert_called_once_with(["question"])
+    mock_openai.embeddings.create.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_query_embedding_failure_is_not_cached(mock_storage, mock_openai):
+    # Given
+    mock_openai.embeddings.create.side_effect = Exception("API error")
+    processor = QueryProcessor(mock_storage, mock_openai, ProcessingConfig(), query_embeddings=LRUCache(10))
+
+    # When / Then
+    with pytest.raises(Exception, match="Failed to generate query embedding: API error"):
+        await processor.embed_query("question")
+    assert len(processor.query_embeddings.entries) == 0
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from unittest.mock import Mock
+
+from backend.processing.reranker import Reranker, OverlapScorer
+
+def chunk(content, score=0.0):
+    return {"content": content, "document_id": "doc", "sequence": 0, "embedding_id": content, "score": score}
+
+def test_overlap_scorer_prefers_covering_passages():
+    # Given
+    scorer = OverlapScorer()
+    query = "how do I reset the vpn password"
+
+    # When
+    scores = scorer.score([
+        (query, "Printer drivers are installed automatically."),
+        (query, "Your VPN account is separate from email."),
+        (query, "To reset the VPN password open the portal."),
+    ])
+
+    # Then
+    assert scores[0] == 0.0
+    assert scores[2] > scores[1] > scores[0]
+
+def test_overlap_scorer_ignores_stopword_only_queries():
+    assert OverlapScorer().score([("what is it", "it is what it is")]) == [0.0]
+
+@pytest.mark.asyncio
+async def test_rerank_reorders_and_keeps_top_n():
+    # Given
+    reranker = Reranker(max_wait_ms=0)
+    chunks = [chunk("unrelated text"), chunk("vpn setup guide"), chunk("reset the vpn password")]
+
+    # When
+    result = await reranker.rerank("reset vpn password", chunks, top_n=2)
+    await reranker.close()
+
+    # Then
+    assert [c["content"] for c in result] == ["reset the vpn password", "vpn setup guide"]
+    assert result[0]["score"] > result[1]["score"]
+
+@pytest.mark.asyncio
+async def test_concurrent_reranks_share_a_batch():
+    # Given
+    scorer = Mock()
+    scorer.score = Mock(side_effect=lambda pairs: [float(len(passage)) for _, passage in pairs])
+    reranker = Reranker(scorer=scorer, max_wait_ms=20)
+
+    # When
+    results = await asyncio.gather(
+        reranker.rerank("first", [chunk("a"), chunk("bbb")], top_n=1),
+        reranker.rerank("second", [chunk("cc"), chunk("d"), chunk("eeee")], top_n=2)
+    )
+    await reranker.close()
+
+    # Then
+    scorer.score.assert_called_once()
+    assert len(scorer.score.call_args.args[0]) == 5
+    assert [c["content"] for c in results[0]] == ["bbb"]
+    assert [c["content"] for c in results[1]] == ["eeee", "cc"]
+    assert reranker.stats()["batches"] == 1
+
+@pytest.mark.asyncio
+async def test_rerank_batches_are_capped():
+    # Given
+    scorer = Mock()
+    scorer.score = Mock(side_effect=lambda pairs: [0.0] * len(pairs))
+    reranker = Reranker(scorer=scorer, max_batch_pairs=2, max_wait_ms=20)
+
+    # When
+    await asyncio.gather(*(reranker.rerank(str(i), [chunk("a"), chunk("b")], top_n=1) for i in range(3)))
+    await reranker.close()
+
+    # Then
+    assert scorer.score.call_count == 3
+
+@pytest.mark.asyncio
+async def test_rerank_error_reaches_caller():
+    # Given
+    scorer = Mock()
+    scorer.score = Mock(side_effect=RuntimeError("model failed"))
+    reranker = Reranker(scorer=scorer, max_wait_ms=0)
+
+    # When / Then
+    with pytest.raises(RuntimeError, match="model failed"):
+        await reranker.rerank("query", [chunk("a"), chunk("b")], top_n=1)
+    await reranker.close()
@@ -0,0 +1,113 @@
+import asyncio
+import pytest
+from processing.response_cache import ResponseCache, SingleFlight, history_hash, normalize_question
+
+def test_normalize_question():
+    assert normalize_question("  How do I   Reset\tmy password? ") == "how do i reset my password?"
+
+def test_history_hash():
+    assert history_hash(None) == history_hash([])
+    assert history_hash([{"role": "user", "content": "a"}]) != history_hash([])
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    # Given
+    flight = SingleFlight()
+    calls = 0
+    release = asyncio.Event()
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return "answer"
+
+    # When
+    waiters = [asyncio.create_task(flight.do("key", compute)) for _ in range(5)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters)
+
+    # Then
+    assert results == ["answer"] * 5
+    assert calls == 1
+    assert flight.coalesced == 4
+    assert flight.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors_and_forgets_them():
+    # Given
+    flight = SingleFlight()
+
+    async def fail():
+        raise ValueError("upstream down")
+
+    async def succeed():
+        return "ok"
+
+    # When / Then
+    with pytest.raises(ValueError):
+        await flight.do("key", fail)
+    assert await flight.do("key", succeed) == "ok"
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_cancelled_leader():
+    # Given
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def compute():
+        await release.wait()
+        return "answer"
+
+    leader = asyncio.create_task(flight.do("key", compute))
+    follower = asyncio.create_task(flight.do("key", compute))
+    await asyncio.sleep(0)
+
+    # When
+    leader.cancel()
+    release.set()
+
+    # Then
+    assert await follower == "answer"
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_call_without_waiters():
+    # Given
+    flight = SingleFlight()
+    started = asyncio.Event()
+    cancelled = asyncio.Event()
+
+    async def compute():
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    caller = asyncio.create_task(flight.do("key", compute))
+    await started.wait()
+
+    # When the only caller goes away
+    caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    # Then the call is cancelled and a new one starts afresh
+    assert flight.in_flight == 0
+    assert await flight.do("key", lambda: asyncio.sleep(0, result="fresh")) == "fresh"
+
+def test_response_cache_evicts_least_recently_used():
+    # Given
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", {"answer": "A"})
+    cache.put("b", {"answer": "B"})
+    cache.get("a")
+
+    # When
+    cache.put("c", {"answer": "C"})
+
+    # Then
+    assert cache.get("b") is None
+    assert cache.get("a") == {"answer": "A"}
+    assert cache.stats()["entries"] == 2
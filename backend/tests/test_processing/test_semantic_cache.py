@@ -0,0 +1,93 @@
+import pytest
+from processing.semantic_cache import SemanticCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+@pytest.fixture
+def cache(clock):
+    return SemanticCache(threshold=0.9, ttl_seconds=60, max_entries=2, clock=clock)
+
+def store(cache, embedding, answer, version=0, latency_ms=100.0):
+    cache.store(embedding, answer=answer, context="ctx", chunks=[], corpus_version=version, latency_ms=latency_ms)
+
+def test_hit_above_threshold(cache):
+    # Given
+    store(cache, [1.0, 0.0], "answer")
+
+    # When
+    hit = cache.lookup([0.99, 0.05], corpus_version=0)
+    miss = cache.lookup([0.0, 1.0], corpus_version=0)
+
+    # Then
+    assert hit.answer == "answer"
+    assert miss is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["saved_latency_ms"] == 100.0
+
+def test_returns_most_similar_entry(cache):
+    # Given
+    store(cache, [1.0, 0.0], "first")
+    store(cache, [0.95, 0.3], "second")
+
+    # When
+    hit = cache.lookup([0.94, 0.32], corpus_version=0)
+
+    # Then
+    assert hit.answer == "second"
+
+def test_new_corpus_version_invalidates(cache):
+    # Given
+    store(cache, [1.0, 0.0], "answer", version=1)
+
+    # When
+    result = cache.lookup([1.0, 0.0], corpus_version=2)
+
+    # Then
+    assert result is None
+    assert cache.stats()["entries"] == 0
+
+def test_stale_store_is_dropped(cache):
+    # Given
+    cache.lookup([1.0, 0.0], corpus_version=3)
+
+    # When
+    store(cache, [1.0, 0.0], "computed before the upload", version=2)
+
+    # Then
+    assert cache.stats()["entries"] == 0
+
+def test_expired_entries_miss(cache, clock):
+    # Given
+    store(cache, [1.0, 0.0], "answer")
+
+    # When
+    clock.now += 61
+    result = cache.lookup([1.0, 0.0], corpus_version=0)
+
+    # Then
+    assert result is None
+    assert cache.stats()["entries"] == 0
+
+def test_evicts_least_recently_used(cache):
+    # Given
+    store(cache, [1.0, 0.0], "first")
+    store(cache, [0.0, 1.0], "second")
+    cache.lookup([1.0, 0.0], corpus_version=0)
+
+    # When
+    store(cache, [-1.0, 0.0], "third")
+
+    # Then
+    assert cache.lookup([1.0, 0.0], corpus_version=0).answer == "first"
+    assert cache.lookup([0.0, 1.0], corpus_version=0) is None
+    assert cache.stats()["evictions"] == 1
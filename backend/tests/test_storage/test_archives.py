@@ -0,0 +1,123 @@
+import io
+import tarfile
+import zipfile
+import pytest
+
+from backend.storage.archives import ArchiveLimitError, ArchiveLimits, archive_entries, entry_filename, is_archive
+from backend.storage.file_system_storage import UploadTooLargeError
+
+FILES = {
+    "kb/guide.txt": b"printer setup " * 1000,
+    "kb/nested/faq.md": b"# FAQ",
+    "kb/.DS_Store": b"hidden",
+    "__MACOSX/kb/._guide.txt": b"resource fork",
+}
+
+def make_zip() -> io.BytesIO:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("kb/nested/", b"")
+        for name, content in FILES.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+def make_tar() -> io.BytesIO:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as archive:
+        for name, content in FILES.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    buffer.seek(0)
+    return buffer
+
+async def read_entries(
+    fileobj,
+    filename: str,
+    buffer_size: int = 1024,
+    limits: ArchiveLimits = ArchiveLimits()
+) -> dict[str, bytes | Exception]:
+    contents = {}
+    async with archive_entries(fileobj, filename, limits) as entries:
+        async for name, read in entries:
+            data = b""
+            try:
+                while chunk := await read(buffer_size):
+                    assert len(chunk) <= buffer_size
+                    data += chunk
+            except UploadTooLargeError as e:
+                data = e
+            contents[name] = data
+    return contents
+
+def test_is_archive():
+    assert is_archive("export.ZIP")
+    assert is_archive("export.tar.gz")
+    assert not is_archive("report.docx")
+    assert not is_archive(None)
+
+def test_entry_filename():
+    assert entry_filename("kb/nested/faq.md") == "faq.md"
+    assert entry_filename("kb\\windows\\notes.txt") == "notes.txt"
+    assert entry_filename("kb/.DS_Store") is None
+    assert entry_filename("__MACOSX/kb/._guide.txt") is None
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename, make_archive", [("kb.zip", make_zip), ("kb.tar.gz", make_tar)])
+async def test_archive_entries_streams_documents(filename, make_archive):
+    # Given
+    archive = make_archive()
+
+    # When
+    contents = await read_entries(archive, filename)
+
+    # Then
+    assert contents == {"guide.txt": FILES["kb/guide.txt"], "faq.md": FILES["kb/nested/faq.md"]}
+
+@pytest.mark.asyncio
+async def test_tar_entries_read_without_seeking():
+    # Given a tar stream that cannot seek, like a request body
+    class Unseekable(io.RawIOBase):
+        def __init__(self, data: bytes):
+            self.data = io.BytesIO(data)
+
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            chunk = self.data.read(len(buffer))
+            buffer[:len(chunk)] = chunk
+            return len(chunk)
+
+    # When
+    contents = await read_entries(Unseekable(make_tar().getvalue()), "kb.tar.gz")
+
+    # Then
+    assert set(contents) == {"guide.txt", "faq.md"}
+
+@pytest.mark.asyncio
+async def test_archive_entries_rejects_corrupt_archive():
+    with pytest.raises(Exception, match="not a zip file"):
+        await read_entries(io.BytesIO(b"not an archive"), "kb.zip")
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename, make_archive", [("kb.zip", make_zip), ("kb.tar.gz", make_tar)])
+async def test_entries_over_the_size_limit_are_refused(filename, make_archive):
+    # When
+    contents = await read_entries(make_archive(), filename, limits=ArchiveLimits(max_entry_bytes=1000))
+
+    # Then the large entry is listed but cannot be read, the others are stored
+    assert isinstance(contents["guide.txt"], UploadTooLargeError)
+    assert contents["faq.md"] == FILES["kb/nested/faq.md"]
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filename, make_archive", [("kb.zip", make_zip), ("kb.tar.gz", make_tar)])
+@pytest.mark.parametrize("limits, message", [
+    (ArchiveLimits(max_total_bytes=10_000), "expands to more than 10000 bytes"),
+    (ArchiveLimits(max_entries=3), "more than 3 files"),
+])
+async def test_archive_over_its_limits_stops(filename, make_archive, limits, message):
+    # When / Then
+    with pytest.raises(ArchiveLimitError, match=message):
+        await read_entries(make_archive(), filename, limits=limits)
@@ -0,0 +1,118 @@
+import json
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from storage.metadata_store import MetadataStore
+from storage.storage_interface import Conversation
+from storage.conversation_store import (
+    InMemoryConversationStore,
+    RedisConversationStore,
+    SqlConversationStore
+)
+
+MESSAGES = [
+    {"role": "user", "content": "Hello"},
+    {"role": "assistant", "content": "Hi there"}
+]
+
+@pytest_asyncio.fixture
+async def metadata_store(tmp_path):
+    store = MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.initialize()
+    yield store
+    await store.engine.dispose()
+
+class FakeRedis:
+    """The subset of redis.asyncio.Redis the store uses"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value.encode()
+        self.ttls[key] = ex
+
+    async def getex(self, key, ex=None):
+        if key in self.values:
+            self.ttls[key] = ex
+        return self.values.get(key)
+
+    async def aclose(self):
+        pass
+
+@pytest.mark.asyncio
+async def test_in_memory_store():
+    # Given
+    store = InMemoryConversationStore(max_history=3)
+
+    # When
+    await store.update_history("conv", MESSAGES)
+
+    # Then
+    assert await store.get_history("conv") == MESSAGES
+    assert await store.get_history("missing") is None
+
+@pytest.mark.asyncio
+async def test_sql_store_round_trip(metadata_store):
+    # Given
+    store = SqlConversationStore(metadata_store, max_history=3)
+
+    # When
+    await store.update_history("conv", MESSAGES)
+    await store.update_history("conv", MESSAGES * 2)
+
+    # Then
+    assert await store.get_history("conv") == (MESSAGES * 2)[-3:]
+    assert await store.get_history("missing") is None
+
+@pytest.mark.asyncio
+async def test_sql_store_shared_between_instances(metadata_store):
+    # Given
+    worker_a = SqlConversationStore(metadata_store)
+    worker_b = SqlConversationStore(metadata_store)
+
+    # When
+    await worker_a.update_history("conv", MESSAGES)
+
+    # Then
+    assert await worker_b.get_history("conv") == MESSAGES
+
+@pytest.mark.asyncio
+async def test_sql_store_expiry(metadata_store):
+    # Given
+    store = SqlConversationStore(metadata_store)
+    await store.update_history("expired", MESSAGES)
+    await store.update_history("live", MESSAGES)
+    async with metadata_store.session_local() as session:
+        await session.execute(
+            update(Conversation).where(Conversation.id == "expired")
+            .values(expires_at=datetime.now() - timedelta(minutes=1))
+        )
+        await session.commit()
+
+    # When
+    hidden = await store.get_history("expired")
+    deleted = await store.delete_expired()
+
+    # Then
+    assert hidden is None
+    assert deleted == 1
+    assert await store.get_history("live") == MESSAGES
+
+@pytest.mark.asyncio
+async def test_redis_store_uses_ttl():
+    # Given
+    client = FakeRedis()
+    store = RedisConversationStore(client=client, max_history=3, expiry_minutes=2)
+
+    # When
+    await store.update_history("conv", MESSAGES * 2)
+    history = await store.get_history("conv")
+
+    # Then
+    assert history == (MESSAGES * 2)[-3:]
+    assert json.loads(client.values["conversation:conv"]) == history
+    assert client.ttls["conversation:conv"] == 120
+    assert await store.get_history("missing") is None
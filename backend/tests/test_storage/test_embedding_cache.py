@@ -0,0 +1,107 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import event
+import storage.metadata_store as metadata_store_module
+from storage.metadata_store import MetadataStore
+from storage.embedding_cache import EmbeddingCache
+
+MODEL = "text-embedding-ada-002"
+
+@pytest_asyncio.fixture
+async def metadata_store(tmp_path):
+    store = MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.initialize()
+    yield store
+    await store.engine.dispose()
+
+@pytest.mark.asyncio
+async def test_get_many_reports_hits_and_misses(metadata_store):
+    # Given
+    cache = EmbeddingCache(metadata_store)
+    await cache.put_many(["cached text"], [[0.5, 0.25]], MODEL)
+
+    # When
+    results = await cache.get_many(["cached text", "new text"], MODEL)
+
+    # Then
+    assert results == [[0.5, 0.25], None]
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+@pytest.mark.asyncio
+async def test_entries_are_scoped_by_model(metadata_store):
+    # Given
+    cache = EmbeddingCache(metadata_store)
+    await cache.put("text", [1.0], MODEL)
+
+    # When
+    result = await cache.get("text", "text-embedding-3-small")
+
+    # Then
+    assert result is None
+
+@pytest.mark.asyncio
+async def test_put_existing_entry_is_ignored(metadata_store):
+    # Given
+    cache = EmbeddingCache(metadata_store)
+    await cache.put("text", [1.0], MODEL)
+
+    # When
+    await cache.put("text", [2.0], MODEL)
+
+    # Then
+    assert await cache.get("text", MODEL) == [1.0]
+
+@pytest.mark.asyncio
+async def test_least_recently_used_entries_are_evicted(metadata_store):
+    # Given
+    cache = EmbeddingCache(metadata_store, max_entries=2, evict_every=1)
+    await cache.put("old", [1.0], MODEL)
+    await cache.put("kept", [2.0], MODEL)
+    await cache.get("old", MODEL)
+
+    # When
+    await cache.put("new", [3.0], MODEL)
+
+    # Then
+    assert await cache.get("kept", MODEL) is None
+    assert await cache.get("old", MODEL) == [1.0]
+    assert await cache.get("new", MODEL) == [3.0]
+    assert cache.evictions == 1
+
+@pytest.mark.asyncio
+async def test_eviction_keeps_max_entries_when_a_batch_shares_a_timestamp(metadata_store):
+    # Given one batch of entries, all stamped with the same last_used_at
+    cache = EmbeddingCache(metadata_store, max_entries=3, evict_every=1000)
+    texts = [f"text {i}" for i in range(5)]
+    await cache.put_many(texts, [[float(i)] for i in range(5)], MODEL)
+
+    # When
+    evicted = await metadata_store.evict_cached_embeddings(3)
+
+    # Then
+    results = await cache.get_many(texts, MODEL)
+    assert evicted == 2
+    assert sum(result is not None for result in results) == 3
+
+@pytest.mark.asyncio
+async def test_get_many_binds_hashes_in_batches(metadata_store, monkeypatch):
+    # Given more texts than one statement may bind
+    monkeypatch.setattr(metadata_store_module, "INSERT_BATCH_SIZE", 2)
+    cache = EmbeddingCache(metadata_store)
+    texts = [f"text {i}" for i in range(5)]
+    await cache.put_many(texts, [[float(i)] for i in range(5)], MODEL)
+    bound = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        bound.append(len(parameters))
+
+    event.listen(metadata_store.engine.sync_engine, "before_cursor_execute", record)
+
+    # When
+    results = await cache.get_many(texts + ["new text"], MODEL)
+    event.remove(metadata_store.engine.sync_engine, "before_cursor_execute", record)
+
+    # Then each statement binds the model, the timestamp and at most a batch of hashes
+    assert results == [[float(i)] for i in range(5)] + [None]
+    assert max(bound) <= 4
@@ -3,9 +3,10 @@ import pytest
 import pathlib
 from unittest.mock import AsyncMock, patch, MagicMock
 from uuid import uuid4
+from hashlib import sha256
 # from pyfakefs.fake_filesystem import FakeFilesystem
 from pyfakefs.fake_filesystem_unittest import patchfs
-from backend.storage.file_system_storage import FileSystemStorage
+from backend.storage.file_system_storage import FileSystemStorage, MIME_SNIFF_BYTES, UploadTooLargeError
 from backend.storage.storage_interface import DocumentMetadata
 
 # @pytest.fixture
@@ -142,3 +143,80 @@ async def test_delete_document_error_handling(mock_is_dir, mock_exists, mock_rmt
         await storage.delete_document(doc_id)
     mock_rmtree.assert_called_once_with(doc_path)
 
+
+
+class ChunkedReader:
+    """Stands in for UploadFile.read, recording the sizes requested"""
+
+    def __init__(self, content: bytes):
+        self.content = content
+        self.offset = 0
+        self.requested = []
+
+    async def read(self, size: int) -> bytes:
+        self.requested.append(size)
+        chunk = self.content[self.offset:self.offset + size]
+        self.offset += len(chunk)
+        return chunk
+
+
+@pytest.mark.asyncio
+async def test_spool_streams_in_buffer_sized_pieces(tmp_path):
+    # Given
+    content = bytes(range(256)) * 100
+    reader = ChunkedReader(content)
+    storage = FileSystemStorage(base_path=str(tmp_path))
+
+    # When
+    spooled = await storage.spool(reader.read, buffer_size=1024)
+
+    # Then
+    assert set(reader.requested) == {1024}
+    assert spooled.path.parent == storage.temp_path
+    assert spooled.path.read_bytes() == content
+    assert spooled.size_bytes == len(content)
+    assert spooled.content_hash == sha256(content).hexdigest()
+    assert spooled.head == content[:MIME_SNIFF_BYTES]
+
+
+@pytest.mark.asyncio
+async def test_save_spooled_document_moves_file(tmp_path):
+    # Given
+    content = b"Test content"
+    storage = FileSystemStorage(base_path=str(tmp_path))
+    spooled = await storage.spool(ChunkedReader(content).read, buffer_size=4)
+    metadata = DocumentMetadata(id=uuid4(), filename="test.txt", mime_type="text/plain", size_bytes=len(content))
+
+    # When
+    await storage.save_spooled_document(spooled, metadata)
+
+    # Then
+    assert not spooled.path.exists()
+    assert storage.document_path(metadata.id).read_bytes() == content
+    assert (storage.docs_path / str(metadata.id) / "metadata.json").exists()
+
+
+@pytest.mark.asyncio
+async def test_spool_failure_removes_temp_file(tmp_path):
+    # Given
+    storage = FileSystemStorage(base_path=str(tmp_path))
+    async def failing_read(size):
+        raise IOError("client disconnected")
+
+    # When / Then
+    with pytest.raises(IOError):
+        await storage.spool(failing_read, buffer_size=1024)
+    assert list(storage.temp_path.iterdir()) == []
+
+
+@pytest.mark.asyncio
+async def test_spool_stops_past_max_bytes(tmp_path):
+    # Given
+    storage = FileSystemStorage(base_path=str(tmp_path))
+    reader = ChunkedReader(b"x" * 10_000)
+
+    # When / Then
+    with pytest.raises(UploadTooLargeError):
+        await storage.spool(reader.read, buffer_size=1024, max_bytes=4096)
+    assert len(reader.requested) == 5
+    assert list(storage.temp_path.iterdir()) == []
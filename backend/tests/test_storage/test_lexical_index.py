@@ -0,0 +1,158 @@
+import pytest
+from uuid import uuid4
+from storage.lexical_index import LexicalIndex, tokenize
+from storage.storage_interface import ChunkMetadata, ChunkRecord
+
+def make_chunks(doc_id, contents):
+    return [
+        ChunkMetadata(id=uuid4(), document_id=doc_id, sequence=i, content=content)
+        for i, content in enumerate(contents)
+    ]
+
+@pytest.fixture
+def index():
+    return LexicalIndex()
+
+def test_tokenize_keeps_identifiers_and_parts():
+    assert tokenize("See INC-20431, v2.3.1!") == ["see", "inc-20431", "inc", "20431", "v2.3.1", "v2", "3", "1"]
+
+def test_search_finds_exact_identifier(index):
+    # Given
+    doc_id = uuid4()
+    chunks = make_chunks(doc_id, [
+        "The printer on floor two jams on heavy paper.",
+        "Ticket INC-20431 tracks the printer jam on floor two.",
+        "Replace part PX-778 when the fuser overheats."
+    ])
+    index.add_chunks(chunks)
+
+    # When
+    results = index.search("status of inc-20431", limit=2)
+
+    # Then
+    assert results[0][0] == str(chunks[1].id)
+    assert index.search("PX-778")[0][0] == str(chunks[2].id)
+
+def test_rare_terms_outrank_common_ones(index):
+    # Given
+    chunks = make_chunks(uuid4(), [
+        "printer printer printer",
+        "printer fuser",
+        "printer toner"
+    ])
+    index.add_chunks(chunks)
+
+    # When
+    results = index.search("printer fuser")
+
+    # Then
+    assert results[0][0] == str(chunks[1].id)
+    assert len(results) == 3
+
+def test_remove_document(index):
+    # Given
+    kept, removed = uuid4(), uuid4()
+    index.add_chunks(make_chunks(kept, ["alpha beta"]))
+    index.add_chunks(make_chunks(removed, ["alpha gamma", "gamma delta"]))
+
+    # When
+    index.remove_document(removed)
+
+    # Then
+    assert len(index) == 1
+    assert index.search("gamma") == []
+    assert "gamma" not in index.postings
+    assert index.total_length == 2
+
+def test_readding_chunk_replaces_it(index):
+    # Given
+    chunk = make_chunks(uuid4(), ["old words"])[0]
+    index.add_chunks([chunk])
+
+    # When
+    chunk.content = "new words"
+    index.add_chunks([chunk])
+
+    # Then
+    assert index.search("old") == []
+    assert len(index.search("new")) == 1
+    assert len(index) == 1
+
+def test_save_and_load(tmp_path):
+    # Given
+    path = tmp_path / "lexical_index.json"
+    index = LexicalIndex(path)
+    chunks = make_chunks(uuid4(), ["Ticket INC-20431", "unrelated text"])
+    index.add_chunks(chunks)
+
+    # When
+    index.save()
+    loaded = LexicalIndex(path)
+    found = loaded.load()
+
+    # Then
+    assert found
+    assert not index.dirty
+    assert loaded.search("INC-20431") == index.search("INC-20431")
+    assert loaded.chunks[str(chunks[0].id)].document_id == str(chunks[0].document_id)
+
+@pytest.mark.asyncio
+async def test_initialize_rebuilds_without_saved_index(tmp_path):
+    # Given
+    index = LexicalIndex(tmp_path / "missing.json")
+    chunks = make_chunks(uuid4(), ["rebuilt from the database"])
+
+    async def stream():
+        for chunk in chunks:
+            yield chunk.id
+
+    async def load_chunks(chunk_ids):
+        return [ChunkRecord(chunk.id, chunk.document_id, chunk.sequence, chunk.content) for chunk in chunks]
+
+    # When
+    await index.initialize()
+    await index.reconcile(stream(), load_chunks)
+    await index.close()
+
+    # Then
+    assert len(index.search("database")) == 1
+    assert (tmp_path / "missing.json").exists()
+
+@pytest.mark.asyncio
+async def test_initialize_reconciles_saved_index_with_database(tmp_path):
+    # Given a saved index that missed an upload and a delete before the process stopped
+    path = tmp_path / "lexical_index.json"
+    kept = make_chunks(uuid4(), ["kept printer manual"])
+    stale = LexicalIndex(path)
+    stale.add_chunks(kept)
+    stale.add_chunks(make_chunks(uuid4(), ["deleted toner notes"]))
+    stale.save()
+    stored = [ChunkRecord(chunk.id, chunk.document_id, chunk.sequence, chunk.content) for chunk in kept]
+    stored.append(ChunkRecord(uuid4(), uuid4(), 0, "uploaded fuser guide"))
+    loaded = []
+
+    async def stream():
+        for chunk in stored:
+            yield chunk.id
+
+    async def load_chunks(chunk_ids):
+        loaded.extend(chunk_ids)
+        return [chunk for chunk in stored if chunk.id in chunk_ids]
+
+    # When
+    index = LexicalIndex(path)
+    await index.initialize()
+    await index.reconcile(stream(), load_chunks)
+    await index.close()
+    saved = LexicalIndex(path)
+    saved.load()
+
+    # Then
+    assert index.search("toner") == []
+    assert len(index.search("fuser")) == 1
+    assert len(index.search("printer")) == 1
+    assert set(saved.chunks) == {str(chunk.id) for chunk in stored}
+    assert len(saved.document_chunks) == 2
+    # Only the new chunk's content is read
+    assert loaded == [stored[-1].id]
+    assert not list(tmp_path.glob("*.tmp"))
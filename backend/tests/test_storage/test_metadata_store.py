@@ -1,6 +1,8 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4
+from datetime import datetime, timedelta
+from sqlalchemy import select
 from backend.storage.metadata_store import MetadataStore
 from backend.storage.storage_interface import DocumentMetadata, ChunkMetadata
 
@@ -218,3 +220,107 @@ async def test_delete_chunks_no_chunks(mock_sessionmaker, mock_create_engine):
     # Then
     mock_session.execute.assert_called_once()
     mock_session.rollback.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_save_chunks_bulk_insert_in_batches(tmp_path, monkeypatch):
+    # Given
+    import storage.metadata_store as metadata_store_module
+    monkeypatch.setattr(metadata_store_module, "INSERT_BATCH_SIZE", 4)
+    store = metadata_store_module.MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.initialize()
+    doc_id = uuid4()
+    chunks = [
+        ChunkMetadata(id=uuid4(), document_id=doc_id, sequence=i, content=f"chunk {i}", embedding_id=f"e{i}")
+        for i in range(10)
+    ]
+
+    # When
+    with store.metrics.track_request() as request:
+        await store.save_chunks(chunks)
+    stored = [chunk async for chunk in store.stream_chunks()]
+    async with store.session_local() as session:
+        created = list(await session.scalars(select(ChunkMetadata.created_at)))
+    await store.engine.dispose()
+
+    # Then
+    assert request.queries == 3
+    assert sorted(chunk.sequence for chunk in stored) == list(range(10))
+    assert {chunk.id for chunk in stored} == {chunk.id for chunk in chunks}
+    assert all(created_at is not None for created_at in created)
+
+
+@pytest.mark.asyncio
+async def test_chunk_reads_skip_content(tmp_path):
+    # Given
+    store = MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.initialize()
+    doc_id = uuid4()
+    chunks = [
+        ChunkMetadata(id=uuid4(), document_id=doc_id, sequence=i, content=f"chunk {i}", embedding_id=f"e{i}")
+        for i in reversed(range(3))
+    ]
+    await store.save_chunks(chunks)
+
+    # When
+    ids = await store.get_chunk_ids(doc_id)
+    async with store.session_local() as session:
+        loaded = await session.scalar(select(ChunkMetadata).where(ChunkMetadata.sequence == 0))
+    records = [chunk async for chunk in store.stream_chunks()]
+    await store.engine.dispose()
+
+    # Then
+    assert ids == [chunk.id for chunk in reversed(chunks)]
+    # Content is deferred and never lazy loaded
+    assert "content" not in loaded.__dict__
+    with pytest.raises(Exception, match="content"):
+        loaded.content
+    # Comparing an instance loaded without content does not touch it
+    assert loaded == chunks[-1]
+    assert loaded != chunks[0]
+    assert sorted(record.content for record in records) == ["chunk 0", "chunk 1", "chunk 2"]
+
+
+@pytest.mark.asyncio
+async def test_list_documents_keyset_pages_and_chunk_counts(tmp_path):
+    # Given five documents, two pairs sharing a created_at
+    store = MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.migrate()
+    start = datetime(2026, 1, 1)
+    docs = [
+        DocumentMetadata(
+            id=uuid4(),
+            filename=f"doc{i}",
+            mime_type="text/plain" if i % 2 else "application/pdf",
+            size_bytes=1,
+            status="completed" if i < 3 else "pending",
+            created_at=start + timedelta(seconds=i // 2)
+        )
+        for i in range(5)
+    ]
+    for doc in docs:
+        await store.save_document_metadata(doc)
+    await store.save_chunks([
+        ChunkMetadata(id=uuid4(), document_id=docs[1].id, sequence=i, content="chunk") for i in range(3)
+    ])
+
+    # When
+    pages = []
+    after = None
+    while True:
+        page = await store.list_documents(2, after=after)
+        if not page:
+            break
+        pages.append(page)
+        after = (page[-1].created_at, page[-1].id)
+    filtered = await store.list_documents(10, status="completed", mime_type="text/plain")
+    counts = await store.count_chunks([doc.id for doc in docs])
+    await store.engine.dispose()
+
+    # Then
+    listed = [doc.id for page in pages for doc in page]
+    expected = sorted(docs, key=lambda doc: (doc.created_at, str(doc.id)), reverse=True)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert listed == [doc.id for doc in expected]
+    assert [doc.id for doc in filtered] == [docs[1].id]
+    assert counts == {docs[1].id: 3}
@@ -1,11 +1,33 @@
+import asyncio
 import pytest
-from unittest.mock import AsyncMock, patch
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock, Mock, patch
 from uuid import UUID
+from hashlib import sha256
+from sqlalchemy.exc import IntegrityError
 from backend.storage.storage_manager import StorageManager
 from backend.storage.storage_interface import DocumentMetadata, ChunkMetadata
+from backend.storage.file_system_storage import SpooledFile
+from backend.storage.lexical_index import LexicalIndex
+from backend.storage.metadata_store import ClaimLostError, MetadataStore
+from pathlib import Path
+from datetime import datetime, timedelta
 
 STORAGE_MANAGER: str = "backend.storage.storage_manager"
 
+def mock_unit_of_work(mock_metadata_storage):
+    """Make metadata_storage.unit_of_work() yield a mock UnitOfWork"""
+    uow = Mock()
+    uow.save_chunks = AsyncMock(return_value=None)
+    uow.update_document_status = AsyncMock(return_value=None)
+    uow.delete_chunks = AsyncMock(return_value=1)
+    uow.delete_document_metadata = AsyncMock(return_value=None)
+    uow.bump_corpus_version = AsyncMock(return_value=1)
+    mock_metadata_storage.unit_of_work = MagicMock()
+    mock_metadata_storage.unit_of_work.return_value.__aenter__.return_value = uow
+    mock_metadata_storage.unit_of_work.return_value.__aexit__.return_value = False
+    return uow
+
 @pytest.fixture
 def setup_storage_manager():
     
@@ -43,6 +65,7 @@ async def test_save_document(mock_uuid, mock_mime, setup_storage_manager):
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
     mock_file_storage.save_document = AsyncMock(return_value=doc_id)
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=None)
     mock_metadata_storage.save_document_metadata = AsyncMock(return_value=doc_id)
 
     # When    
@@ -71,10 +94,126 @@ async def test_save_document_failure(mock_mime, setup_storage_manager):
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
     mock_file_storage.save_document = AsyncMock(side_effect=Exception("Save failed"))
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=None)
+    mock_metadata_storage.save_document_metadata = AsyncMock()
+    mock_metadata_storage.delete_document_metadata = AsyncMock()
     
     # When / Then
     with pytest.raises(Exception):
         await storage_manager.save_document(content, filename)
+    mock_metadata_storage.delete_document_metadata.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_save_duplicate_document(setup_storage_manager):
+    # Given
+    content = b"test content"
+    existing = DocumentMetadata(id=UUID("12345678-1234-5678-1234-567812345678"), filename="first.pdf", mime_type="application/pdf", size_bytes=len(content))
+
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=existing)
+    mock_metadata_storage.save_document_metadata = AsyncMock()
+    mock_file_storage.save_document = AsyncMock()
+
+    # When
+    doc_id, created = await storage_manager.save_or_get_document(content, "second.pdf")
+
+    # Then
+    assert doc_id == existing.id
+    assert created is False
+    mock_metadata_storage.get_document_by_hash.assert_called_once_with(sha256(content).hexdigest())
+    mock_metadata_storage.save_document_metadata.assert_not_called()
+    mock_file_storage.save_document.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("magic.Magic.from_buffer")
+async def test_save_duplicate_document_concurrent_upload(mock_mime, setup_storage_manager):
+    # Given
+    content = b"test content"
+    existing = DocumentMetadata(id=UUID("12345678-1234-5678-1234-567812345678"), filename="first.pdf", mime_type="application/pdf", size_bytes=len(content))
+    mock_mime.return_value = "application/pdf"
+
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+
+    mock_metadata_storage.get_document_by_hash = AsyncMock(side_effect=[None, existing])
+    mock_metadata_storage.save_document_metadata = AsyncMock(side_effect=IntegrityError("INSERT", {}, Exception("duplicate key")))
+    mock_file_storage.save_document = AsyncMock()
+
+    # When
+    doc_id, created = await storage_manager.save_or_get_document(content, "second.pdf")
+
+    # Then
+    assert doc_id == existing.id
+    assert created is False
+    mock_file_storage.save_document.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("magic.Magic.from_buffer")
+async def test_save_spooled_document(mock_mime, setup_storage_manager):
+    # Given
+    spooled = SpooledFile(path=Path("/tmp/upload"), size_bytes=4096, content_hash="abc", head=b"%PDF-1.7")
+    mock_mime.return_value = "application/pdf"
+
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=None)
+    mock_metadata_storage.save_document_metadata = AsyncMock()
+    mock_file_storage.save_spooled_document = AsyncMock()
+
+    # When
+    doc_id, created = await storage_manager.save_or_get_spooled_document(spooled, "test.pdf")
+
+    # Then
+    assert created is True
+    mock_mime.assert_called_once_with(b"%PDF-1.7")
+    metadata = mock_file_storage.save_spooled_document.call_args.args[1]
+    assert metadata.id == doc_id
+    assert metadata.size_bytes == 4096
+    assert metadata.content_hash == "abc"
+    mock_file_storage.discard_spooled.assert_called_once_with(spooled)
+
+
+@pytest.mark.asyncio
+async def test_save_duplicate_spooled_document(setup_storage_manager):
+    # Given
+    spooled = SpooledFile(path=Path("/tmp/upload"), size_bytes=4096, content_hash="abc", head=b"%PDF-1.7")
+    existing = DocumentMetadata(id=UUID("12345678-1234-5678-1234-567812345678"), filename="first.pdf", mime_type="application/pdf", size_bytes=4096, status="completed")
+
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=existing)
+    mock_file_storage.save_spooled_document = AsyncMock()
+
+    # When
+    doc_id, created = await storage_manager.save_or_get_spooled_document(spooled, "second.pdf")
+
+    # Then
+    assert (doc_id, created) == (existing.id, False)
+    mock_file_storage.save_spooled_document.assert_not_called()
+    mock_file_storage.discard_spooled.assert_called_once_with(spooled)
+
+
+@pytest.mark.asyncio
+async def test_duplicate_restores_file_of_unfinished_document(setup_storage_manager, tmp_path):
+    # Given a document whose process stopped after claiming the content, before saving the file
+    spooled = SpooledFile(path=Path("/tmp/upload"), size_bytes=4096, content_hash="abc", head=b"%PDF-1.7")
+    existing = DocumentMetadata(id=UUID("12345678-1234-5678-1234-567812345678"), filename="first.pdf", mime_type="application/pdf", size_bytes=4096, status="pending")
+
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+
+    mock_metadata_storage.get_document_by_hash = AsyncMock(return_value=existing)
+    mock_file_storage.document_path = Mock(return_value=tmp_path / "missing" / "original")
+    mock_file_storage.save_spooled_document = AsyncMock()
+
+    # When
+    doc_id, created = await storage_manager.save_or_get_spooled_document(spooled, "second.pdf")
+
+    # Then
+    assert (doc_id, created) == (existing.id, False)
+    mock_file_storage.save_spooled_document.assert_called_once_with(spooled, existing)
 
 
 @pytest.mark.asyncio
@@ -86,18 +225,21 @@ async def test_save_processed_chunks(setup_storage_manager):
     
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
-    mock_metadata_storage.save_chunks = AsyncMock(return_value=None)
+    uow = mock_unit_of_work(mock_metadata_storage)
     mock_vector_storage.add_chunks = AsyncMock(return_value=None)
-    mock_metadata_storage.update_document_status = AsyncMock(return_value=None)
+    mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
     
     # When
     await storage_manager.save_processed_chunks(doc_id, chunks, embeddings)
     
     # Then
-    mock_metadata_storage.save_chunks.assert_called_once_with(chunks)
+    mock_metadata_storage.unit_of_work.assert_called_once()
+    uow.delete_chunks.assert_called_once_with(doc_id)
+    mock_vector_storage.delete_chunks.assert_called_once_with(doc_id)
+    uow.save_chunks.assert_called_once_with(chunks)
     mock_vector_storage.add_chunks.assert_called_once_with(chunks, embeddings)
-    mock_metadata_storage.update_document_status.assert_called_with(doc_id, "processed")
-    mock_metadata_storage.update_document_status.call_count == 2
+    uow.update_document_status.assert_called_once_with(doc_id, "completed")
+    assert storage_manager.corpus_version == 1
 
 
 @pytest.mark.asyncio
@@ -109,11 +251,16 @@ async def test_save_processed_chunks_failure(setup_storage_manager):
     
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
-    mock_metadata_storage.save_chunks = AsyncMock(side_effect=Exception("Save chunks failed"))
+    uow = mock_unit_of_work(mock_metadata_storage)
+    uow.save_chunks.side_effect = Exception("Save chunks failed")
+    mock_vector_storage.add_chunks = AsyncMock(return_value=None)
+    mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
     
     # When / Then
     with pytest.raises(Exception):
         await storage_manager.save_processed_chunks(doc_id, chunks, embeddings)
+    uow.update_document_status.assert_not_called()
+    assert storage_manager.corpus_version == 0
 
 
 @pytest.mark.asyncio
@@ -123,19 +270,19 @@ async def test_delete_document(setup_storage_manager):
     
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
+    uow = mock_unit_of_work(mock_metadata_storage)
     mock_file_storage.delete_document = AsyncMock(return_value=True)
-    mock_metadata_storage.delete_document_metadata = AsyncMock(return_value=None)
-    mock_metadata_storage.delete_chunks = AsyncMock(return_value=None)
     mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
     
     # When
     file_deleted = await storage_manager.delete_document(doc_id)
     
     # Then
-    mock_file_storage.delete_document.assert_called_once_with(doc_id)
-    mock_metadata_storage.delete_document_metadata.assert_called_once_with(doc_id)
-    mock_metadata_storage.delete_chunks.assert_called_once_with(doc_id)
+    mock_metadata_storage.unit_of_work.assert_called_once()
+    uow.delete_chunks.assert_called_once_with(doc_id)
+    uow.delete_document_metadata.assert_called_once_with(doc_id)
     mock_vector_storage.delete_chunks.assert_called_once_with(doc_id)
+    mock_file_storage.delete_document.assert_called_once_with(doc_id)
     assert file_deleted is True
 
 
@@ -146,8 +293,254 @@ async def test_delete_document_failure(setup_storage_manager):
     
     storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
 
-    mock_file_storage.delete_document = AsyncMock(side_effect=Exception("Delete failed"))
+    uow = mock_unit_of_work(mock_metadata_storage)
+    uow.delete_document_metadata.side_effect = ValueError("Document not found")
+    mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
+    mock_file_storage.delete_document = AsyncMock(return_value=True)
     
     # When / Then
     with pytest.raises(Exception):
         await storage_manager.delete_document(doc_id)
+    mock_vector_storage.delete_chunks.assert_not_called()
+    mock_file_storage.delete_document.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_lexical_index_follows_saves_and_deletes(setup_storage_manager):
+    # Given
+    doc_id = UUID("12345678-1234-5678-1234-567812345678")
+    chunks = [ChunkMetadata(id=UUID("12345678-1234-5678-1234-567812345679"), document_id=doc_id, sequence=0, content="ticket INC-20431", embedding_id="abc")]
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+    storage_manager.lexical = LexicalIndex()
+
+    mock_unit_of_work(mock_metadata_storage)
+    mock_vector_storage.add_chunks = AsyncMock(return_value=None)
+    mock_file_storage.delete_document = AsyncMock(return_value=True)
+    mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
+
+    # When
+    await storage_manager.save_processed_chunks(doc_id, chunks, [[0.1, 0.2, 0.3]])
+    found = storage_manager.lexical.search("INC-20431")
+    await storage_manager.delete_document(doc_id)
+
+    # Then
+    assert found[0][0] == str(chunks[0].id)
+    assert storage_manager.lexical.search("INC-20431") == []
+
+
+@pytest.mark.asyncio
+async def test_reprocessing_replaces_chunks(setup_storage_manager):
+    # Given a document stored again by a second run, after a restart
+    doc_id = UUID("12345678-1234-5678-1234-567812345678")
+    first = [ChunkMetadata(id=UUID(int=1), document_id=doc_id, sequence=0, content="first run")]
+    second = [ChunkMetadata(id=UUID(int=2), document_id=doc_id, sequence=0, content="second run")]
+    storage_manager, mock_file_storage, mock_vector_storage, mock_metadata_storage = setup_storage_manager
+    storage_manager.lexical = LexicalIndex()
+    uow = mock_unit_of_work(mock_metadata_storage)
+    mock_vector_storage.add_chunks = AsyncMock(return_value=None)
+    mock_vector_storage.delete_chunks = AsyncMock(return_value=None)
+
+    # When
+    await storage_manager.save_processed_chunks(doc_id, first, [[0.1]])
+    await storage_manager.save_processed_chunks(doc_id, second, [[0.1]])
+
+    # Then
+    assert uow.delete_chunks.call_count == 2
+    assert storage_manager.lexical.search("first") == []
+    assert len(storage_manager.lexical) == 1
+
+
+@pytest_asyncio.fixture
+async def metadata_store(tmp_path):
+    store = MetadataStore(db_url=f"sqlite+aiosqlite:///{tmp_path / 'metadata.db'}")
+    await store.initialize()
+    yield store
+    await store.engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_failed_vector_write_rolls_back_chunks_and_status(metadata_store):
+    # Given
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1, status="extracting"
+    ))
+    vectors = Mock()
+    vectors.delete_chunks = AsyncMock(return_value=None)
+    vectors.add_chunks = AsyncMock(side_effect=Exception("Vector store down"))
+    storage_manager = StorageManager(Mock(), vectors, metadata_store)
+    chunks = [ChunkMetadata(id=UUID(int=i + 1), document_id=doc_id, sequence=i, content=f"chunk {i}") for i in range(3)]
+
+    # When
+    with pytest.raises(Exception, match="Vector store down"):
+        await storage_manager.save_processed_chunks(doc_id, chunks, [[0.1]] * 3)
+
+    # Then
+    doc = await metadata_store.get_document_metadata(doc_id)
+    assert doc.status == "extracting"
+    with pytest.raises(ValueError):
+        await metadata_store.delete_chunks(doc_id)
+
+
+@pytest.mark.asyncio
+async def test_save_processed_chunks_commits_once(metadata_store):
+    # Given
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1, status="extracting"
+    ))
+    vectors = Mock()
+    vectors.delete_chunks = AsyncMock(return_value=None)
+    vectors.add_chunks = AsyncMock(return_value=None)
+    storage_manager = StorageManager(Mock(), vectors, metadata_store)
+    chunks = [ChunkMetadata(id=UUID(int=i + 1), document_id=doc_id, sequence=i, content=f"chunk {i}") for i in range(3)]
+    commits = metadata_store.metrics.checkouts
+
+    # When
+    await storage_manager.save_processed_chunks(doc_id, chunks, [[0.1]] * 3)
+
+    # Then
+    assert metadata_store.metrics.checkouts - commits == 1
+    assert (await metadata_store.get_document_metadata(doc_id)).status == "completed"
+
+
+@pytest.mark.asyncio
+async def test_get_stale_document_ids(metadata_store):
+    # Given
+    now = datetime.now()
+    ids = [UUID(f"a{i}345678-1234-5678-1234-567812345678") for i in range(6)]
+    documents = [
+        ("completed", datetime(2026, 1, 1), None),
+        ("embedding", datetime(2026, 1, 2), now - timedelta(seconds=1)),  # its worker stopped
+        ("failed", datetime(2026, 1, 3), None),
+        ("pending", datetime(2026, 1, 4), None),  # its queue was lost
+        ("embedding", datetime(2026, 1, 5), now + timedelta(seconds=60)),  # being processed
+        ("pending", now, None),  # just uploaded, queued somewhere
+    ]
+    for i, (status, created_at, claim_expires_at) in enumerate(documents):
+        await metadata_store.save_document_metadata(DocumentMetadata(
+            id=ids[i], filename=f"{i}.txt", mime_type="text/plain", size_bytes=1,
+            status=status, created_at=created_at, claim_expires_at=claim_expires_at
+        ))
+    storage_manager = StorageManager(Mock(), Mock(), metadata_store, claim_lease=60)
+
+    # When
+    stale = await storage_manager.get_stale_document_ids()
+    loaded = [await metadata_store.get_document_metadata(doc_id) for doc_id in ids]
+
+    # Then
+    assert stale == [ids[1], ids[3]]
+    assert [storage_manager.is_stale(doc) for doc in loaded] == [False, True, False, True, False, False]
+
+
+@pytest.mark.asyncio
+async def test_document_is_claimed_by_one_worker_at_a_time(metadata_store):
+    # Given
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1
+    ))
+    first = StorageManager(Mock(), Mock(), metadata_store, claim_lease=60)
+    second = StorageManager(Mock(), Mock(), metadata_store, claim_lease=60)
+
+    # When
+    claims = await asyncio.gather(first.claim_document(doc_id), second.claim_document(doc_id))
+
+    # Then
+    assert sum(claim is not None for claim in claims) == 1
+    assert (await metadata_store.get_document_metadata(doc_id)).status == "extracting"
+
+
+@pytest.mark.asyncio
+async def test_expired_claim_is_taken_over(metadata_store):
+    # Given a worker whose lease ran out mid-pipeline
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1
+    ))
+    vectors = Mock()
+    vectors.delete_chunks = AsyncMock(return_value=None)
+    vectors.add_chunks = AsyncMock(return_value=None)
+    stalled = StorageManager(Mock(), vectors, metadata_store, claim_lease=0)
+    other = StorageManager(Mock(), vectors, metadata_store, claim_lease=60)
+    stalled_claim = await stalled.claim_document(doc_id)
+    chunks = [ChunkMetadata(
+        id=UUID(f"b{i}345678-1234-5678-1234-567812345678"), document_id=doc_id, sequence=i, content=f"chunk {i}"
+    ) for i in range(2)]
+
+    # When
+    other_claim = await other.claim_document(doc_id)
+    with pytest.raises(ClaimLostError):
+        await stalled.save_processed_chunks(doc_id, chunks[:1], [[0.1]], stalled_claim)
+    renewed = await stalled.renew_claim(doc_id, stalled_claim)
+    failed = await stalled.fail_document(doc_id, stalled_claim)
+    await other.save_processed_chunks(doc_id, chunks, [[0.1]] * 2, other_claim)
+
+    # Then the stalled worker wrote nothing and the other one's result stands
+    assert other_claim is not None
+    assert not renewed
+    assert not failed
+    assert vectors.add_chunks.await_count == 1
+    doc = await metadata_store.get_document_metadata(doc_id)
+    assert (doc.status, doc.claim_id) == ("completed", None)
+    assert await metadata_store.get_chunk_ids(doc_id) == [chunk.id for chunk in chunks]
+    assert await other.claim_document(doc_id) is None
+
+
+@pytest.mark.asyncio
+async def test_corpus_version_is_shared_between_workers(metadata_store):
+    # Given two workers on one database
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1, status="embedding"
+    ))
+    vectors = Mock()
+    vectors.delete_chunks = AsyncMock(return_value=None)
+    vectors.add_chunks = AsyncMock(return_value=None)
+    uploading = StorageManager(Mock(), vectors, metadata_store)
+    other = StorageManager(Mock(), vectors, metadata_store, corpus_version_refresh=0)
+    cached = StorageManager(Mock(), vectors, metadata_store, corpus_version_refresh=3600)
+    before = (await other.get_corpus_version(), await cached.get_corpus_version())
+    chunks = [ChunkMetadata(id=UUID(int=i + 1), document_id=doc_id, sequence=i, content=f"chunk {i}") for i in range(2)]
+
+    # When
+    await uploading.save_processed_chunks(doc_id, chunks, [[0.1]] * 2)
+
+    # Then
+    assert before == (0, 0)
+    assert uploading.corpus_version == 1
+    assert await other.get_corpus_version() == 1
+    # Re-read once the refresh interval is over
+    assert await cached.get_corpus_version() == 0
+
+
+@pytest.mark.asyncio
+async def test_lexical_index_follows_other_workers(metadata_store):
+    # Given two workers on one database, each with its own lexical index
+    doc_id = UUID("a2345678-1234-5678-1234-567812345678")
+    await metadata_store.save_document_metadata(DocumentMetadata(
+        id=doc_id, filename="a.txt", mime_type="text/plain", size_bytes=1, status="embedding"
+    ))
+    vectors = Mock()
+    vectors.delete_chunks = AsyncMock(return_value=None)
+    vectors.add_chunks = AsyncMock(return_value=None)
+    files = Mock()
+    files.delete_document = AsyncMock(return_value=True)
+    uploading = StorageManager(files, vectors, metadata_store, lexical_index=LexicalIndex())
+    other = StorageManager(files, vectors, metadata_store, lexical_index=LexicalIndex(), corpus_version_refresh=0)
+    await other.reconcile_lexical_index()
+    chunks = [ChunkMetadata(
+        id=UUID(f"b{i}345678-1234-5678-1234-567812345678"), document_id=doc_id, sequence=i, content=f"ticket INC-2043{i}"
+    ) for i in range(2)]
+
+    # When
+    await uploading.save_processed_chunks(doc_id, chunks, [[0.1]] * 2)
+    await other.get_corpus_version()
+    found = other.lexical.search("INC-20431")
+    await uploading.delete_document(doc_id)
+    await other.get_corpus_version()
+
+    # Then
+    assert found[0][0] == str(chunks[1].id)
+    assert len(other.lexical) == 0
+    assert len(uploading.lexical) == 0
@@ -1,5 +1,8 @@
+import asyncio
+import threading
 import pytest
-from unittest.mock import AsyncMock, patch
+import numpy as np
+from unittest.mock import AsyncMock, MagicMock, patch
 from uuid import uuid4, UUID
 from backend.storage.vector_storage import VectorStorage
 from backend.storage.storage_interface import ChunkMetadata
@@ -21,7 +24,7 @@ async def test_add_chunks(mock_settings, mock_client):
     chunks = [chunk]
     embeddings = [[0.1, 0.2, 0.3]]
     
-    mock_collection = AsyncMock()
+    mock_collection = MagicMock()
     mock_client.return_value.get_or_create_collection.return_value = mock_collection
     
     vector_storage = VectorStorage(persist_dir="test_dir")
@@ -30,15 +33,57 @@ async def test_add_chunks(mock_settings, mock_client):
     await vector_storage.add_chunks(chunks, embeddings)
     
     # Then
-    mock_collection.add.assert_called_once_with(
-        ids=[str(chunk_id)],
-        embeddings=embeddings,
-        metadatas=[{
-            "document_id": str(doc_id),
-            "sequence": chunk.sequence
-        }],
-        documents=[chunk.content]
-    )
+    mock_collection.upsert.assert_called_once()
+    call = mock_collection.upsert.call_args.kwargs
+    assert call["ids"] == [str(chunk_id)]
+    assert call["metadatas"] == [{
+        "document_id": str(doc_id),
+        "sequence": chunk.sequence
+    }]
+    assert call["documents"] == [chunk.content]
+    assert call["embeddings"].dtype == np.float32
+    np.testing.assert_allclose(call["embeddings"], embeddings)
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_add_chunks_in_batches(mock_settings, mock_client):
+    # Given
+    doc_id = uuid4()
+    chunks = [
+        ChunkMetadata(id=uuid4(), document_id=doc_id, sequence=i, content=f"Chunk {i}")
+        for i in range(5)
+    ]
+    embeddings = [[float(i), 0.0] for i in range(5)]
+
+    mock_collection = MagicMock()
+    mock_client.return_value.get_or_create_collection.return_value = mock_collection
+    mock_client.return_value.get_max_batch_size.return_value = 2
+
+    vector_storage = VectorStorage(persist_dir="test_dir")
+
+    # When
+    await vector_storage.add_chunks(chunks, embeddings)
+
+    # Then
+    batches = [call.kwargs for call in mock_collection.upsert.call_args_list]
+    assert [len(batch["ids"]) for batch in batches] == [2, 2, 1]
+    assert [id for batch in batches for id in batch["ids"]] == [str(chunk.id) for chunk in chunks]
+    assert batches[2]["embeddings"][0][0] == 4.0
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_add_chunks_embedding_count_mismatch(mock_settings, mock_client):
+    # Given
+    chunks = [ChunkMetadata(id=uuid4(), document_id=uuid4(), sequence=i, content="Chunk") for i in range(2)]
+    mock_client.return_value.get_or_create_collection.return_value = MagicMock()
+
+    vector_storage = VectorStorage(persist_dir="test_dir")
+
+    # When / Then
+    with pytest.raises(ValueError):
+        await vector_storage.add_chunks(chunks, [[0.1, 0.2]])
 
 @pytest.mark.asyncio
 @patch("backend.storage.vector_storage.Client")
@@ -48,18 +93,20 @@ async def test_search(mock_settings, mock_client):
     query_embedding = [0.1, 0.2, 0.3]
     limit = 5
 
-    mock_collection = AsyncMock()
+    mock_collection = MagicMock()
     mock_client.return_value.get_or_create_collection.return_value = mock_collection
     
-    mock_collection.query.return_value = [
-        {"id": "123", "metadata": {"document_id": "doc_id_1", "sequence": 0}, "document": "Chunk 1"},
-        {"id": "124", "metadata": {"document_id": "doc_id_2", "sequence": 1}, "document": "Chunk 2"}
-    ]
+    mock_collection.query.return_value = {
+        "ids": [["123", "124"]],
+        "metadatas": [[{"document_id": "doc_id_1", "sequence": 0}, {"document_id": "doc_id_2", "sequence": 1}]],
+        "documents": [["Chunk 1", "Chunk 2"]],
+        "distances": [[0.1, 0.2]]
+    }
     
     vector_storage = VectorStorage(persist_dir="test_dir")
     
     # When
-    results = await (await vector_storage.search(query_embedding, limit))
+    results = await vector_storage.search(query_embedding, limit)
     
     # Then
     mock_collection.query.assert_called_once_with(
@@ -67,51 +114,78 @@ async def test_search(mock_settings, mock_client):
         n_results=limit,
         include=["metadatas", "documents", "distances"]
     )
-    
-    # Make sure the results are correct after awaiting
-    assert len(results) == 2
-    assert results[0]["id"] == "123"
-    assert results[1]["id"] == "124"
+    assert results["ids"][0] == ["123", "124"]
+    assert vector_storage.stats()["completed"] == 1
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_search_runs_off_event_loop(mock_settings, mock_client):
+    # Given
+    loop_thread = threading.get_ident()
+    query_threads = []
+
+    mock_collection = MagicMock()
+    mock_collection.query.side_effect = lambda **kwargs: query_threads.append(threading.get_ident())
+    mock_client.return_value.get_or_create_collection.return_value = mock_collection
+
+    vector_storage = VectorStorage(persist_dir="test_dir")
+
+    # When
+    await vector_storage.search([0.1], 1)
+
+    # Then
+    assert query_threads and query_threads[0] != loop_thread
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_concurrency_limit_and_cancellation(mock_settings, mock_client):
+    # Given
+    release = threading.Event()
+    mock_collection = MagicMock()
+    mock_collection.query.side_effect = lambda **kwargs: release.wait(5)
+    mock_client.return_value.get_or_create_collection.return_value = mock_collection
+
+    vector_storage = VectorStorage(persist_dir="test_dir", max_workers=1)
+
+    # When
+    running = asyncio.create_task(vector_storage.search([0.1], 1))
+    queued = asyncio.create_task(vector_storage.search([0.2], 1))
+    await asyncio.sleep(0.05)
+    stats = vector_storage.stats()
+    queued.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    await running
+
+    # Then
+    assert stats["running"] == 1
+    assert stats["waiting"] == 1
+    assert queued.cancelled()
+    # The cancelled search never reached Chroma
+    assert mock_collection.query.call_count == 1
+    assert vector_storage.stats() == {
+        "workers": 1, "waiting": 0, "running": 0, "completed": 1, "cancelled": 1
+    }
 
 @pytest.mark.asyncio
 @patch("backend.storage.vector_storage.Client")
 @patch("backend.storage.vector_storage.Settings")
 async def test_delete_chunks(mock_settings, mock_client):
     # Given
-    doc_id_1 = uuid4()
-    chunk_id_1 = uuid4()
-    
-    chunk_1 = ChunkMetadata(
-        id=doc_id_1,
-        document_id=chunk_id_1,
-        sequence=0,
-        content="Test chunk",
-        embedding_id=str(chunk_id_1)
-    )
-    
-    doc_id_2 = uuid4()
-    chunk_id_2 = uuid4()
-    
-    chunk_2 = ChunkMetadata(
-        id=doc_id_2,
-        document_id=chunk_id_2,
-        sequence=0,
-        content="Test chunk",
-        embedding_id=str(chunk_id_2)
-    )
+    doc_id = uuid4()
 
-    mock_collection = AsyncMock()
-    mock_collection.delete = AsyncMock()
+    mock_collection = MagicMock()
     mock_client.return_value.get_or_create_collection.return_value = mock_collection
     
     vector_storage = VectorStorage(persist_dir="test_dir")
-    vector_storage.get_chunks_by_document_id = AsyncMock(return_value=[chunk_1])
     
     # When
-    await vector_storage.delete_chunks(doc_id_1)
+    await vector_storage.delete_chunks(doc_id)
     
     # Then
-    mock_collection.delete.assert_called_once_with(ids=[str(chunk_1.id)])
+    mock_collection.delete.assert_called_once_with(where={"document_id": str(doc_id)})
 
 @pytest.mark.asyncio
 @patch("backend.storage.vector_storage.Client")
@@ -122,12 +196,13 @@ async def test_get_chunks_by_document_id(mock_settings, mock_client):
     chunk_id_1 = uuid4()
     chunk_id_2 = uuid4()
     
-    mock_collection = AsyncMock()
+    mock_collection = MagicMock()
     mock_client.return_value.get_or_create_collection.return_value = mock_collection
-    mock_collection.query.return_value = [
-        {"id": str(chunk_id_1), "metadata": {"document_id": str(doc_id), "sequence": 0}, "document": "Chunk 1"},
-        {"id": str(chunk_id_2), "metadata": {"document_id": str(doc_id), "sequence": 1}, "document": "Chunk 2"}
-    ]
+    mock_collection.get.return_value = {
+        "ids": [str(chunk_id_1), str(chunk_id_2)],
+        "metadatas": [{"document_id": str(doc_id), "sequence": 0}, {"document_id": str(doc_id), "sequence": 1}],
+        "documents": ["Chunk 1", "Chunk 2"]
+    }
     
     vector_storage = VectorStorage(persist_dir="test_dir")
     
@@ -135,11 +210,54 @@ async def test_get_chunks_by_document_id(mock_settings, mock_client):
     chunks = await vector_storage.get_chunks_by_document_id(doc_id)
     
     # Then
-    mock_collection.query.assert_called_once_with(
-        query_filter={"document_id": str(doc_id)},
+    mock_collection.get.assert_called_once_with(
+        where={"document_id": str(doc_id)},
         include=["metadatas", "documents"]
     )
     assert len(chunks) == 2
     assert chunks[0].id == chunk_id_1
     assert chunks[1].id == chunk_id_2
     assert chunks[0].content == "Chunk 1"
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_get_chunk_ids_reads_ids_only(mock_settings, mock_client):
+    # Given
+    doc_id = uuid4()
+    mock_collection = MagicMock()
+    mock_client.return_value.get_or_create_collection.return_value = mock_collection
+    mock_collection.get.return_value = {"ids": ["a", "b"], "metadatas": None, "documents": None}
+
+    vector_storage = VectorStorage(persist_dir="test_dir")
+
+    # When
+    ids = await vector_storage.get_chunk_ids(doc_id)
+
+    # Then
+    mock_collection.get.assert_called_once_with(where={"document_id": str(doc_id)}, include=[])
+    assert ids == ["a", "b"]
+
+@pytest.mark.asyncio
+@patch("backend.storage.vector_storage.Client")
+@patch("backend.storage.vector_storage.Settings")
+async def test_search_without_documents_then_get_contents(mock_settings, mock_client):
+    # Given
+    mock_collection = MagicMock()
+    mock_client.return_value.get_or_create_collection.return_value = mock_collection
+    mock_collection.get.return_value = {"ids": ["b", "a"], "documents": ["Chunk B", "Chunk A"]}
+
+    vector_storage = VectorStorage(persist_dir="test_dir")
+
+    # When
+    await vector_storage.search([0.1], 20, include_documents=False)
+    contents = await vector_storage.get_contents(["a", "b"])
+
+    # Then
+    mock_collection.query.assert_called_once_with(
+        query_embeddings=[[0.1]],
+        n_results=20,
+        include=["metadatas", "distances"]
+    )
+    mock_collection.get.assert_called_once_with(ids=["a", "b"], include=["documents"])
+    assert contents == {"a": "Chunk A", "b": "Chunk B"}